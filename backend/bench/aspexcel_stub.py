@@ -0,0 +1,120 @@
+"""
+Local stand-in for the nVent configurator endpoint aspExcel.asp.
+
+Chạy từ thư mục backend:
+    python bench/aspexcel_stub.py --port 8090 --latency-ms 150 --jitter-ms 100 --error-rate 0.02
+    JWT_SECRET=<secret> ASPEXCEL_URL=http://127.0.0.1:8090/eriflex/admin/aspExcel/aspExcel.asp python main.py
+
+Like the real service it takes the parameters (W, T, B, Angle, a, Icc, Force,
+NbrePhase) in the query string of a POST and answers with L as plain text.
+Requests with Force above --force-threshold get HTTP 500, and --error-rate
+of the other requests fail with HTTP 503. L is a deterministic function of
+the parameters, so repeated calls return the same value.
+"""
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+REQUIRED = ("W", "T", "B", "Angle", "a", "Icc", "Force", "NbrePhase")
+
+
+def compute_L(p: dict) -> int:
+	"""Giá trị L giả lập: tăng theo tiết diện và Force, giảm theo Icc."""
+	section = p["W"] * p["T"] * max(p["B"], 1)
+	L = 150 + section / 10 + p["Force"] / 50 - p["Icc"] * 3 + p["a"] / 2 + (p["Angle"] % 90)
+	return max(100, int(L))
+
+
+class _Stats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.counts = {}
+
+	def add(self, status: int) -> None:
+		with self.lock:
+			self.counts[status] = self.counts.get(status, 0) + 1
+
+
+def make_handler(args, stats: _Stats):
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"
+
+		def _reply(self, status: int, body: str) -> None:
+			data = body.encode()
+			self.send_response(status)
+			self.send_header("Content-Type", "text/plain; charset=utf-8")
+			self.send_header("Content-Length", str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+			stats.add(status)
+
+		def _handle(self) -> None:
+			url = urlparse(self.path)
+			if not url.path.lower().endswith("aspexcel.asp"):
+				self._reply(404, "not found")
+				return
+			# nhận tham số từ query string và (nếu có) form body
+			query = parse_qs(url.query)
+			length = int(self.headers.get("Content-Length") or 0)
+			if length:
+				query.update(parse_qs(self.rfile.read(length).decode()))
+			try:
+				params = {k: int(float(query[k][0])) for k in REQUIRED}
+			except (KeyError, ValueError):
+				self._reply(400, "missing parameters")
+				return
+
+			delay = args.latency_ms + random.uniform(-args.jitter_ms, args.jitter_ms)
+			if delay > 0:
+				time.sleep(delay / 1000)
+			if params["Force"] > args.force_threshold:
+				self._reply(500, "Force out of range")
+			elif random.random() < args.error_rate:
+				self._reply(503, "Service Unavailable")
+			else:
+				self._reply(200, str(compute_L(params)))
+
+		do_POST = _handle
+		do_GET = _handle
+
+		def log_message(self, fmt, *a):  # im lặng, chỉ in thống kê định kỳ
+			pass
+
+	return Handler
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8090)
+	parser.add_argument("--latency-ms", type=float, default=100.0)
+	parser.add_argument("--jitter-ms", type=float, default=50.0)
+	parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+	parser.add_argument("--force-threshold", type=int, default=20000, help="Force above this returns 500")
+	parser.add_argument("--stats-every", type=float, default=10.0, help="seconds between stats lines (0 = off)")
+	args = parser.parse_args()
+
+	stats = _Stats()
+	server = ThreadingHTTPServer((args.host, args.port), make_handler(args, stats))
+	server.daemon_threads = True
+	print(f"ASPExcel stub on http://{args.host}:{args.port}/eriflex/admin/aspExcel/aspExcel.asp")
+	if args.stats_every > 0:
+		def report():
+			while True:
+				time.sleep(args.stats_every)
+				with stats.lock:
+					print(f"[stub] responses by status: {dict(sorted(stats.counts.items()))}", flush=True)
+		threading.Thread(target=report, daemon=True).start()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == "__main__":
+	main()
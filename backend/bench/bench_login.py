@@ -0,0 +1,52 @@
+"""
+Login throughput vs. password hashing pool size.
+
+Chạy từ thư mục backend:
+    python bench/bench_login.py --logins 64 --concurrency 16 --pools 0,1,2,4,8
+
+Each "login" is one bcrypt verify issued from a request-like thread, the
+same path authenticate_user takes. Pool size 0 means inline hashing in the
+calling thread (the old behaviour).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.password_service import PasswordHasher, BCRYPT_ROUNDS  # noqa: E402
+
+
+def run(pool_size: int, logins: int, concurrency: int, rounds: int) -> float:
+	hasher = PasswordHasher(rounds=rounds, workers=pool_size, queue_size=max(concurrency, 1), queue_timeout=60)
+	hasher.start()
+	pw_hash = hasher.hash("benchmark-password")
+	# warm-up: khởi động đủ các worker process trước khi đo
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		list(pool.map(lambda _: hasher.verify("benchmark-password", pw_hash), range(max(pool_size, 1))))
+		start = time.perf_counter()
+		results = list(pool.map(lambda _: hasher.verify("benchmark-password", pw_hash), range(logins)))
+		elapsed = time.perf_counter() - start
+	hasher.shutdown()
+	assert all(results)
+	return logins / elapsed
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--logins", type=int, default=64)
+	parser.add_argument("--concurrency", type=int, default=16)
+	parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS)
+	parser.add_argument("--pools", default="0,1,2,4,8", help="comma separated pool sizes")
+	args = parser.parse_args()
+
+	print(f"bcrypt rounds={args.rounds} logins={args.logins} concurrency={args.concurrency}")
+	print(f"{'pool':>6} {'logins/s':>10}")
+	for size in (int(x) for x in args.pools.split(",")):
+		print(f"{size:>6} {run(size, args.logins, args.concurrency, args.rounds):>10.1f}")
+
+
+if __name__ == "__main__":
+	main()
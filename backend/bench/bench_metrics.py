@@ -0,0 +1,66 @@
+"""
+Overhead of the metrics registry and of MetricsMiddleware.
+
+Chạy từ thư mục backend:
+    python bench/bench_metrics.py --n 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry, MetricsMiddleware  # noqa: E402
+
+
+def per_call_ns(fn, n: int) -> float:
+	start = time.perf_counter()
+	for _ in range(n):
+		fn()
+	return (time.perf_counter() - start) / n * 1e9
+
+
+async def _noop_app(scope, receive, send):
+	await send({"type": "http.response.start", "status": 200, "headers": []})
+	await send({"type": "http.response.body", "body": b""})
+
+
+async def _noop_send(message):
+	pass
+
+
+def middleware_ns(app, n: int) -> float:
+	scope = {"type": "http", "method": "GET", "path": "/x"}
+
+	async def run():
+		start = time.perf_counter()
+		for _ in range(n):
+			await app(dict(scope), None, _noop_send)
+		return (time.perf_counter() - start) / n * 1e9
+
+	return asyncio.run(run())
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--n", type=int, default=200000)
+	args = parser.parse_args()
+
+	reg = Registry()
+	counter = reg.counter("bench_total", "bench", ("route", "status"))
+	hist = reg.histogram("bench_seconds", "bench", ("route",))
+
+	print(f"counter.inc          {per_call_ns(lambda: counter.inc(route='/queryBusbar', status=200), args.n):8.0f} ns")
+	print(f"histogram.observe    {per_call_ns(lambda: hist.observe(0.012, route='/queryBusbar'), args.n):8.0f} ns")
+	base = middleware_ns(_noop_app, args.n // 10)
+	wrapped = middleware_ns(MetricsMiddleware(_noop_app), args.n // 10)
+	print(f"middleware overhead  {wrapped - base:8.0f} ns/request")
+	start = time.perf_counter()
+	reg.render()
+	print(f"render               {(time.perf_counter() - start) * 1e6:8.0f} us")
+
+
+if __name__ == "__main__":
+	main()
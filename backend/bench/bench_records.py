@@ -0,0 +1,179 @@
+"""
+Memory and serialization cost of catalog rows: dict per row vs slotted records.
+
+Chạy từ thư mục backend:
+    python bench/bench_records.py --rows 100000
+
+Seeds --rows synthetic components_list and components_info rows into a
+throw-away database, then reports:
+  - retained memory (tracemalloc) per 100k rows when loaded as dict(sqlite3.Row)
+    (previous representation) and as catalog.ComponentRecord/ComponentInfoRecord;
+  - retained memory of the memory calc cache backend per 100k keys (keys and
+    L values included);
+  - time to build and serialize a queryBusbar-shaped response of --products
+    products, through FastAPI's jsonable_encoder (previous route) and straight
+    to JSONResponse.
+"""
+import argparse
+import gc
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SHAPES = ["Flat", "Edge"]
+
+
+def seed(db_path: str, rows: int, rng: random.Random) -> None:
+	from database.database import Database
+	from database.migrations import run_migrations
+	run_migrations(Database(db_path))
+	conn = sqlite3.connect(db_path)
+	conn.executemany(
+		"INSERT INTO components_info (key, nbphase, Amini, Amaxi, angle, resmini, typesupport, Bmini, largeurmodule, img1Article, img2Article, numart, info, a_list) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+		(
+			(f"REC-{i:06d}", 1 + i % 4, 60, 300, rng.choice([0, 90]), rng.choice([50.0, 75.0, 100.0]), "S", 1, 1,
+			 f"products/REC-{i:06d}-1.png", f"products/REC-{i:06d}-2.png", str(100000 + i), f"support {i}", "60,85")
+			for i in range(rows)
+		),
+	)
+	conn.executemany(
+		"INSERT INTO components_list (nbphase, thickness, width, poles, shape, component_id) VALUES (?, ?, ?, ?, ?, ?)",
+		(
+			(1 + i % 4, rng.choice([5.0, 10.0]), rng.choice([20.0, 32.0, 50.0, 63.0]), rng.choice([2, 3, 4]),
+			 rng.choice(SHAPES), f"REC-{rng.randrange(max(1, rows // 10)):06d}")
+			for i in range(rows)
+		),
+	)
+	conn.commit()
+	conn.close()
+
+
+def retained(load) -> int:
+	gc.collect()
+	tracemalloc.start()
+	data = load()
+	gc.collect()
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del data
+	return size
+
+
+def timed(fn, iterations: int) -> float:
+	samples = []
+	for _ in range(iterations):
+		started = time.perf_counter()
+		fn()
+		samples.append(time.perf_counter() - started)
+	return statistics.median(samples) * 1000
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=100000)
+	parser.add_argument("--products", type=int, default=200, help="products in the serialized response")
+	parser.add_argument("--iterations", type=int, default=50)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		db_path = os.path.join(tmp, "bench.db")
+		os.environ["BERLIVN_DB"] = db_path
+		sys.path.insert(0, BACKEND_DIR)
+		seed(db_path, args.rows, random.Random(1))
+
+		from fastapi.encoders import jsonable_encoder
+		from fastapi.responses import JSONResponse
+		from catalog import ComponentRecord, ComponentInfoRecord
+
+		def load_dicts(table):
+			def load():
+				conn = sqlite3.connect(db_path)
+				conn.row_factory = sqlite3.Row
+				try:
+					return [dict(row) for row in conn.execute(f"SELECT * FROM {table};")]
+				finally:
+					conn.close()
+			return load
+
+		def load_records(cls, table):
+			def load():
+				conn = sqlite3.connect(db_path)
+				try:
+					return [cls.from_row(row) for row in conn.execute(f"SELECT {cls.columns()} FROM {table};")]
+				finally:
+					conn.close()
+			return load
+
+		per_100k = 100000 / args.rows
+		print(f"{'retained memory per 100k rows':36s} {'dict':>10s} {'record':>10s}")
+		for table, cls in (("components_list", ComponentRecord), ("components_info", ComponentInfoRecord)):
+			before = retained(load_dicts(table)) * per_100k / 2 ** 20
+			after = retained(load_records(cls, table)) * per_100k / 2 ** 20
+			print(f"{table:36s} {before:8.1f}MB {after:8.1f}MB  {after / before - 1:+.0%}")
+
+		def fill_calc_cache():
+			from cache_backends import MemoryCacheBackend
+			rng = random.Random(2)
+			backend = MemoryCacheBackend(args.rows)
+			backend.set_many({
+				(rng.choice([20, 32, 50, 63]), rng.choice([5, 10]), rng.randint(1, 4), rng.choice([0, 90]),
+				 rng.randint(50, 120), rng.choice([25, 35, 50]), rng.randint(300, 1000), rng.randint(2, 4)): str(rng.randint(200, 900))
+				for _ in range(args.rows)
+			}, "1")
+			return backend
+
+		print(f"{'calc cache (memory backend)':36s} {'':>10s} {retained(fill_calc_cache) * per_100k / 2 ** 20:8.1f}MB")
+
+		components = load_records(ComponentRecord, "components_list")()[:args.products]
+		infos = {info.key: info for info in load_records(ComponentInfoRecord, "components_info")()}
+		matches = [(c, (infos.get(c.component_id),) if c.component_id in infos else ()) for c in components]
+		dict_matches = [
+			(c.to_dict(), [i.to_dict() for i in found]) for c, found in matches
+		]
+
+		def build_from_dicts():
+			# trước đây: bản sao dict của catalog, thêm L vào từng info
+			products = []
+			for component, found in dict_matches:
+				product = dict(component)
+				product["additionalInfo"] = [dict(info) for info in found]
+				for info in product["additionalInfo"]:
+					info["L"] = "500"
+					info["L_status"] = "cached"
+				products.append(product)
+			return {"products": products, "degraded": False}
+
+		def build_from_records():
+			products = []
+			for component, found in matches:
+				product = component.to_dict()
+				product["additionalInfo"] = additional_info = []
+				for info in found:
+					item = info.to_dict()
+					item["L"] = "500"
+					item["L_status"] = "cached"
+					additional_info.append(item)
+				products.append(product)
+			return {"products": products, "degraded": False}
+
+		body = build_from_dicts()
+		rows = [
+			("build: dict copies", lambda: build_from_dicts()),
+			("build: records -> dict", lambda: build_from_records()),
+			("serialize: jsonable_encoder + JSON", lambda: JSONResponse(jsonable_encoder(body))),
+			("serialize: JSONResponse", lambda: JSONResponse(body)),
+		]
+		print(f"\n{'queryBusbar response, %d products' % len(matches):36s} {'p50 ms':>10s}")
+		for name, fn in rows:
+			print(f"{name:36s} {timed(fn, args.iterations):10.3f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,110 @@
+"""
+Full-text component search (FTS5) vs the LIKE scan it replaces.
+
+Chạy từ thư mục backend:
+    python bench/bench_search.py --rows 100000
+
+Seeds --rows synthetic components_info rows into a throw-away database (the
+FTS index is kept in sync by the migration's triggers), publishes a catalog
+snapshot, then reports p50/p99 latency of one ranked page (20 rows + total)
+for a few query shapes, through catalog.search_text on the immutable
+snapshot (cold; "cached" = CatalogSnapshot.search_text, page already ranked),
+against a LIKE '%...%' scan over key/numart/info.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = [
+	"support", "isolateur", "barre", "cuivre", "aluminium", "renforcé", "jeu", "plat", "chant",
+	"module", "tripolaire", "tétrapolaire", "fixation", "rail", "épaisseur", "largeur", "boîtier",
+]
+
+QUERIES = [
+	("key prefix", "REC-0012"),
+	("numart prefix", "1004"),
+	("one word", "isolateur"),
+	("two words", "support renf"),
+	("no match", "zzzz"),
+]
+
+
+def seed(db_path: str, rows: int, rng: random.Random) -> float:
+	from database.database import Database
+	from database.migrations import run_migrations
+	run_migrations(Database(db_path))
+	conn = sqlite3.connect(db_path)
+	started = time.perf_counter()
+	conn.executemany(
+		"INSERT INTO components_info (key, nbphase, angle, resmini, typesupport, numart, info, a_list) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+		(
+			(f"REC-{i:06d}", 1 + i % 4, rng.choice([0, 90]), 50.0, "S", str(100000 + i),
+			 " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))), "60,85")
+			for i in range(rows)
+		),
+	)
+	conn.commit()
+	conn.close()
+	return time.perf_counter() - started
+
+
+def timed(fn, iterations: int):
+	samples = []
+	for _ in range(iterations):
+		started = time.perf_counter()
+		fn()
+		samples.append(time.perf_counter() - started)
+	samples.sort()
+	return statistics.median(samples) * 1000, samples[int(len(samples) * 0.99) - 1] * 1000
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--rows", type=int, default=100000)
+	parser.add_argument("--iterations", type=int, default=50)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		db_path = os.path.join(tmp, "bench.db")
+		os.environ["BERLIVN_DB"] = db_path
+		os.environ["CATALOG_SNAPSHOT_DIR"] = os.path.join(tmp, "snapshots")
+		sys.path.insert(0, BACKEND_DIR)
+		insert_seconds = seed(db_path, args.rows, random.Random(1))
+
+		from catalog import catalog, search_text
+		from database.catalog_publish import publish
+		published = publish(published_by="bench")
+		snapshot = catalog.load()
+		print(f"seed {args.rows} rows (FTS triggers on): {insert_seconds:.2f}s, publish incl. FTS rebuild: {published['seconds']:.2f}s")
+
+		conn = snapshot.connect()
+
+		def like(text):
+			pattern = f"%{text.split()[0]}%"
+			total = conn.execute(
+				"SELECT COUNT(*) FROM components_info WHERE key LIKE ?1 OR numart LIKE ?1 OR info LIKE ?1;", (pattern,)
+			).fetchone()[0]
+			rows = conn.execute(
+				"SELECT * FROM components_info WHERE key LIKE ?1 OR numart LIKE ?1 OR info LIKE ?1 ORDER BY key LIMIT 20;", (pattern,)
+			).fetchall()
+			return total, rows
+
+		print(f"\n{'query':28s} {'hits':>8s} {'fts p50':>9s} {'fts p99':>9s} {'cached':>9s} {'like p50':>9s} {'like p99':>9s}")
+		for name, text in QUERIES:
+			hits = search_text(conn, text)["total"]
+			fts_p50, fts_p99 = timed(lambda: search_text(conn, text), args.iterations)
+			cached_p50, _ = timed(lambda: snapshot.search_text(text), args.iterations)
+			like_p50, like_p99 = timed(lambda: like(text), max(5, args.iterations // 5))
+			print(f"{name + ' ' + repr(text):28s} {hits:8d} {fts_p50:7.2f}ms {fts_p99:7.2f}ms {cached_p50:7.3f}ms {like_p50:7.2f}ms {like_p99:7.2f}ms")
+		conn.close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,69 @@
+"""
+Cold-start cost: time to import the app and the SQLite work done at import time.
+
+Chạy từ thư mục backend:
+    python bench/bench_startup.py --runs 5
+
+Each run is a fresh interpreter against a throw-away database. Reports the
+import time of `main`, how many sqlite3 connections/statements were issued
+during import, and the time of the startup hooks.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = r"""
+import json, sqlite3, sys, time
+counts = {"connect": 0, "statements": 0}
+_connect = sqlite3.connect
+def _counting_connect(*a, **kw):
+    counts["connect"] += 1
+    conn = _connect(*a, **kw)
+    conn.set_trace_callback(lambda _: counts.__setitem__("statements", counts["statements"] + 1))
+    return conn
+sqlite3.connect = _counting_connect
+import database.database as dbm
+from pathlib import Path
+dbm.DB_PATH = Path(sys.argv[1])
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+import_counts = dict(counts)
+for handler in main.app.router.on_startup:
+    handler()
+t2 = time.perf_counter()
+for handler in main.app.router.on_shutdown:
+    handler()
+print(json.dumps({"import_s": t1 - t0, "startup_s": t2 - t1, "import_io": import_counts,
+                  "startup_io": {k: counts[k] - import_counts[k] for k in counts}}))
+"""
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--runs", type=int, default=5)
+	args = parser.parse_args()
+
+	samples = []
+	for _ in range(args.runs):
+		with tempfile.TemporaryDirectory() as tmp:
+			out = subprocess.run(
+				[sys.executable, "-c", _PROBE, os.path.join(tmp, "berlivn.db")],
+				cwd=tmp, env=dict(os.environ, PYTHONPATH=BACKEND_DIR, PASSWORD_HASH_WORKERS="0"),
+				capture_output=True, text=True, check=True,
+			)
+			samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+	print(f"runs={args.runs}")
+	print(f"import  median {statistics.median(s['import_s'] for s in samples) * 1000:8.1f} ms  io={samples[-1]['import_io']}")
+	print(f"startup median {statistics.median(s['startup_s'] for s in samples) * 1000:8.1f} ms  io={samples[-1]['startup_io']}")
+
+
+if __name__ == "__main__":
+	main()
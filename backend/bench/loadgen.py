@@ -0,0 +1,173 @@
+"""
+End-to-end load generator for the API.
+
+Chạy từ thư mục backend (3 terminal):
+    python bench/loadgen.py prepare --db /tmp/load.db
+    python bench/aspexcel_stub.py --port 8090
+    BERLIVN_DB=/tmp/load.db JWT_SECRET=<secret> ASPEXCEL_URL=http://127.0.0.1:8090/eriflex/admin/aspExcel/aspExcel.asp \\
+        uvicorn main:app --port 8000
+    python bench/loadgen.py run --db /tmp/load.db --base-url http://127.0.0.1:8000 \\
+        --duration 30 --concurrency 16 --mix search=70,login=10,analytics=20
+
+`prepare` seeds a synthetic catalog and users (password: --password) with
+the same generator as bench/microbench.py; the first user is made admin. `run`
+reads search parameters and registration numbers from that database, drives a
+weighted mix of /queryBusbar, /auth/login and /admin/analytics traffic from
+closed-loop workers, and reports throughput and p50/p95/p99 latency per
+traffic type. Analytics requests carry the admin's access token.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+POLES_NAMES = {2: "Bi", 3: "Three", 4: "Four"}
+
+
+def prepare(args) -> None:
+	import microbench
+	from services.password_service import PasswordHasher
+	if os.path.exists(args.db):
+		os.remove(args.db)
+	microbench.seed(args.db, random.Random(args.seed))
+	pw_hash = PasswordHasher(workers=0).hash(args.password)
+	conn = sqlite3.connect(args.db)
+	conn.execute("UPDATE users SET password_hash = ?, is_active = 1;", (pw_hash,))
+	conn.execute("UPDATE users SET role = 'admin' WHERE id = (SELECT id FROM users ORDER BY rowid LIMIT 1);")
+	conn.commit()
+	conn.close()
+	print(f"Seeded {args.db}; all users have password '{args.password}'")
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+	if not sorted_samples:
+		return 0.0
+	return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+def run(args) -> None:
+	conn = sqlite3.connect(args.db)
+	catalog = conn.execute("SELECT DISTINCT nbphase, thickness, width, poles, shape FROM components_list;").fetchall()
+	registrations = [r[0] for r in conn.execute("SELECT registration_number FROM users;")]
+	admin = conn.execute("SELECT registration_number FROM users WHERE role = 'admin' LIMIT 1;").fetchone()
+	conn.close()
+	if not catalog or not registrations:
+		raise SystemExit("database has no catalog/users, run 'prepare' first")
+
+	mix: List[Tuple[str, int]] = []
+	for item in args.mix.split(","):
+		name, weight = item.split("=")
+		mix.append((name.strip(), int(weight)))
+	names = [m[0] for m in mix]
+	weights = [m[1] for m in mix]
+	base = args.base_url.rstrip("/")
+	iccs = [int(x) for x in args.icc.split(",")]
+
+	def search(session: requests.Session, rng: random.Random) -> requests.Response:
+		nbphase, t, w, p, s = rng.choice(catalog)
+		return session.post(f"{base}/queryBusbar", json={
+			"perPhase": f"{nbphase} x", "thickness": str(t), "width": str(w),
+			"poles": POLES_NAMES.get(p, str(p)), "shape": s, "icc": rng.choice(iccs),
+		}, timeout=args.timeout)
+
+	def login(session: requests.Session, rng: random.Random) -> requests.Response:
+		return session.post(f"{base}/auth/login", json={
+			"registration_number": rng.choice(registrations), "password": args.password,
+		}, timeout=args.timeout)
+
+	admin_headers = {}
+	if "analytics" in names:
+		if admin is None:
+			raise SystemExit("database has no admin user, run 'prepare' again")
+		resp = requests.post(f"{base}/auth/login", json={"registration_number": admin[0], "password": args.password}, timeout=args.timeout)
+		resp.raise_for_status()
+		admin_headers["Authorization"] = f"Bearer {resp.json()['access_token']}"
+
+	def analytics(session: requests.Session, rng: random.Random) -> requests.Response:
+		return session.get(f"{base}/admin/analytics", params={"days": rng.choice([7, 30])}, headers=admin_headers, timeout=args.timeout)
+
+	actions = {"search": search, "login": login, "analytics": analytics}
+	unknown = set(names) - set(actions)
+	if unknown:
+		raise SystemExit(f"unknown traffic types: {unknown}")
+
+	lock = threading.Lock()
+	latencies: Dict[str, List[float]] = {n: [] for n in names}
+	errors: Dict[str, Dict[str, int]] = {n: {} for n in names}
+	deadline = time.perf_counter() + args.duration
+
+	def worker(seed: int) -> None:
+		rng = random.Random(seed)
+		session = requests.Session()
+		while time.perf_counter() < deadline:
+			name = rng.choices(names, weights)[0]
+			start = time.perf_counter()
+			try:
+				status = str(actions[name](session, rng).status_code)
+			except requests.RequestException as exc:
+				status = type(exc).__name__
+			elapsed = time.perf_counter() - start
+			with lock:
+				if status.startswith("2"):
+					latencies[name].append(elapsed)
+				else:
+					errors[name][status] = errors[name].get(status, 0) + 1
+
+	threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.concurrency)]
+	started = time.perf_counter()
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	wall = time.perf_counter() - started
+
+	total_ok = sum(len(v) for v in latencies.values())
+	print(f"duration={wall:.1f}s concurrency={args.concurrency} ok={total_ok} throughput={total_ok / wall:.1f} req/s")
+	print(f"{'type':<10} {'ok':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  errors")
+	for name in names:
+		samples = sorted(latencies[name])
+		print(
+			f"{name:<10} {len(samples):>7} {len(samples) / wall:>8.1f} "
+			f"{_percentile(samples, 0.50) * 1000:>8.1f} {_percentile(samples, 0.95) * 1000:>8.1f} "
+			f"{_percentile(samples, 0.99) * 1000:>8.1f}  {errors[name] or '-'}"
+		)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	sub = parser.add_subparsers(dest="command", required=True)
+
+	p = sub.add_parser("prepare", help="seed a database for load testing")
+	p.add_argument("--db", required=True)
+	p.add_argument("--password", default="bench-password")
+	p.add_argument("--seed", type=int, default=1234)
+	p.set_defaults(func=prepare)
+
+	r = sub.add_parser("run", help="drive traffic against a running server")
+	r.add_argument("--db", required=True, help="database the server uses (read for search parameters)")
+	r.add_argument("--base-url", default="http://127.0.0.1:8000")
+	r.add_argument("--duration", type=float, default=30.0)
+	r.add_argument("--concurrency", type=int, default=16)
+	r.add_argument("--mix", default="search=70,login=10,analytics=20")
+	r.add_argument("--icc", default="25,35,50,65", help="Icc values used by searches; values not seeded cause upstream calls")
+	r.add_argument("--password", default="bench-password")
+	r.add_argument("--timeout", type=float, default=30.0)
+	r.add_argument("--seed", type=int, default=1)
+	r.set_defaults(func=run)
+
+	args = parser.parse_args()
+	args.func(args)
+
+
+if __name__ == "__main__":
+	main()
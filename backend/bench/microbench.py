@@ -0,0 +1,200 @@
+"""
+Offline microbenchmarks for the data and calculation layers.
+
+Chạy từ thư mục backend:
+    python bench/microbench.py                  # run and compare with bench/baseline.json
+    python bench/microbench.py --save-baseline  # run and overwrite the baseline
+    python bench/microbench.py --only get_calc_excel,query_busbar_service
+
+A synthetic catalog, calc_excel cache, users and search logs are seeded into
+a throw-away database (BERLIVN_DB); the ASPExcel upstream is stubbed so no
+network is used. Each case reports p50/p99 in microseconds; a case whose p50
+is more than --threshold slower than the baseline is flagged and the script
+exits with status 1.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(BACKEND_DIR, "bench", "baseline.json")
+
+# Số lượng dữ liệu giả lập
+N_COMPONENTS = 200
+THICKNESSES = [5, 10]
+WIDTHS = [20, 32, 50, 63, 80, 100]
+POLES = [2, 3, 4]
+SHAPES = ["Flat", "Edge"]
+ICCS = [25, 35, 50]
+N_USERS = 500
+LOG_DAYS = 60
+
+
+def seed(db_path: str, rng: random.Random) -> Dict[str, object]:
+	from database.database import Database
+	from database.migrations import run_migrations
+	run_migrations(Database(db_path))
+
+	conn = sqlite3.connect(db_path)
+	info_rows, list_rows, calc_rows = [], [], []
+	for i in range(N_COMPONENTS):
+		key = f"BENCH-{i:05d}"
+		nbphase = 1 + i % 4
+		angle, resmini, a = rng.choice([0, 90]), rng.choice([50, 75, 100]), rng.choice([60, 75, 100])
+		info_rows.append((key, nbphase, a, 300, angle, resmini, "S", 1, 1, "", "", str(100000 + i), f"support {i}", f"{a},{a + 25}"))
+		for t in THICKNESSES:
+			for w in rng.sample(WIDTHS, 3):
+				for p in POLES:
+					for s in SHAPES:
+						list_rows.append((nbphase, t, w, p, s, key))
+						for icc in ICCS:
+							calc_rows.append((w, t, nbphase, angle, a, icc, resmini * 10, p, str(rng.randint(200, 900))))
+	conn.executemany("INSERT INTO components_info (key, nbphase, Amini, Amaxi, angle, resmini, typesupport, Bmini, largeurmodule, img1Article, img2Article, numart, info, a_list) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", info_rows)
+	conn.executemany("INSERT INTO components_list (nbphase, thickness, width, poles, shape, component_id) VALUES (?, ?, ?, ?, ?, ?)", list_rows)
+	conn.executemany("INSERT OR IGNORE INTO calc_excel (W, T, B, Angle, a, Icc, Force, NbrePhase, L) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", calc_rows)
+
+	user_ids = [str(uuid.uuid4()) for _ in range(N_USERS)]
+	conn.executemany(
+		"INSERT INTO users (id, company_name, registration_number, activities, employee_count, company_phone, email, password_hash, first_name, last_name, job_position, professional_address, postal_code, city, direct_phone, mobile_phone, daily_search_limit, daily_search_remaining) VALUES (?, 'C', ?, 'a', '1', '0', ?, 'x', 'f', 'l', 'j', 'addr', '0', 'c', '0', '0', 1000000000, 1000000000)",
+		[(uid, f"REG{i}", f"u{i}@example.com") for i, uid in enumerate(user_ids)],
+	)
+	today = time.time()
+	logs = []
+	for uid in user_ids:
+		for d in range(0, LOG_DAYS, 3):
+			day = time.strftime("%Y-%m-%d", time.localtime(today - d * 86400))
+			logs.append((str(uuid.uuid4()), uid, day, rng.randint(1, 20)))
+	conn.executemany("INSERT INTO user_search_logs (id, user_id, log_date, search_count) VALUES (?, ?, ?, ?)", logs)
+	conn.commit()
+	conn.close()
+	return {"list_rows": list_rows, "calc_rows": calc_rows, "user_ids": user_ids}
+
+
+class _StubResponse:
+	status_code = 200
+	text = "500"
+
+
+def stub_upstream() -> None:
+	import calc_data
+	calc_data.requests.post = lambda *a, **kw: _StubResponse()
+
+
+def build_cases(data: Dict[str, object], rng: random.Random) -> Dict[str, Callable[[], object]]:
+	import sqlite as sqlite_helpers
+	from services.query_busbar_service import query_busbar_service
+	from models.user import check_and_increment_search
+	from models.log_query import get_total_search_stats
+
+	calc_rows: List[tuple] = data["calc_rows"]  # type: ignore[assignment]
+	list_rows: List[tuple] = data["list_rows"]  # type: ignore[assignment]
+	user_ids: List[str] = data["user_ids"]  # type: ignore[assignment]
+	poles_names = {2: "Bi", 3: "Three", 4: "Four"}
+
+	def get_calc_excel():
+		W, T, B, Angle, a, Icc, Force, NbrePhase, _ = rng.choice(calc_rows)
+		return sqlite_helpers.get_calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase)
+
+	def query_busbar():
+		nbphase, t, w, p, s, _ = rng.choice(list_rows)
+		return query_busbar_service({
+			"perPhase": f"{nbphase} x", "thickness": str(t), "width": str(w),
+			"poles": poles_names[p], "shape": s, "icc": rng.choice(ICCS),
+		})
+
+	def check_and_increment():
+		return check_and_increment_search(rng.choice(user_ids))
+
+	def create_component_list():
+		return sqlite_helpers.create_component_list(
+			1, THICKNESSES, rng.sample(WIDTHS, 4), POLES, SHAPES, f"BENCH-{rng.randrange(N_COMPONENTS):05d}"
+		)
+
+	return {
+		"get_calc_excel": get_calc_excel,
+		"query_busbar_service": query_busbar,
+		"check_and_increment_search": check_and_increment,
+		"get_total_search_stats": get_total_search_stats,
+		"create_component_list": create_component_list,
+	}
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int) -> Dict[str, float]:
+	for _ in range(warmup):
+		fn()
+	samples = []
+	for _ in range(iterations):
+		start = time.perf_counter()
+		fn()
+		samples.append((time.perf_counter() - start) * 1e6)
+	samples.sort()
+	return {
+		"n": iterations,
+		"p50_us": statistics.median(samples),
+		"p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--iterations", type=int, default=300)
+	parser.add_argument("--warmup", type=int, default=20)
+	parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown vs baseline (0.2 = 20%%)")
+	parser.add_argument("--only", default="", help="comma separated case names")
+	parser.add_argument("--baseline", default=BASELINE_PATH)
+	parser.add_argument("--save-baseline", action="store_true")
+	parser.add_argument("--seed", type=int, default=1234)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		db_path = os.path.join(tmp, "bench.db")
+		# phải đặt trước khi import các module dùng DB
+		os.environ["BERLIVN_DB"] = db_path
+		sys.path.insert(0, BACKEND_DIR)
+		rng = random.Random(args.seed)
+		data = seed(db_path, rng)
+		stub_upstream()
+		cases = build_cases(data, rng)
+		if args.only:
+			wanted = set(args.only.split(","))
+			cases = {k: v for k, v in cases.items() if k in wanted}
+		results = {name: measure(fn, args.iterations, args.warmup) for name, fn in cases.items()}
+
+	baseline = {}
+	if os.path.exists(args.baseline):
+		with open(args.baseline, encoding="utf-8") as f:
+			baseline = json.load(f)
+
+	regressions = []
+	print(f"{'case':<30} {'p50 us':>10} {'p99 us':>10} {'base p50':>10} {'delta':>8}")
+	for name, r in results.items():
+		base = baseline.get(name)
+		if base:
+			delta = r["p50_us"] / base["p50_us"] - 1
+			flag = "  REGRESSION" if delta > args.threshold else ""
+			if flag:
+				regressions.append(name)
+			print(f"{name:<30} {r['p50_us']:>10.1f} {r['p99_us']:>10.1f} {base['p50_us']:>10.1f} {delta:>+7.0%}{flag}")
+		else:
+			print(f"{name:<30} {r['p50_us']:>10.1f} {r['p99_us']:>10.1f} {'-':>10} {'-':>8}")
+
+	if args.save_baseline:
+		baseline.update(results)
+		with open(args.baseline, "w", encoding="utf-8") as f:
+			json.dump(baseline, f, indent=2, sort_keys=True)
+		print(f"Baseline saved to {args.baseline}")
+	elif regressions:
+		print(f"Regressions: {', '.join(regressions)}")
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,162 @@
+"""
+Minimal in-memory server speaking the Redis protocol (RESP2), for local runs
+and for exercising cache_backends.RedisCacheBackend without a real Redis.
+
+Chạy từ thư mục backend:
+    python bench/redis_stub.py --port 6390
+    JWT_SECRET=<secret> CALC_CACHE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn main:app
+
+Hoặc trong process (port 0 = chọn port trống):
+    server = start_in_thread()
+    backend = RedisCacheBackend(RedisClient(f"redis://127.0.0.1:{server.port}/0"))
+
+Supported commands: PING, AUTH, SELECT, GET, MGET, SET (EX/PX/NX/XX/KEEPTTL),
+DEL, PTTL, DBSIZE, FLUSHDB, SCAN (MATCH/COUNT). Databases are not separated.
+"""
+import argparse
+import fnmatch
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class Store:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+	def _alive(self, key: bytes) -> Optional[Tuple[bytes, Optional[float]]]:
+		item = self.data.get(key)
+		if item is not None and item[1] is not None and item[1] <= time.monotonic():
+			del self.data[key]
+			return None
+		return item
+
+
+def _bulk(value: Optional[bytes]) -> bytes:
+	return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _array(items: List[bytes]) -> bytes:
+	return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+def _error(message: str) -> bytes:
+	return b"-ERR " + message.encode() + b"\r\n"
+
+
+def execute(store: Store, args: List[bytes]) -> bytes:
+	cmd = args[0].upper()
+	with store.lock:
+		if cmd == b"PING":
+			return b"+PONG\r\n"
+		if cmd in (b"AUTH", b"SELECT"):
+			return b"+OK\r\n"
+		if cmd == b"GET":
+			item = store._alive(args[1])
+			return _bulk(item[0] if item else None)
+		if cmd == b"MGET":
+			return _array([_bulk(item[0] if item else None) for item in map(store._alive, args[1:])])
+		if cmd == b"SET":
+			key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+			current = store._alive(key)
+			if (b"NX" in options and current) or (b"XX" in options and not current):
+				return b"$-1\r\n"
+			expires = None
+			if b"KEEPTTL" in options and current:
+				expires = current[1]
+			for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+				if unit in options:
+					expires = time.monotonic() + int(args[3 + options.index(unit) + 1]) * scale
+			store.data[key] = (value, expires)
+			return b"+OK\r\n"
+		if cmd == b"DEL":
+			removed = sum(1 for key in args[1:] if store._alive(key) and store.data.pop(key, None))
+			return b":%d\r\n" % removed
+		if cmd == b"PTTL":
+			item = store._alive(args[1])
+			if item is None:
+				return b":-2\r\n"
+			return b":-1\r\n" if item[1] is None else b":%d\r\n" % int((item[1] - time.monotonic()) * 1000)
+		if cmd == b"DBSIZE":
+			return b":%d\r\n" % len(store.data)
+		if cmd == b"FLUSHDB":
+			store.data.clear()
+			return b"+OK\r\n"
+		if cmd == b"SCAN":
+			# con trỏ là vị trí trong danh sách khóa đã sắp xếp (đủ cho stub)
+			cursor = int(args[1])
+			options = [a.upper() for a in args[2:]]
+			pattern = args[2 + options.index(b"MATCH") + 1].decode() if b"MATCH" in options else "*"
+			count = int(args[2 + options.index(b"COUNT") + 1]) if b"COUNT" in options else 10
+			keys = sorted(store.data)
+			page = keys[cursor:cursor + count]
+			next_cursor = cursor + count if cursor + count < len(keys) else 0
+			matched = [k for k in page if store._alive(k) and fnmatch.fnmatchcase(k.decode(), pattern)]
+			return _array([_bulk(str(next_cursor).encode()), _array([_bulk(k) for k in matched])])
+	return _error(f"unknown command '{cmd.decode()}'")
+
+
+def make_handler(store: Store):
+	class Handler(socketserver.StreamRequestHandler):
+		def _read_command(self) -> Optional[List[bytes]]:
+			line = self.rfile.readline()
+			if not line:
+				return None
+			if not line.startswith(b"*"):
+				return line.split()  # inline command (vd. gõ tay qua telnet)
+			args = []
+			for _ in range(int(line[1:-2])):
+				length = int(self.rfile.readline()[1:-2])
+				args.append(self.rfile.read(length + 2)[:-2])
+			return args
+
+		def handle(self) -> None:
+			while True:
+				args = self._read_command()
+				if args is None:
+					return
+				if args:
+					self.wfile.write(execute(store, args))
+					self.wfile.flush()
+
+	return Handler
+
+
+class RedisStubServer(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, host: str = "127.0.0.1", port: int = 0):
+		self.store = Store()
+		super().__init__((host, port), make_handler(self.store))
+
+	@property
+	def port(self) -> int:
+		return self.server_address[1]
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0) -> RedisStubServer:
+	server = RedisStubServer(host, port)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=6390)
+	args = parser.parse_args()
+	server = RedisStubServer(args.host, args.port)
+	print(f"Redis stub on redis://{args.host}:{server.port}/0")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,363 @@
+"""
+Cache backends for ASPExcel results (giá trị L theo khóa calc_excel).
+
+CALC_CACHE_BACKEND chọn backend dùng bởi calc_data:
+    sqlite  (mặc định) bảng calc_excel cục bộ
+    memory  LRU trong process, giới hạn CALC_CACHE_MEMORY_SIZE khóa
+    redis   dùng chung giữa nhiều API node qua REDIS_URL (redis://[:password@]host:port/db);
+            chạy với mọi server nói giao thức Redis (RESP), kể cả bench/redis_stub.py
+
+Mọi backend có get_many/set_many (TTL tùy chọn, giây) và mark_stale. Độ tươi
+(model_version, tuổi) do calc_data quyết định dựa trên CacheEntry.
+"""
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import sqlite as sqlite_helpers
+from log import get_logger
+
+logger = get_logger(__name__)
+
+CALC_CACHE_BACKEND = os.getenv("CALC_CACHE_BACKEND", "sqlite")
+CALC_CACHE_MEMORY_SIZE = int(os.getenv("CALC_CACHE_MEMORY_SIZE", "100000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "berlivn:calc:")
+REDIS_TIMEOUT = float(os.getenv("REDIS_TIMEOUT", "0.5"))
+
+KEY_COLUMNS = ("W", "T", "B", "Angle", "a", "Icc", "Force", "NbrePhase")
+CacheKey = Tuple[int, int, int, int, int, int, int, int]
+
+
+class CacheEntry(NamedTuple):
+    L: Optional[str]
+    fetched_at: Optional[float]  # epoch giây, None nếu không rõ
+    model_version: Optional[str]
+    stale: bool
+
+    def is_stale(self, model_version: str, max_age_seconds: float = 0) -> bool:
+        if self.stale or self.model_version != model_version:
+            return True
+        return bool(max_age_seconds) and self.fetched_at is not None and time.time() - self.fetched_at > max_age_seconds
+
+
+def _check_filters(filters: Dict[str, int]) -> None:
+    unknown = set(filters) - set(KEY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Cột không hợp lệ: {sorted(unknown)}")
+    if not filters:
+        raise ValueError("Cần ít nhất một bộ lọc")
+
+
+def _matches(key: CacheKey, filters: Dict[str, int]) -> bool:
+    return all(key[KEY_COLUMNS.index(col)] == value for col, value in filters.items())
+
+
+class CacheBackend:
+    name = ""
+
+    def get_many(self, keys: Sequence[CacheKey]) -> Dict[CacheKey, CacheEntry]:
+        """Trả về các khóa có trong cache (khóa vắng mặt / hết hạn không xuất hiện)."""
+        raise NotImplementedError
+
+    def set_many(self, items: Dict[CacheKey, str], model_version: str, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def mark_stale(self, filters: Dict[str, int]) -> int:
+        """Đánh dấu stale mọi khóa khớp filters (cột khóa -> giá trị). Trả về số khóa bị ảnh hưởng."""
+        raise NotImplementedError
+
+    def get(self, key: CacheKey) -> Optional[CacheEntry]:
+        return self.get_many([key]).get(key)
+
+    def set(self, key: CacheKey, L: str, model_version: str, ttl: Optional[float] = None) -> None:
+        self.set_many({key: L}, model_version, ttl)
+
+
+class _MemorySlot:
+    """Giá trị lưu trong MemoryCacheBackend: các trường của CacheEntry + hạn TTL (monotonic), không có __dict__."""
+    __slots__ = ("L", "fetched_at", "model_version", "stale", "expires")
+
+    def __init__(self, L, fetched_at, model_version, stale, expires):
+        # số giá trị L khác nhau ít hơn nhiều so với số khóa: dùng chung object str
+        self.L = sys.intern(L) if type(L) is str else L
+        self.fetched_at = fetched_at
+        self.model_version = model_version
+        self.stale = stale
+        self.expires = expires
+
+    def entry(self) -> CacheEntry:
+        return CacheEntry(self.L, self.fetched_at, self.model_version, self.stale)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    LRU trong process, mất khi restart. Với serve.py, warm() chạy trước khi fork
+    nên các worker bắt đầu với cùng dữ liệu (copy-on-write), sau đó mỗi worker tự cập nhật.
+    """
+    name = "memory"
+
+    def __init__(self, max_size: int = CALC_CACHE_MEMORY_SIZE):
+        self.max_size = max_size
+        self._data: "OrderedDict[CacheKey, _MemorySlot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[CacheKey]) -> Dict[CacheKey, CacheEntry]:
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                slot = self._data.get(key)
+                if slot is None:
+                    continue
+                if slot.expires is not None and slot.expires <= now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                found[key] = slot.entry()
+        return found
+
+    def set_many(self, items: Dict[CacheKey, str], model_version: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires = time.monotonic() + ttl if ttl else None
+        model_version = sys.intern(model_version)
+        with self._lock:
+            for key, L in items.items():
+                self._data[key] = _MemorySlot(L, now, model_version, False, expires)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def warm(self, limit: int) -> int:
+        """Nạp `limit` bản ghi calc_excel mới nhất vào bộ nhớ. Trả về số khóa đã nạp."""
+        rows = sqlite_helpers.get_recent_calc_excel(min(limit, self.max_size))
+        with self._lock:
+            for key, (L, fetched_at, model_version, stale) in reversed(rows):
+                model_version = sys.intern(model_version) if type(model_version) is str else model_version
+                self._data[key] = _MemorySlot(L, fetched_at, model_version, bool(stale), None)
+        return len(rows)
+
+    def mark_stale(self, filters: Dict[str, int]) -> int:
+        _check_filters(filters)
+        marked = 0
+        with self._lock:
+            for key, slot in self._data.items():
+                if _matches(key, filters):
+                    slot.stale = True
+                    marked += 1
+        return marked
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Bảng calc_excel cục bộ (sqlite.py); TTL lưu ở cột expires_at.
+    Mỗi thread giữ một kết nối: mở kết nối mới (đọc lại schema) tốn ~0.3 ms,
+    gấp hàng chục lần một lần tra theo index.
+    """
+    name = "sqlite"
+
+    def __init__(self):
+        self._local = threading.local()
+        # kết nối SQLite không được dùng chung qua fork (serve.py): worker mở kết nối riêng
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite_helpers.connect_to_db()
+        return conn
+
+    def get_many(self, keys: Sequence[CacheKey]) -> Dict[CacheKey, CacheEntry]:
+        rows = sqlite_helpers.get_calc_excel_many(list(keys), self._conn())
+        return {
+            key: CacheEntry(L, fetched_at, model_version, bool(stale))
+            for key, (L, fetched_at, model_version, stale) in rows.items()
+        }
+
+    def set_many(self, items: Dict[CacheKey, str], model_version: str, ttl: Optional[float] = None) -> None:
+        sqlite_helpers.set_calc_excel_many(items, model_version, ttl, self._conn())
+
+    def mark_stale(self, filters: Dict[str, int]) -> int:
+        return sqlite_helpers.mark_calc_excel_stale(filters)
+
+
+class RedisError(Exception):
+    """Error reply from the server or a protocol/connection failure."""
+    pass
+
+
+class RedisClient:
+    """
+    Client RESP2 tối giản, chỉ đủ cho cache: mỗi thread giữ một kết nối riêng,
+    lệnh gửi theo lô (pipeline) để set_many/mark_stale chỉ tốn một round-trip.
+    """
+    def __init__(self, url: str = REDIS_URL, timeout: float = REDIS_TIMEOUT):
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", ""):
+            raise ValueError(f"Unsupported Redis URL: {url}")
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        # socket kế thừa từ process cha không được dùng chung giữa các worker
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.conn = (sock, sock.makefile("rb"))
+        if self.password:
+            self.execute("AUTH", self.password)
+        if self.db:
+            self.execute("SELECT", self.db)
+        return self._local.conn
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise RedisError("connection closed by server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            return RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise RedisError(f"unexpected reply: {line!r}")
+
+    def pipeline(self, commands: List[Tuple]) -> List:
+        """Gửi nhiều lệnh trong một round-trip. Reply lỗi của server được ném ra dưới dạng RedisError."""
+        if not commands:
+            return []
+        try:
+            sock, reader = getattr(self._local, "conn", None) or self._connect()
+            sock.sendall(b"".join(self._encode(cmd) for cmd in commands))
+            replies = [self._read(reader) for _ in commands]
+        except (OSError, RedisError) as exc:
+            # lỗi kết nối/giao thức: kết nối có thể lệch (reply chưa đọc hết), bỏ và mở lại lần sau
+            self.close()
+            raise RedisError(f"Redis connection error: {exc}") from exc
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Mỗi khóa là một string Redis REDIS_PREFIX + "W:T:B:Angle:a:Icc:Force:NbrePhase"
+    chứa JSON [L, fetched_at, model_version, stale]; TTL dùng PX của Redis.
+    """
+    name = "redis"
+    SCAN_COUNT = 1000
+
+    def __init__(self, client: Optional[RedisClient] = None, prefix: str = REDIS_PREFIX):
+        self.client = client or RedisClient()
+        self.prefix = prefix
+
+    def _key(self, key: CacheKey) -> str:
+        return self.prefix + ":".join(str(int(v)) for v in key)
+
+    def _parse_key(self, raw: bytes) -> CacheKey:
+        return tuple(int(v) for v in raw.decode()[len(self.prefix):].split(":"))  # type: ignore[return-value]
+
+    @staticmethod
+    def _decode(raw: bytes) -> CacheEntry:
+        L, fetched_at, model_version, stale = json.loads(raw)
+        return CacheEntry(L, fetched_at, model_version, bool(stale))
+
+    def get_many(self, keys: Sequence[CacheKey]) -> Dict[CacheKey, CacheEntry]:
+        if not keys:
+            return {}
+        values = self.client.execute("MGET", *[self._key(k) for k in keys])
+        return {key: self._decode(raw) for key, raw in zip(keys, values) if raw is not None}
+
+    def set_many(self, items: Dict[CacheKey, str], model_version: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        commands = []
+        for key, L in items.items():
+            cmd = ("SET", self._key(key), json.dumps([L, now, model_version, 0]))
+            commands.append(cmd + ("PX", int(ttl * 1000)) if ttl else cmd)
+        self.client.pipeline(commands)
+
+    def mark_stale(self, filters: Dict[str, int]) -> int:
+        """SCAN theo mẫu khóa (cột không lọc -> *), rồi ghi lại với stale=1, giữ nguyên TTL (KEEPTTL, Redis >= 6)."""
+        _check_filters(filters)
+        pattern = self.prefix + ":".join(str(int(filters[c])) if c in filters else "*" for c in KEY_COLUMNS)
+        marked = 0
+        cursor = "0"
+        while True:
+            cursor_raw, raw_keys = self.client.execute("SCAN", cursor, "MATCH", pattern, "COUNT", self.SCAN_COUNT)
+            cursor = cursor_raw.decode() if isinstance(cursor_raw, bytes) else str(cursor_raw)
+            # MATCH của Redis là glob: "*" cũng khớp dấu ":" nên lọc lại cho chắc
+            raw_keys = [k for k in raw_keys if _matches(self._parse_key(k), filters)]
+            if raw_keys:
+                values = self.client.execute("MGET", *raw_keys)
+                commands = []
+                for raw_key, raw in zip(raw_keys, values):
+                    if raw is None:
+                        continue
+                    entry = self._decode(raw)
+                    commands.append(("SET", raw_key, json.dumps([entry.L, entry.fetched_at, entry.model_version, 1]), "KEEPTTL", "XX"))
+                marked += sum(1 for reply in self.client.pipeline(commands) if reply is not None)
+            if cursor == "0":
+                return marked
+
+
+def create_backend(name: str = CALC_CACHE_BACKEND) -> CacheBackend:
+    if name == "sqlite":
+        return SQLiteCacheBackend()
+    if name == "memory":
+        return MemoryCacheBackend()
+    if name == "redis":
+        return RedisCacheBackend()
+    raise ValueError(f"Unknown CALC_CACHE_BACKEND: {name}")
+
+
+calc_cache = create_backend()
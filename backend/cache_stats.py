@@ -0,0 +1,158 @@
+"""
+Quan sát hiệu quả của cache calc_excel (mỗi worker một bản, như registry của metrics).
+
+Bộ đếm (trong registry, xuất ra /metrics):
+    calc_excel_lookups_total{result}       hit / stale / miss / error (metrics.CALC_CACHE)
+    calc_excel_misses_total{reason}        absent: không có khóa (hoặc hết TTL)
+                                           negative: có khóa nhưng L rỗng
+                                           cache_error: backend lỗi khi đọc
+    calc_excel_miss_fills_total{result}    kết quả gọi upstream sau miss: fetched / upstream_error / unavailable
+    calc_excel_canonicalized_total{rule}   tham số bị calc_key đổi khi tạo khóa (B=5 -> 4, số thực bị cắt về int)
+
+Ngoài ra một sketch top-K (Space-Saving) lấy mẫu CALC_STATS_SAMPLE_RATE lượt tra cứu để biết
+khóa nào nóng và tỉ lệ hit của từng khóa, và một sketch thứ hai cho các khóa mà calc_key đã
+gộp tham số khác vào. Bộ nhớ cố định: mỗi sketch giữ tối đa CALC_STATS_TOP_K khóa.
+"""
+import os
+import random
+import threading
+import time
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+from cache_backends import KEY_COLUMNS
+from metrics import CALC_CACHE, registry
+
+CALC_STATS_SAMPLE_RATE = float(os.getenv("CALC_STATS_SAMPLE_RATE", "0.05"))  # 0 = tắt sketch, 1 = mọi lượt
+CALC_STATS_TOP_K = int(os.getenv("CALC_STATS_TOP_K", "200"))
+
+MISS_ABSENT = "absent"
+MISS_NEGATIVE = "negative"
+MISS_CACHE_ERROR = "cache_error"
+MISS_REASONS = (MISS_ABSENT, MISS_NEGATIVE, MISS_CACHE_ERROR)
+
+FILL_RESULTS = ("fetched", "upstream_error", "unavailable")
+CANONICAL_RULES = ("B5_as_B4", "W_truncated", "T_truncated", "Force_truncated")
+
+CALC_MISSES = registry.counter("calc_excel_misses_total", "calc_excel cache misses by reason (absent/negative/cache_error).", ("reason",))
+CALC_MISS_FILLS = registry.counter("calc_excel_miss_fills_total", "Upstream calls made for calc_excel misses by result.", ("result",))
+CALC_CANONICALIZED = registry.counter("calc_excel_canonicalized_total", "calc_excel keys whose parameters were rewritten by calc_key, by rule.", ("rule",))
+
+
+class SpaceSaving:
+    """
+    Sketch top-K Space-Saving: giữ tối đa `capacity` khóa. Khi đầy, khóa mới thay chỗ khóa có
+    count nhỏ nhất và kế thừa count đó làm sai số, nên count >= tần suất thật >= count - error.
+    hits chỉ được đếm từ lúc khóa vào sketch.
+    """
+    __slots__ = ("capacity", "_counters", "_lock")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._counters: Dict[Hashable, List[int]] = {}  # khóa -> [count, error, hits]
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable, hit: bool = False) -> None:
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                floor = 0
+                if len(self._counters) >= self.capacity:
+                    victim = min(self._counters, key=lambda k: self._counters[k][0])
+                    floor = self._counters.pop(victim)[0]
+                counter = self._counters[key] = [floor, floor, 0]
+            counter[0] += 1
+            if hit:
+                counter[2] += 1
+
+    def top(self, n: int) -> List[Tuple[Hashable, int, int, int]]:
+        """n khóa có count lớn nhất: (khóa, count, error, hits)."""
+        with self._lock:
+            items = [(key, c[0], c[1], c[2]) for key, c in self._counters.items()]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items[:n]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+class CalcKeyStats:
+    """Sketch lấy mẫu theo khóa calc_excel; bộ đếm tổng nằm trong registry."""
+
+    def __init__(self, sample_rate: float = CALC_STATS_SAMPLE_RATE, top_k: int = CALC_STATS_TOP_K):
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.keys = SpaceSaving(top_k)
+        self.canonicalized = SpaceSaving(top_k)
+        self.since = time.time()
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def record_lookups(self, keys: Iterable[tuple], served: Dict[tuple, object]) -> None:
+        """Ghi mẫu các lượt tra cứu; khóa có trong `served` được tính là hit (kể cả stale)."""
+        if not self.sample_rate:
+            return
+        for key in keys:
+            if self._sampled():
+                self.keys.add(key, key in served)
+
+    def record_canonical(self, key: tuple, W, T, B, Force) -> None:
+        """key là kết quả của calc_key cho các tham số gốc W, T, B, Force."""
+        if B == 5:
+            CALC_CANONICALIZED.inc(rule="B5_as_B4")
+        if W != key[0]:
+            CALC_CANONICALIZED.inc(rule="W_truncated")
+        if T != key[1]:
+            CALC_CANONICALIZED.inc(rule="T_truncated")
+        if Force != key[6]:
+            CALC_CANONICALIZED.inc(rule="Force_truncated")
+        if self.sample_rate and self._sampled():
+            self.canonicalized.add(key)
+
+    def reset(self) -> None:
+        """Xóa hai sketch (bộ đếm trong registry thì cộng dồn từ lúc process khởi động)."""
+        self.keys.clear()
+        self.canonicalized.clear()
+        self.since = time.time()
+
+    def _top(self, sketch: SpaceSaving, n: int, with_hits: bool) -> List[dict]:
+        rows = []
+        for key, count, error, hits in sketch.top(n):
+            row = {
+                "key": dict(zip(KEY_COLUMNS, key)),
+                # ước lượng số lượt thật = số mẫu / tỉ lệ lấy mẫu
+                "estimated": round(count / self.sample_rate),
+                "sampled": count,
+                "error": error,
+            }
+            if with_hits:
+                observed = count - error
+                row["hit_rate"] = round(hits / observed, 4) if observed else None
+            rows.append(row)
+        return rows
+
+    def report(self, top: int = 20) -> dict:
+        lookups = {result: int(CALC_CACHE.value(result=result)) for result in ("hit", "stale", "miss", "error")}
+        served = lookups["hit"] + lookups["stale"]
+        total = served + lookups["miss"]
+        return {
+            "pid": os.getpid(),
+            "lookups": lookups,
+            "hit_rate": round(served / total, 4) if total else None,
+            "misses": {reason: int(CALC_MISSES.value(reason=reason)) for reason in MISS_REASONS},
+            "miss_fills": {result: int(CALC_MISS_FILLS.value(result=result)) for result in FILL_RESULTS},
+            "canonicalized": {rule: int(CALC_CANONICALIZED.value(rule=rule)) for rule in CANONICAL_RULES},
+            "sampling": {
+                "rate": self.sample_rate,
+                "top_k": self.keys.capacity,
+                "since": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.since)),
+            },
+            "hot_keys": self._top(self.keys, top, True) if self.sample_rate else [],
+            "canonicalized_keys": self._top(self.canonicalized, top, False) if self.sample_rate else [],
+        }
+
+
+key_stats = CalcKeyStats()
@@ -1,14 +1,170 @@
 import os
+import time
+import threading
 import requests
-from log import *
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from log import get_logger
 from sqlite import *
+from cache_backends import calc_cache
+from metrics import CALC_CACHE, UPSTREAM_REQUESTS, UPSTREAM_LATENCY, registry
+from cache_stats import CALC_MISSES, CALC_MISS_FILLS, MISS_ABSENT, MISS_NEGATIVE, MISS_CACHE_ERROR, key_stats
+from resilience import (
+    CircuitBreaker, CircuitOpenError, LatencyTracker, PriorityScheduler, SchedulerTimeout, retry_call, hedged_call,
+)
+
+logger = get_logger(__name__)
+
+# Cho phép trỏ sang server giả lập (bench/aspexcel_stub.py) khi load-test
+ASPEXCEL_URL = os.getenv("ASPEXCEL_URL", "https://eriflex-configurator.nvent.com/eriflex/admin/aspExcel/aspExcel.asp")
+ASPEXCEL_TIMEOUT = float(os.getenv("ASPEXCEL_TIMEOUT", "10"))
+ASPEXCEL_RETRIES = int(os.getenv("ASPEXCEL_RETRIES", "2"))
+# Hedge: gửi thêm một request nếu request đầu chậm hơn p95 gần đây (mặc định tắt)
+ASPEXCEL_HEDGE = os.getenv("ASPEXCEL_HEDGE", "0") == "1"
+ASPEXCEL_BREAKER_FAILURES = int(os.getenv("ASPEXCEL_BREAKER_FAILURES", "5"))
+ASPEXCEL_BREAKER_RESET = float(os.getenv("ASPEXCEL_BREAKER_RESET", "30"))
+# Scheduler chung cho mọi request upstream: tốc độ tối đa (req/s, 0 = không giới hạn),
+# burst, số request đồng thời và thời gian chờ tối đa của request tương tác
+ASPEXCEL_RATE = float(os.getenv("ASPEXCEL_RATE", "10"))
+ASPEXCEL_BURST = float(os.getenv("ASPEXCEL_BURST", str(max(1.0, ASPEXCEL_RATE))))
+ASPEXCEL_CONCURRENCY = int(os.getenv("ASPEXCEL_CONCURRENCY", "8"))
+ASPEXCEL_QUEUE_TIMEOUT = float(os.getenv("ASPEXCEL_QUEUE_TIMEOUT", "10"))
+# Phiên bản mô hình tính toán của nVent; tăng giá trị này khi configurator đổi mô hình
+# để mọi bản ghi calc_excel cũ trở thành stale và được làm mới dần ở nền.
+ASPEXCEL_MODEL_VERSION = os.getenv("ASPEXCEL_MODEL_VERSION", "1")
+CALC_MAX_AGE_DAYS = int(os.getenv("CALC_MAX_AGE_DAYS", "0"))  # 0 = không hết hạn theo tuổi
+# TTL (giây) khi ghi vào cache backend; 0 = không hết hạn (bản ghi chỉ bị coi là stale)
+CALC_CACHE_TTL = float(os.getenv("CALC_CACHE_TTL", "0"))
+CALC_REFRESH_WORKERS = int(os.getenv("CALC_REFRESH_WORKERS", "2"))
+CALC_REFRESH_QUEUE = int(os.getenv("CALC_REFRESH_QUEUE", "1000"))
+
+# Trạng thái của một giá trị L trả về cho client
+L_CACHED = "cached"
+L_FETCHED = "fetched"
+L_STALE = "stale"              # giá trị cũ trong cache, đang được làm mới ở nền
+L_UNAVAILABLE = "unavailable"  # circuit breaker đang mở / hết thời gian chờ slot, không gọi upstream
+L_FAILED = "failed"            # upstream lỗi / không trả về L
+
+# Lớp ưu tiên: tìm kiếm của người dùng đi trước pre-warm / làm mới nền / tính lại của admin
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
 
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
-def send_aspExcel(A, width, thickness, perphase, angle, Icc, force, poles):
-    payload = {
+# 500 là câu trả lời "Force vượt giới hạn" của configurator, không phải lỗi tạm thời
+_RETRYABLE_STATUS = {502, 503, 504}
+_RETRYABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+BREAKER_TRANSITIONS = registry.counter("aspexcel_breaker_transitions_total", "ASPExcel circuit breaker state changes.", ("state",))
+UPSTREAM_RETRIES = registry.counter("aspexcel_retries_total", "ASPExcel calls retried after a transient failure.")
+UPSTREAM_HEDGES = registry.counter("aspexcel_hedges_total", "Hedged (duplicate) ASPExcel requests sent.")
+UPSTREAM_QUEUE_DEPTH = registry.gauge("aspexcel_queue_depth", "Callers waiting for an ASPExcel scheduler slot.", ("priority",))
+UPSTREAM_QUEUE_WAIT = registry.histogram("aspexcel_queue_wait_seconds", "Time spent waiting for an ASPExcel scheduler slot.", ("priority",))
+UPSTREAM_QUEUE_TIMEOUTS = registry.counter("aspexcel_queue_timeouts_total", "Callers that gave up waiting for an ASPExcel slot.", ("priority",))
+CALC_REFRESHES = registry.counter("calc_excel_refreshes_total", "Background refreshes of stale calc_excel rows by result.", ("result",))
+
+
+class FetchLimitExceeded(Exception):
+    """resolve_aspExcel_many: số khóa chưa có trong cache vượt max_fetch, chưa gọi upstream lần nào."""
+    def __init__(self, misses: int, limit: int):
+        super().__init__(f"{misses} uncached keys, at most {limit} allowed")
+        self.misses = misses
+        self.limit = limit
+
+
+class UpstreamError(Exception):
+    """Transient upstream failure (502/503/504) after the response was received."""
+    def __init__(self, status_code: int):
+        super().__init__(f"ASPExcel returned {status_code}")
+        self.status_code = status_code
+
+
+def _on_breaker_change(state: str) -> None:
+    BREAKER_TRANSITIONS.inc(state=state)
+    logger.warning("ASPExcel circuit breaker -> %s", state)
+
+
+upstream_breaker = CircuitBreaker(ASPEXCEL_BREAKER_FAILURES, ASPEXCEL_BREAKER_RESET, on_state_change=_on_breaker_change)
+upstream_latency = LatencyTracker()
+upstream_scheduler = PriorityScheduler(
+    ASPEXCEL_RATE, ASPEXCEL_BURST, ASPEXCEL_CONCURRENCY,
+    on_acquire=lambda priority, waited: UPSTREAM_QUEUE_WAIT.observe(waited, priority=_PRIORITY_NAMES.get(priority, priority)),
+)
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="aspexcel-hedge")
+# gọi upstream song song cho resolve_aspExcel_many; số request thật sự chạy cùng lúc vẫn do scheduler quyết định.
+# Mỗi lớp ưu tiên một pool riêng: miss của request tương tác không phải xếp hàng sau các future của job nền
+# trước khi tới được scheduler.
+_fetch_executors = {
+    priority: ThreadPoolExecutor(max_workers=max(1, ASPEXCEL_CONCURRENCY), thread_name_prefix=f"aspexcel-fetch-{name}")
+    for priority, name in _PRIORITY_NAMES.items()
+}
+
+
+class StaleRefresher:
+    """
+    Làm mới các bản ghi calc_excel stale ở nền. Tối đa `workers` request upstream
+    chạy cùng lúc; mỗi khóa chỉ được xếp hàng một lần, và khi hàng đợi đã có
+    `max_pending` khóa thì yêu cầu mới bị bỏ (lần tra cứu sau sẽ xếp hàng lại).
+    """
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="calc-refresh")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key: tuple) -> bool:
+        with self._lock:
+            if key in self._pending:
+                return False
+            if len(self._pending) >= self.max_pending:
+                CALC_REFRESHES.inc(result="dropped")
+                return False
+            self._pending.add(key)
+        self._executor.submit(self._run, key)
+        return True
+
+    def _run(self, key: tuple) -> None:
+        W, T, B, Angle, a, Icc, Force, poles = key
+        try:
+            _, status = fetch_aspExcel(a, W, T, B, Angle, Icc, Force, poles, PRIORITY_BACKGROUND)
+            CALC_REFRESHES.inc(result=status)
+        except Exception:
+            logger.exception("Làm mới calc_excel thất bại cho %s", key)
+            CALC_REFRESHES.inc(result=L_FAILED)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+stale_refresher = StaleRefresher(CALC_REFRESH_WORKERS, CALC_REFRESH_QUEUE)
+
+
+def _record_upstream(status, start):
+    elapsed = time.perf_counter() - start
+    UPSTREAM_REQUESTS.inc(status=status)
+    UPSTREAM_LATENCY.observe(elapsed, status=status)
+    return elapsed
+
+def _cache_key(W, T, B, Angle, a, Icc, Force, NbrePhase):
+    return (int(W), int(T), int(B), int(Angle), int(a), int(Icc), int(Force), int(NbrePhase))
+
+def _cache_store(payload, L):
+    key = _cache_key(payload['W'], payload['T'], payload['B'], payload['Angle'], payload['a'], payload['Icc'], payload['Force'], payload['NbrePhase'])
+    try:
+        calc_cache.set(key, L, ASPEXCEL_MODEL_VERSION, CALC_CACHE_TTL or None)
+    except Exception as e:
+        CALC_CACHE.inc(result="error")
+        logger.warning("Lỗi khi ghi cache %s: %s", calc_cache.name, e)
+
+def _make_payload(A, width, thickness, perphase, angle, Icc, force, poles):
+    return {
         "W": int(width),
         "T": int(thickness),
         "B": int(perphase),
@@ -18,69 +174,224 @@ def send_aspExcel(A, width, thickness, perphase, angle, Icc, force, poles):
         "Force": int(force),
         "NbrePhase": int(poles),
     }
-    print(f"Payload: {payload}")
-    url = "https://eriflex-configurator.nvent.com/eriflex/admin/aspExcel/aspExcel.asp"
+
+def _acquire_slot(priority):
+    name = _PRIORITY_NAMES.get(priority, priority)
+    timeout = ASPEXCEL_QUEUE_TIMEOUT if priority == PRIORITY_INTERACTIVE else None
+    UPSTREAM_QUEUE_DEPTH.inc(priority=name)
     try:
-        response = requests.post(url, headers=headers, params=payload,  timeout=10)
-        if response.status_code == 200:
-            write_log(f"Response of ASPExcel: {payload}")
-            print(f"Response of ASPExcel: {response.text}")
-            insert_calc_excel(payload['W'], payload['T'], payload['B'], payload['Angle'], payload['a'], payload['Icc'], payload['Force'], payload['NbrePhase'], response.text)
-            return int(response.text)
-        else:
-            print(f"Request ASPExcel thất bại với mã trạng thái: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        print(f"Lỗi khi gửi request ASPExcel: {e}")
+        upstream_scheduler.acquire(priority, timeout)
+    except SchedulerTimeout:
+        UPSTREAM_QUEUE_TIMEOUTS.inc(priority=name)
+        raise
+    finally:
+        UPSTREAM_QUEUE_DEPTH.dec(priority=name)
+
+def _post_once(payload, priority=PRIORITY_INTERACTIVE) -> requests.Response:
+    # mỗi lần gửi (kể cả retry và hedge) đều phải lấy slot từ scheduler
+    _acquire_slot(priority)
+    start = time.perf_counter()
+    try:
+        response = requests.post(ASPEXCEL_URL, headers=headers, params=payload, timeout=ASPEXCEL_TIMEOUT)
+    except requests.exceptions.RequestException:
+        _record_upstream("error", start)
+        raise
+    finally:
+        upstream_scheduler.release()
+    elapsed = _record_upstream(response.status_code, start)
+    if response.status_code in _RETRYABLE_STATUS:
+        raise UpstreamError(response.status_code)
+    if response.status_code == 200:
+        upstream_latency.add(elapsed)
+    return response
+
+def post_aspExcel(payload, priority=PRIORITY_INTERACTIVE) -> requests.Response:
+    """
+    Gửi một request tới ASPExcel qua circuit breaker, scheduler (rate limit + ưu tiên),
+    retry có jitter (chỉ với lỗi kết nối/timeout/502-504) và hedge tùy chọn.
+    Ném CircuitOpenError nếu breaker đang mở, SchedulerTimeout nếu chờ slot quá lâu,
+    UpstreamError/RequestException nếu vẫn lỗi sau khi retry.
+    """
+    if not upstream_breaker.allow():
+        raise CircuitOpenError("ASPExcel circuit breaker is open")
+    hedge_delay = upstream_latency.percentile(0.95) if ASPEXCEL_HEDGE else None
+    try:
+        response = retry_call(
+            lambda: hedged_call(lambda: _post_once(payload, priority), hedge_delay, _hedge_executor, on_hedge=UPSTREAM_HEDGES.inc),
+            retries=ASPEXCEL_RETRIES,
+            base_delay=0.2,
+            max_delay=2.0,
+            retry_on=_RETRYABLE_ERRORS + (UpstreamError,),
+            on_retry=lambda attempt, exc: UPSTREAM_RETRIES.inc(),
+        )
+    except (requests.exceptions.RequestException, UpstreamError):
+        upstream_breaker.record_failure()
+        raise
+    except SchedulerTimeout:
+        upstream_breaker.cancel()
+        raise
+    except BaseException:
+        # lỗi khác (bug, KeyboardInterrupt...) không nói gì về upstream: trả slot thăm dò,
+        # nếu không breaker kẹt ở half-open với mọi slot đã bị giữ
+        upstream_breaker.cancel()
+        raise
+    upstream_breaker.record_success()
+    return response
+
+def fetch_aspExcel(A, width, thickness, perphase, angle, Icc, force, poles, priority=PRIORITY_INTERACTIVE) -> Tuple[Optional[int], str]:
+    """Gọi upstream cho một bộ tham số, lưu vào calc_excel nếu thành công. Trả về (L, trạng thái)."""
+    payload = _make_payload(A, width, thickness, perphase, angle, Icc, force, poles)
+    logger.debug("ASPExcel payload: %s", payload)
+    try:
+        response = post_aspExcel(payload, priority)
+    except (CircuitOpenError, SchedulerTimeout):
+        return None, L_UNAVAILABLE
+    except (requests.exceptions.RequestException, UpstreamError) as e:
+        logger.warning("Lỗi khi gửi request ASPExcel: %s", e)
+        return None, L_FAILED
+    if response.status_code == 200:
+        logger.info("ASPExcel response", extra={"payload": payload, "L": response.text})
+        _cache_store(payload, response.text)
+        return int(response.text), L_FETCHED
+    logger.warning("Request ASPExcel thất bại với mã trạng thái: %s", response.status_code)
+    return None, L_FAILED
 
-    return None
+def send_aspExcel(A, width, thickness, perphase, angle, Icc, force, poles, priority=PRIORITY_INTERACTIVE):
+    return fetch_aspExcel(A, width, thickness, perphase, angle, Icc, force, poles, priority)[0]
+
+def resolve_aspExcel(W, T, B, Angle, a, Icc, Force, poles, priority=PRIORITY_INTERACTIVE) -> Tuple[Optional[int], str]:
+    """
+    Như get_aspExcel nhưng trả về thêm trạng thái (cached/stale/fetched/unavailable/failed).
+    Bản ghi stale được trả về ngay, đồng thời được xếp hàng làm mới ở nền.
+    """
+    key = calc_key(W, T, B, Angle, a, Icc, Force, poles)
+    return resolve_aspExcel_many((key,), priority)[key]
+
+def calc_key(W, T, B, Angle, a, Icc, Force, poles) -> tuple:
+    """Khóa calc_excel như resolve_aspExcel dùng (B == 5 được tra như 4, số thực bị cắt về int)."""
+    key = _cache_key(W, T, 4 if B == 5 else B, Angle, a, Icc, Force, poles)
+    if B == 5 or W != key[0] or T != key[1] or Force != key[6]:
+        key_stats.record_canonical(key, W, T, B, Force)
+    return key
+
+_FILL_RESULTS = {L_FETCHED: "fetched", L_FAILED: "upstream_error", L_UNAVAILABLE: "unavailable"}
+
+def _fetch_key(key, priority) -> Tuple[Optional[int], str]:
+    W, T, B, Angle, a, Icc, Force, poles = key
+    try:
+        result = fetch_aspExcel(a, W, T, B, Angle, Icc, Force, poles, priority)
+    except Exception:
+        logger.exception("Lỗi khi gọi ASPExcel cho %s", key)
+        result = (None, L_FAILED)
+    CALC_MISS_FILLS.inc(result=_FILL_RESULTS.get(result[1], result[1]))
+    return result
+
+def resolve_aspExcel_many(
+    keys: Iterable[tuple],
+    priority=PRIORITY_INTERACTIVE,
+    progress: Optional[Callable[[int, int], None]] = None,
+    max_fetch: Optional[int] = None,
+) -> Dict[tuple, Tuple[Optional[int], str]]:
+    """
+    resolve_aspExcel cho nhiều khóa calc_key(...): các khóa trùng được gộp, cache được đọc
+    bằng một get_many và các khóa thiếu được gọi upstream song song (một khóa thiếu: gọi
+    ngay trong thread hiện tại). Trả về khóa -> (L, trạng thái).
+    progress(done, total) được gọi sau mỗi lần gọi upstream.
+    max_fetch: ném FetchLimitExceeded nếu số khóa thiếu lớn hơn, trước khi gọi upstream.
+    """
+    keys = list(dict.fromkeys(keys))
+    cache_error = False
+    try:
+        entries = calc_cache.get_many(keys)
+    except Exception as e:
+        CALC_CACHE.inc(result="error")
+        logger.warning("Lỗi khi đọc cache %s: %s", calc_cache.name, e)
+        entries = {}
+        cache_error = True
+    results: Dict[tuple, Tuple[Optional[int], str]] = {}
+    misses = []
+    hits = stale = negative = 0
+    for key in keys:
+        entry = entries.get(key)
+        if entry is None or entry.L is None:
+            misses.append(key)
+            if entry is not None:
+                negative += 1
+        elif entry.is_stale(ASPEXCEL_MODEL_VERSION, CALC_MAX_AGE_DAYS * 86400):
+            stale += 1
+            stale_refresher.submit(key)
+            results[key] = (entry.L, L_STALE)
+        else:
+            hits += 1
+            results[key] = (entry.L, L_CACHED)
+    key_stats.record_lookups(keys, results)
+    if hits:
+        CALC_CACHE.inc(hits, result="hit")
+    if stale:
+        CALC_CACHE.inc(stale, result="stale")
+    if not misses:
+        return results
+    CALC_CACHE.inc(len(misses), result="miss")
+    if cache_error:
+        CALC_MISSES.inc(len(misses), reason=MISS_CACHE_ERROR)
+    else:
+        if negative:
+            CALC_MISSES.inc(negative, reason=MISS_NEGATIVE)
+        if len(misses) > negative:
+            CALC_MISSES.inc(len(misses) - negative, reason=MISS_ABSENT)
+    if max_fetch is not None and len(misses) > max_fetch:
+        raise FetchLimitExceeded(len(misses), max_fetch)
+    if len(misses) == 1:
+        results[misses[0]] = _fetch_key(misses[0], priority)
+        if progress:
+            progress(1, 1)
+        return results
+    executor = _fetch_executors.get(priority, _fetch_executors[PRIORITY_BACKGROUND])
+    futures = {executor.submit(_fetch_key, key, priority): key for key in misses}
+    for done, future in enumerate(as_completed(futures), 1):
+        results[futures[future]] = future.result()
+        if progress:
+            progress(done, len(misses))
+    return results
 
 def get_aspExcel(W, T, B, Angle, a, Icc, Force, poles):
-    if B == 5:
-        B = 4
-    L = get_calc_excel(W, T, B, Angle, a, Icc, Force, poles)
-    if L is None:
-        L = send_aspExcel(a, W, T, B, Angle, Icc, Force, poles)
-    return L
-
-def send_aspExcel_max(A, width, thickness, perphase, angle, Icc, initial_force, poles):
+    return resolve_aspExcel(W, T, B, Angle, a, Icc, Force, poles)[0]
+
+def send_aspExcel_max(A, width, thickness, perphase, angle, Icc, initial_force, poles, priority=PRIORITY_BACKGROUND, on_step=None):
+    """
+    Giảm Force từng bước 1000 cho tới khi ASPExcel trả về L. on_step(bước, tổng số bước tối đa)
+    được gọi sau mỗi request (dùng để báo tiến độ cho job).
+    """
     force = int(initial_force)
     last_successful_force = force
+    max_steps = max(1, force // 1000 + 1)
+    step = 0
     
     while True:
-        payload = {
-            "W": int(width),
-            "T": int(thickness),
-            "B": int(perphase),
-            "Angle": int(angle),
-            "a": int(A),
-            "Icc": int(Icc),
-            "Force": int(force),
-            "NbrePhase": int(poles),
-        }
-        print(f"Payload: {payload}")
-        url = "https://eriflex-configurator.nvent.com/eriflex/admin/aspExcel/aspExcel.asp"
+        payload = _make_payload(A, width, thickness, perphase, angle, Icc, force, poles)
+        logger.debug("ASPExcel payload: %s", payload)
         
         try:
-            response = requests.post(url, headers=headers, params=payload)
+            response = post_aspExcel(payload, priority)
             if response.status_code == 200:
-                write_log(f"Response of ASPExcel: {payload}")
-                print(f"Response of ASPExcel: {response.text}")
-                insert_calc_excel(payload['W'], payload['T'], payload['B'], payload['Angle'], 
-                                payload['a'], payload['Icc'], payload['Force'], payload['NbrePhase'], 
-                                response.text)
+                logger.info("ASPExcel response", extra={"payload": payload, "L": response.text})
+                _cache_store(payload, response.text)
                 return last_successful_force
             elif response.status_code == 500:
-                print(f"Đạt đến mã trạng thái 500 với Force = {force}")
-                print(f"Giá trị Force thành công cuối cùng: {last_successful_force}")
+                logger.debug("Đạt đến mã trạng thái 500 với Force = %s (Force thành công cuối cùng: %s)", force, last_successful_force)
                 last_successful_force = force
                 force -= 1000  # Tăng Force lên 1000
 
             else:
-                print(f"Request ASPExcel thất bại với mã trạng thái: {response.status_code}")
+                logger.warning("Request ASPExcel thất bại với mã trạng thái: %s", response.status_code)
                 force -= 1000  # Tiếp tục tăng Force ngay cả khi gặp mã trạng thái khác
-        except requests.exceptions.RequestException as e:
-            print(f"Lỗi khi gửi request ASPExcel: {e}")
+        except (requests.exceptions.RequestException, UpstreamError, CircuitOpenError, SchedulerTimeout) as e:
+            logger.warning("Lỗi khi gửi request ASPExcel: %s", e)
+            break
+        step += 1
+        if on_step:
+            on_step(step, max_steps)
+        if force <= 0:
             break
     
     return last_successful_force
-
@@ -0,0 +1,404 @@
+"""
+Published product catalog (components_list + components_info) for query_busbar_service.
+
+components_info/components_list trong DB chính là vùng staging cho admin; tìm kiếm
+chỉ đọc các snapshot đã publish (database/catalog_publish.py): mỗi version là một
+file SQLite bất biến CATALOG_SNAPSHOT_DIR/catalog-v000012.db, mở read-only với
+immutable=1 nên không lock, không bao giờ tranh chấp với các lượt ghi vào staging.
+
+CATALOG_VERSION_FILE chứa số version đang publish (ghi bằng os.replace). Mọi worker
+đọc lại file đó tối đa mỗi CATALOG_POLL_SECONDS giây và chuyển sang snapshot mới
+bằng một phép gán duy nhất. Catalog được nạp vào bộ nhớ một lần cho mỗi version
+(serve.py nạp trước khi fork để các worker dùng chung bộ nhớ copy-on-write);
+CATALOG_CACHE=0 tắt bản trong bộ nhớ (mọi tìm kiếm đọc thẳng file snapshot).
+
+Mỗi dòng được giữ dưới dạng record có __slots__ (không có __dict__ riêng) và các
+chuỗi lặp lại (shape, component_id, typesupport...) được intern; dict chỉ được
+tạo khi dựng response (to_dict()).
+"""
+import functools
+import operator
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.database import DB_PATH
+from log import get_logger
+
+logger = get_logger(__name__)
+
+CATALOG_CACHE = os.getenv("CATALOG_CACHE", "1") == "1"
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "1"))
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", str(Path(DB_PATH).parent / "catalog-snapshots"))
+CATALOG_VERSION_FILE = os.getenv("CATALOG_VERSION_FILE", os.path.join(CATALOG_SNAPSHOT_DIR, "CURRENT"))
+# chờ tối đa bao lâu khi một process khác đang publish snapshot đầu tiên
+CATALOG_PUBLISH_TIMEOUT = float(os.getenv("CATALOG_PUBLISH_TIMEOUT", "600"))
+
+SearchKey = Tuple[int, float, float, int, str]
+
+# chỉ mục FTS5 trên components_info (key, numart, info), xem migration components_info_fts
+FTS_TABLE = "components_info_fts"
+# trọng số bm25 theo cột: khớp ở key quan trọng hơn numart, numart hơn info
+FTS_RANK = "bm25(10.0, 5.0, 1.0)"
+_FTS_TOKEN = re.compile(r"\w+")
+# số sản phẩm (dòng components_list) theo từng tổ hợp giá trị của form tìm kiếm,
+# tính sẵn trong mỗi snapshot lúc publish
+FACETS_TABLE = "catalog_facets"
+FACETS = ("nbphase", "thickness", "width", "poles", "shape")
+FACETS_SQL = f"SELECT {', '.join(FACETS)}, COUNT(*) FROM components_list GROUP BY {', '.join(FACETS)}"
+# số kết quả (trang full-text, facets) giữ lại cho mỗi snapshot (snapshot bất biến nên không bao giờ cũ)
+CATALOG_PAGE_CACHE_SIZE = int(os.getenv("CATALOG_PAGE_CACHE_SIZE", "512"))
+
+
+class Record:
+    """Dòng SQLite bất biến: các cột trong _fields (mặc định là __slots__ của lớp con)."""
+    __slots__ = ()
+    # các cột SQLite; lớp con có thể có thêm slot dẫn xuất (không nằm trong _fields)
+    _fields: Tuple[str, ...] = ()
+    # cột có giá trị lặp lại nhiều lần giữa các dòng: dùng chung một object str
+    _interned = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "_fields" not in cls.__dict__:
+            cls._fields = cls.__slots__
+        cls._values = operator.attrgetter(*cls._fields)
+
+    def __init__(self, *values):
+        for name, value in zip(self._fields, values):
+            if name in self._interned and type(value) is str:
+                value = sys.intern(value)
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    @classmethod
+    def columns(cls) -> str:
+        return ", ".join(cls._fields)
+
+    @classmethod
+    def from_row(cls, row) -> "Record":
+        return cls(*row)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self._values(self)))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{n}={v!r}' for n, v in zip(self._fields, self._values(self)))})"
+
+
+class ComponentRecord(Record):
+    """Một dòng components_list."""
+    __slots__ = ("id", "nbphase", "thickness", "width", "poles", "shape", "component_id")
+    _interned = frozenset(("shape", "component_id"))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_spacings(a_list) -> Tuple[int, ...]:
+    """"60, 85,100" -> (60, 85, 100); phần tử không phải số bị bỏ qua. Các dòng cùng a_list dùng chung một tuple."""
+    spacings = []
+    for part in str(a_list or "").split(","):
+        try:
+            spacings.append(int(part.strip()))
+        except ValueError:
+            continue
+    return tuple(spacings)
+
+
+class ComponentInfoRecord(Record):
+    """Một dòng components_info; spacings: a_list đã parse thành các khoảng cách pha (int)."""
+    _fields = (
+        "key", "nbphase", "Amini", "Amaxi", "angle", "resmini", "typesupport", "Bmini",
+        "largeurmodule", "img1Article", "img2Article", "numart", "info", "a_list",
+    )
+    __slots__ = _fields + ("spacings",)
+    _interned = frozenset(("key", "typesupport", "img1Article", "img2Article", "a_list"))
+
+    def __init__(self, *values):
+        super().__init__(*values)
+        object.__setattr__(self, "spacings", parse_spacings(self.a_list))
+
+
+Match = Tuple[ComponentRecord, Tuple[ComponentInfoRecord, ...]]
+
+
+def search_key(nbphase, thickness, width, poles, shape) -> SearchKey:
+    return (int(nbphase), float(thickness), float(width), int(poles), str(shape))
+
+
+def snapshot_path(version, snapshot_dir: str = CATALOG_SNAPSHOT_DIR) -> str:
+    return os.path.join(snapshot_dir, f"catalog-v{int(version):06d}.db")
+
+
+def connect_snapshot(path: str) -> sqlite3.Connection:
+    """Mở file snapshot read-only; immutable=1: SQLite không lock và không kiểm tra file có đổi hay không."""
+    return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro&immutable=1", uri=True)
+
+
+class TextIndexMissing(Exception):
+    """Snapshot được publish trước khi có chỉ mục full-text."""
+
+
+def fts_query(text: str) -> str:
+    """
+    'REC-0001 support' -> '"REC 0001"* AND "support"*': mỗi từ là một cụm token liền nhau,
+    token cuối khớp tiền tố. Chỉ giữ ký tự chữ/số nên không thể sinh lỗi cú pháp FTS5.
+    """
+    phrases = []
+    for term in text.split():
+        tokens = _FTS_TOKEN.findall(term)
+        if tokens:
+            phrases.append('"' + " ".join(tokens) + '"*')
+    return " AND ".join(phrases)
+
+
+def search_text(conn: sqlite3.Connection, text: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """Tìm components_info theo key/numart/info, xếp hạng bm25; trả về {"total", "items"}."""
+    match = fts_query(text)
+    if not match:
+        return {"total": 0, "items": []}
+    columns = ", ".join(f"c.{name}" for name in ComponentInfoRecord._fields)
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?;", (match,)).fetchone()[0]
+        rows = conn.execute(
+            f"""
+            SELECT {columns}, {FTS_TABLE}.rank FROM {FTS_TABLE} JOIN components_info c ON c.rowid = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH ? AND {FTS_TABLE}.rank MATCH ? ORDER BY {FTS_TABLE}.rank LIMIT ? OFFSET ?;
+            """,
+            (match, FTS_RANK, limit, offset),
+        ).fetchall()
+    except sqlite3.OperationalError as e:
+        if f"no such table: {FTS_TABLE}" in str(e):
+            raise TextIndexMissing(str(e)) from e
+        raise
+    items = []
+    for row in rows:
+        item = ComponentInfoRecord.from_row(row[:-1]).to_dict()
+        item["score"] = round(-row[-1], 4)
+        items.append(item)
+    return {"total": total, "items": items}
+
+
+class CatalogSnapshot:
+    """Một version đã publish: file snapshot và (nếu đã nạp) các record trong bộ nhớ."""
+    __slots__ = ("version", "path", "_by_search", "_info", "_text_pages", "_cache_lock", "_facet_rows", "_facet_pages")
+
+    def __init__(self, version: str, path: str):
+        self.version = version
+        self.path = path
+        self._by_search: Optional[Dict[SearchKey, Tuple[ComponentRecord, ...]]] = None
+        self._info: Dict[Tuple[int, str], Tuple[ComponentInfoRecord, ...]] = {}
+        self._text_pages: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+        self._cache_lock = threading.Lock()
+        self._facet_rows: Optional[List[Tuple[SearchKey, int]]] = None
+        self._facet_pages: Dict[SearchKey, Dict[str, Any]] = {}
+
+    def connect(self) -> sqlite3.Connection:
+        return connect_snapshot(self.path)
+
+    def load(self) -> "CatalogSnapshot":
+        conn = self.connect()
+        try:
+            by_search: Dict[SearchKey, List[ComponentRecord]] = defaultdict(list)
+            for row in conn.execute(f"SELECT {ComponentRecord.columns()} FROM components_list ORDER BY id;"):
+                record = ComponentRecord.from_row(row)
+                try:
+                    key = search_key(record.nbphase, record.thickness, record.width, record.poles, record.shape)
+                except (TypeError, ValueError):
+                    continue
+                by_search[key].append(record)
+            info: Dict[Tuple[int, str], List[ComponentInfoRecord]] = defaultdict(list)
+            for row in conn.execute(f"SELECT {ComponentInfoRecord.columns()} FROM components_info;"):
+                record = ComponentInfoRecord.from_row(row)
+                info[(record.nbphase, record.key)].append(record)
+        finally:
+            conn.close()
+        self._by_search = {key: tuple(records) for key, records in by_search.items()}
+        self._info = {key: tuple(records) for key, records in info.items()}
+        return self
+
+    def search_text(self, text: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        search_text trên file snapshot. Xếp hạng bm25 phải chấm điểm mọi dòng khớp (từ phổ biến:
+        hàng chục ms), nên các trang đã tính được giữ lại theo (truy vấn, limit, offset).
+        """
+        key = (fts_query(text), limit, offset)
+        pages = self._text_pages
+        result = pages.get(key)
+        if result is None:
+            conn = self.connect()
+            try:
+                result = search_text(conn, text, limit, offset)
+            finally:
+                conn.close()
+            with self._cache_lock:
+                if len(pages) >= CATALOG_PAGE_CACHE_SIZE:
+                    pages.pop(next(iter(pages)))
+                pages[key] = result
+        return result
+
+    def _load_facet_rows(self) -> List[Tuple[SearchKey, int]]:
+        conn = self.connect()
+        try:
+            try:
+                rows = conn.execute(f"SELECT * FROM {FACETS_TABLE};").fetchall()
+            except sqlite3.OperationalError:
+                # snapshot publish trước khi có catalog_facets: tính từ components_list
+                rows = conn.execute(f"{FACETS_SQL};").fetchall()
+        finally:
+            conn.close()
+        facet_rows = []
+        for row in rows:
+            try:
+                facet_rows.append((search_key(*row[:5]), row[5]))
+            except (TypeError, ValueError):
+                continue
+        return facet_rows
+
+    def facets(self, nbphase=None, thickness=None, width=None, poles=None, shape=None) -> Dict[str, Any]:
+        """
+        Giá trị khả dụng của từng trường trong form và số sản phẩm tương ứng, với các trường
+        đã chọn (None = chưa chọn). Như tìm kiếm có bộ lọc: số đếm của một trường tính theo mọi
+        lựa chọn khác trừ chính nó, nên vẫn thấy được các giá trị thay thế.
+        """
+        selection = (nbphase, thickness, width, poles, shape)
+        result = self._facet_pages.get(selection)
+        if result is not None:
+            return result
+        rows = self._facet_rows
+        if rows is None:
+            rows = self._facet_rows = self._load_facet_rows()
+        counts: List[Dict[Any, int]] = [defaultdict(int) for _ in FACETS]
+        total = 0
+        for key, products in rows:
+            mismatch = -1
+            for index, wanted in enumerate(selection):
+                if wanted is not None and key[index] != wanted:
+                    if mismatch >= 0:
+                        break
+                    mismatch = index
+            else:
+                if mismatch >= 0:
+                    counts[mismatch][key[mismatch]] += products
+                    continue
+                total += products
+                for index, value in enumerate(key):
+                    counts[index][value] += products
+        result = {
+            "products": total,
+            "facets": {
+                name: [{"value": value, "products": n} for value, n in sorted(counts[index].items())]
+                for index, name in enumerate(FACETS)
+            },
+        }
+        with self._cache_lock:
+            if len(self._facet_pages) >= CATALOG_PAGE_CACHE_SIZE:
+                self._facet_pages.pop(next(iter(self._facet_pages)))
+            self._facet_pages[selection] = result
+        return result
+
+    def search(self, nbphase, thickness, width, poles, shape) -> List[Match]:
+        """Như truy vấn components_list + components_info: list (component, các dòng info của nó)."""
+        if self._by_search is None:
+            raise RuntimeError(f"catalog v{self.version} is not loaded in memory")
+        info = self._info
+        return [
+            (component, info.get((component.nbphase, component.component_id), ()))
+            for component in self._by_search.get(search_key(nbphase, thickness, width, poles, shape), ())
+        ]
+
+
+class Catalog:
+    def __init__(
+        self,
+        snapshot_dir: str = CATALOG_SNAPSHOT_DIR,
+        version_file: str = CATALOG_VERSION_FILE,
+        poll_seconds: float = CATALOG_POLL_SECONDS,
+        in_memory: bool = CATALOG_CACHE,
+    ):
+        self.snapshot_dir = snapshot_dir
+        self.version_file = version_file
+        self.poll_seconds = poll_seconds
+        self.in_memory = in_memory
+        self._current: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_version(self) -> str:
+        try:
+            with open(self.version_file, encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def ensure_published(self) -> str:
+        """Version đang publish; nếu chưa có snapshot nào thì publish staging hiện tại (lần chạy đầu)."""
+        version = self._read_version()
+        if version:
+            return version
+        from database.catalog_publish import CatalogPublishInProgress, publish
+        deadline = time.monotonic() + CATALOG_PUBLISH_TIMEOUT
+        while True:
+            try:
+                return str(publish(published_by="startup", snapshot_dir=self.snapshot_dir, version_file=self.version_file)["version"])
+            except CatalogPublishInProgress:
+                # process khác đang publish: chờ nó ghi con trỏ
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+                version = self._read_version()
+                if version:
+                    return version
+
+    def load(self) -> CatalogSnapshot:
+        """Chuyển sang version đang publish; snapshot mới được gán một lần nên request đang đọc không thấy trạng thái dở dang."""
+        started = time.perf_counter()
+        version = self.ensure_published()
+        snapshot = CatalogSnapshot(version, snapshot_path(version, self.snapshot_dir))
+        if self.in_memory:
+            snapshot.load()
+        self._current = snapshot
+        self._checked_at = time.monotonic()
+        logger.info(
+            "Catalog v%s loaded: %d search keys, %d components in %.1f ms",
+            version, len(snapshot._by_search or ()), len(snapshot._info), (time.perf_counter() - started) * 1000,
+        )
+        return snapshot
+
+    def current(self) -> CatalogSnapshot:
+        """Snapshot đang dùng; dùng cùng một object cho cả lượt tìm kiếm và version trả về cho client."""
+        now = time.monotonic()
+        current = self._current
+        if current is not None and now - self._checked_at < self.poll_seconds:
+            return current
+        with self._lock:
+            current = self._current
+            if current is not None and now - self._checked_at < self.poll_seconds:
+                return current
+            if current is None or self._read_version() != current.version:
+                return self.load()
+            self._checked_at = now
+            return current
+
+    @property
+    def version(self) -> str:
+        return self.current().version
+
+    def search(self, nbphase, thickness, width, poles, shape) -> List[Match]:
+        return self.current().search(nbphase, thickness, width, poles, shape)
+
+    def refresh(self) -> CatalogSnapshot:
+        """Gọi sau khi publish: worker hiện tại chuyển ngay, các worker khác chuyển ở lần poll kế tiếp."""
+        with self._lock:
+            self._checked_at = 0.0
+        return self.current()
+
+
+catalog = Catalog()
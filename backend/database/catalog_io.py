@@ -0,0 +1,531 @@
+"""
+Bulk import/export of the product catalog (components_info + components_list).
+
+    python -m database.catalog_io import catalog.json [--db berlivn.db] [--replace] [--dry-run] [--publish]
+    python -m database.catalog_io import info.csv list.csv
+    python -m database.catalog_io import catalog.xlsx
+    python -m database.catalog_io export catalog.json [--db berlivn.db]
+    python -m database.catalog_io export info.csv --table components_info
+
+Định dạng:
+    JSON  {"components_info": [{...}], "components_list": [{...}]}
+    XLSX  sheet "components_info" và/hoặc "components_list", dòng đầu là tên cột
+    CSV   một bảng mỗi file, bảng được nhận ra từ dòng tiêu đề (có component_id -> components_list)
+
+Toàn bộ file được kiểm tra trước khi ghi (kiểu dữ liệu, cột bắt buộc, dòng trùng,
+components_list trỏ tới component không tồn tại); có lỗi thì không ghi gì.
+Dữ liệu được nạp bằng executemany trong một transaction, index phụ của
+components_list bị bỏ trong lúc nạp và tạo lại ở cuối; khi nạp nhiều dòng
+components_info, trigger đồng bộ FTS cũng bị bỏ và chỉ mục full-text được dựng lại một lần.
+
+merge (mặc định): components_info được upsert theo (key, nbphase); mọi component có
+dòng components_list trong file được thay toàn bộ danh sách bằng các dòng trong file.
+replace: xóa toàn bộ catalog trước khi nạp. dry-run: chạy hết rồi rollback.
+
+Import ghi vào staging (database/catalog_publish.py): tìm kiếm chỉ thấy dữ liệu mới
+sau khi publish (--publish hoặc POST /admin/catalog/publish).
+"""
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from catalog import FTS_TABLE
+from database.catalog_publish import CatalogPublishInProgress, publish, snapshot_paths
+from database.database import Database
+from database.migrations import run_migrations
+
+INFO_TABLE = "components_info"
+LIST_TABLE = "components_list"
+TABLES = (INFO_TABLE, LIST_TABLE)
+
+# số lỗi tối đa được trả về (kiểm tra vẫn chạy hết file)
+MAX_ERRORS = 100
+EXPORT_BATCH = 1000
+
+
+class CatalogImportError(Exception):
+	"""Raised when import files are unreadable or fail validation; nothing has been written."""
+	def __init__(self, errors: List[str], total: Optional[int] = None):
+		self.errors = errors[:MAX_ERRORS]
+		self.total = total if total is not None else len(errors)
+		super().__init__(f"{self.total} validation error(s): " + "; ".join(self.errors[:5]))
+
+
+def _text(value: Any) -> Optional[str]:
+	if type(value) is str:
+		return value.strip()
+	if value is None:
+		return None
+	if isinstance(value, float) and value.is_integer():
+		value = int(value)  # ô số trong XLSX/JSON cho cột text (vd. numart 100245)
+	return str(value).strip()
+
+
+def _int(value: Any) -> Optional[int]:
+	if type(value) is int:
+		return value
+	if value is None or (isinstance(value, str) and not value.strip()):
+		return None
+	if isinstance(value, bool):
+		raise ValueError(f"expected an integer, got {value!r}")
+	number = float(value)
+	if not number.is_integer():
+		raise ValueError(f"expected an integer, got {value!r}")
+	return int(number)
+
+
+def _real(value: Any) -> Optional[float]:
+	if type(value) is float or type(value) is int:
+		return float(value)
+	if value is None or (isinstance(value, str) and not value.strip()):
+		return None
+	if isinstance(value, bool):
+		raise ValueError(f"expected a number, got {value!r}")
+	return float(value)
+
+
+# cột -> (hàm chuyển kiểu, bắt buộc); thứ tự cột cũng là thứ tự khi export
+INFO_COLUMNS: Dict[str, Tuple[Callable[[Any], Any], bool]] = {
+	"key": (_text, True),
+	"nbphase": (_int, True),
+	"Amini": (_int, False),
+	"Amaxi": (_int, False),
+	"angle": (_int, False),
+	"resmini": (_real, False),
+	"typesupport": (_text, False),
+	"Bmini": (_int, False),
+	"largeurmodule": (_int, False),
+	"img1Article": (_text, False),
+	"img2Article": (_text, False),
+	"numart": (_text, False),
+	"info": (_text, False),
+	"a_list": (_text, False),
+}
+LIST_COLUMNS: Dict[str, Tuple[Callable[[Any], Any], bool]] = {
+	"nbphase": (_int, True),
+	"thickness": (_real, True),
+	"width": (_real, True),
+	"poles": (_int, True),
+	"shape": (_text, True),
+	"component_id": (_text, True),
+}
+COLUMNS = {INFO_TABLE: INFO_COLUMNS, LIST_TABLE: LIST_COLUMNS}
+# cột có trong export/DB nhưng không được nạp (id phụ thuộc môi trường)
+IGNORED_COLUMNS = {"id"}
+
+
+# ---- đọc file ----
+
+_XLSX_NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+_XLSX_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+
+def _column_number(ref: str) -> int:
+	letters = re.match(r"[A-Z]+", ref).group(0)
+	number = 0
+	for ch in letters:
+		number = number * 26 + ord(ch) - 64
+	return number - 1
+
+
+def _xlsx_value(cell, shared: List[str]) -> Any:
+	kind = cell.get("t")
+	if kind == "inlineStr":
+		return "".join(t.text or "" for t in cell.iterfind(".//m:t", _XLSX_NS))
+	v = cell.find("m:v", _XLSX_NS)
+	if v is None or v.text is None:
+		return None
+	if kind == "s":
+		return shared[int(v.text)]
+	if kind == "b":
+		return v.text == "1"
+	if kind in ("str", "e"):
+		return v.text
+	number = float(v.text)
+	return int(number) if number.is_integer() else number
+
+
+def read_xlsx(data: bytes) -> Dict[str, List[List[Any]]]:
+	"""Đọc mọi sheet của file XLSX (chỉ giá trị ô, không cần openpyxl): tên sheet -> các dòng."""
+	try:
+		book = zipfile.ZipFile(io.BytesIO(data))
+	except zipfile.BadZipFile:
+		raise CatalogImportError(["not a valid XLSX file"])
+	try:
+		with book:
+			return _read_sheets(book)
+	except (KeyError, ValueError, ElementTree.ParseError) as e:
+		raise CatalogImportError([f"unreadable XLSX file ({e})"])
+
+
+def _read_sheets(book: zipfile.ZipFile) -> Dict[str, List[List[Any]]]:
+	shared: List[str] = []
+	if "xl/sharedStrings.xml" in book.namelist():
+		for si in ElementTree.fromstring(book.read("xl/sharedStrings.xml")).iterfind("m:si", _XLSX_NS):
+			shared.append("".join(t.text or "" for t in si.iterfind(".//m:t", _XLSX_NS)))
+	rels = ElementTree.fromstring(book.read("xl/_rels/workbook.xml.rels"))
+	targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+	sheets = {}
+	for sheet in ElementTree.fromstring(book.read("xl/workbook.xml")).iterfind(".//m:sheet", _XLSX_NS):
+		target = targets[sheet.get(_XLSX_REL)]
+		path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+		rows = []
+		for row in ElementTree.fromstring(book.read(path)).iterfind(".//m:sheetData/m:row", _XLSX_NS):
+			values: Dict[int, Any] = {}
+			for position, cell in enumerate(row.iterfind("m:c", _XLSX_NS)):
+				ref = cell.get("r")
+				values[_column_number(ref) if ref else position] = _xlsx_value(cell, shared)
+			rows.append([values.get(i) for i in range(max(values) + 1)] if values else [])
+		sheets[sheet.get("name")] = rows
+	return sheets
+
+
+def _table_from_header(header: Iterable[str]) -> Optional[str]:
+	header = set(header)
+	if "component_id" in header:
+		return LIST_TABLE
+	if "key" in header:
+		return INFO_TABLE
+	return None
+
+
+def _records(rows: List[List[Any]], source: str) -> Tuple[List[str], List[Tuple[str, Dict[str, Any]]]]:
+	"""Dòng đầu là tiêu đề; trả về (tiêu đề, [(vị trí, dict cột -> giá trị)]) bỏ qua dòng trống."""
+	if not rows:
+		return [], []
+	header = [str(h).strip() if h is not None else "" for h in rows[0]]
+	records = []
+	for number, row in enumerate(rows[1:], start=2):
+		if all(v is None or (isinstance(v, str) and not v.strip()) for v in row):
+			continue
+		records.append((f"{source} row {number}", dict(zip(header, row))))
+	return header, records
+
+
+def parse_file(name: str, data: bytes) -> Dict[str, List[Tuple[str, Dict[str, Any]]]]:
+	"""Đọc một file import (theo đuôi .json/.csv/.xlsx): bảng -> [(vị trí, bản ghi)]."""
+	suffix = Path(name).suffix.lower()
+	parsed: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {}
+	if suffix == ".json":
+		try:
+			document = json.loads(data)
+		except ValueError as e:
+			raise CatalogImportError([f"{name}: invalid JSON ({e})"])
+		if not isinstance(document, dict) or not set(document) & set(TABLES):
+			raise CatalogImportError([f"{name}: expected an object with {' and/or '.join(TABLES)}"])
+		for table in TABLES:
+			items = document.get(table) or []
+			if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+				raise CatalogImportError([f"{name}: {table} must be a list of objects"])
+			parsed[table] = [(f"{name} {table}[{i}]", item) for i, item in enumerate(items)]
+	elif suffix == ".csv":
+		try:
+			text = data.decode("utf-8-sig")
+		except UnicodeDecodeError:
+			raise CatalogImportError([f"{name}: CSV must be UTF-8"])
+		try:
+			dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+		except csv.Error:
+			dialect = csv.excel
+		header, records = _records(list(csv.reader(io.StringIO(text), dialect)), name)
+		table = _table_from_header(header)
+		if table is None:
+			raise CatalogImportError([f"{name}: cannot tell the table from the header (needs key or component_id)"])
+		parsed[table] = records
+	elif suffix == ".xlsx":
+		for sheet, rows in read_xlsx(data).items():
+			header, records = _records(rows, f"{name}:{sheet}")
+			table = sheet if sheet in TABLES else _table_from_header(header)
+			if table is None:
+				continue
+			parsed.setdefault(table, []).extend(records)
+		if not parsed:
+			raise CatalogImportError([f"{name}: no components_info or components_list sheet"])
+	else:
+		raise CatalogImportError([f"{name}: unsupported file type (use .json, .csv or .xlsx)"])
+	return parsed
+
+
+# ---- kiểm tra ----
+
+def validate(records: Dict[str, List[Tuple[str, Dict[str, Any]]]], existing_components: Iterable[Tuple[str, int]] = ()) -> Tuple[Dict[Tuple[str, ...], List[tuple]], List[tuple], List[str]]:
+	"""
+	Chuẩn hóa và kiểm tra các bản ghi. existing_components: (key, nbphase) đã có trong DB
+	(được phép làm đích cho components_list). Trả về (dòng components_info nhóm theo các cột
+	có trong bản ghi, dòng components_list, lỗi). Cột components_info không có trong bản ghi
+	không được ghi, nên merge giữ nguyên giá trị cũ của cột đó.
+	"""
+	errors: List[str] = []
+	info_groups: Dict[Tuple[str, ...], List[tuple]] = {}
+	list_rows: List[tuple] = []
+	for table in TABLES:
+		spec = COLUMNS[table]
+		allowed = set(spec) | IGNORED_COLUMNS | {""}
+		# bố cục (các cột) được tính một lần cho mỗi tập tiêu đề; CSV/XLSX chỉ có một
+		layouts: Dict[tuple, Tuple[List[str], Tuple[str, ...]]] = {}
+		seen: Dict[tuple, str] = {}
+		for where, record in records.get(table, ()):
+			keys = tuple(record)
+			layout = layouts.get(keys)
+			if layout is None:
+				present = set(keys)
+				columns = tuple(c for c in spec if c in present or spec[c][1] or table == LIST_TABLE)
+				layout = layouts[keys] = (sorted(present - allowed), columns)
+			unknown, columns = layout
+			if unknown:
+				errors.append(f"{where}: unknown column(s) {unknown}")
+				continue
+			values = []
+			ok = True
+			for column in columns:
+				convert, required = spec[column]
+				try:
+					value = convert(record.get(column))
+				except (TypeError, ValueError):
+					errors.append(f"{where}: invalid {column} {record.get(column)!r}")
+					ok = False
+					continue
+				if required and (value is None or value == ""):
+					errors.append(f"{where}: {column} is required")
+					ok = False
+				values.append(value)
+			if not ok:
+				continue
+			row = tuple(values)
+			identity = row[:2] if table == INFO_TABLE else row
+			if identity in seen:
+				errors.append(f"{where}: duplicate of {seen[identity]}")
+				continue
+			seen[identity] = where
+			if table == INFO_TABLE:
+				info_groups.setdefault(columns, []).append(row)
+			else:
+				list_rows.append(row)
+
+	known = {row[:2] for rows in info_groups.values() for row in rows} | set(existing_components)
+	missing: Dict[Tuple[str, int], int] = {}
+	for nbphase, _, _, _, _, component_id in list_rows:
+		if (component_id, nbphase) not in known:
+			missing[(component_id, nbphase)] = missing.get((component_id, nbphase), 0) + 1
+	for (component_id, nbphase), count in sorted(missing.items()):
+		errors.append(f"{LIST_TABLE}: {count} row(s) for unknown component {component_id!r} (nbphase {nbphase})")
+	return info_groups, list_rows, errors
+
+
+# ---- nạp ----
+
+def import_catalog(files: List[Tuple[str, bytes]], db: Optional[Database] = None, mode: str = "merge", dry_run: bool = False) -> Dict[str, Any]:
+	"""
+	files: [(tên file, nội dung)]. mode: "merge" hoặc "replace". Ném CatalogImportError
+	nếu file không đọc được hoặc không hợp lệ (khi đó DB không thay đổi).
+	"""
+	if mode not in ("merge", "replace"):
+		raise ValueError(f"unknown import mode: {mode}")
+	started = time.perf_counter()
+	records: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {INFO_TABLE: [], LIST_TABLE: []}
+	for name, data in files:
+		for table, items in parse_file(name, data).items():
+			records[table].extend(items)
+
+	db = db or Database()
+	run_migrations(db)
+	conn = db._connect()
+	try:
+		existing = set() if mode == "replace" else {
+			(key, nbphase) for key, nbphase in conn.execute(f"SELECT key, nbphase FROM {INFO_TABLE};")
+		}
+		info_groups, list_rows, errors = validate(records, existing)
+		if errors:
+			raise CatalogImportError(errors)
+		validated_at = time.perf_counter()
+
+		conn.execute("BEGIN;")
+		# nạp nhiều so với catalog hiện có: bỏ trigger đồng bộ FTS, dựng lại chỉ mục một lần ở cuối
+		triggers = []
+		if mode == "replace" or sum(len(rows) for rows in info_groups.values()) > len(existing) // 4:
+			triggers = [
+				(name, sql) for name, sql in conn.execute(
+					"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ? AND name LIKE ?;",
+					(INFO_TABLE, f"{FTS_TABLE}_%"),
+				)
+			]
+			for name, _ in triggers:
+				conn.execute(f'DROP TRIGGER "{name}";')
+		if mode == "replace":
+			deleted = conn.execute(f"DELETE FROM {LIST_TABLE};").rowcount
+			conn.execute(f"DELETE FROM {INFO_TABLE};")
+		else:
+			# xóa trước khi bỏ index: dùng idx_components_list_component
+			deleted = conn.executemany(
+				f"DELETE FROM {LIST_TABLE} WHERE component_id = ? AND nbphase = ?;",
+				sorted({(component_id, nbphase) for nbphase, _, _, _, _, component_id in list_rows}),
+			).rowcount
+		indexes = [
+			(name, sql) for name, sql in conn.execute(
+				"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL;",
+				(LIST_TABLE,),
+			)
+		]
+		for name, _ in indexes:
+			conn.execute(f'DROP INDEX "{name}";')
+
+		for columns, rows in info_groups.items():
+			updates = ", ".join(f"{c} = excluded.{c}" for c in columns[2:])
+			conn.executemany(
+				f"INSERT INTO {INFO_TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+				f"ON CONFLICT (key, nbphase) DO {f'UPDATE SET {updates}' if updates else 'NOTHING'};",
+				rows,
+			)
+		info_keys = [row[:2] for rows in info_groups.values() for row in rows]
+		updated = sum(1 for key in info_keys if key in existing)
+		list_columns = list(LIST_COLUMNS)
+		# sắp theo thứ tự của index tìm kiếm để tạo lại index nhanh hơn
+		conn.executemany(
+			f"INSERT INTO {LIST_TABLE} ({', '.join(list_columns)}) VALUES ({', '.join('?' for _ in list_columns)});",
+			sorted(list_rows, key=lambda r: (r[0], r[1], r[2], r[3], r[4])),
+		)
+		loaded_at = time.perf_counter()
+		for _, sql in indexes:
+			conn.execute(sql)
+		if triggers:
+			conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild');")
+			for _, sql in triggers:
+				conn.execute(sql)
+		if dry_run:
+			conn.rollback()
+		else:
+			conn.commit()
+	except Exception:
+		if conn.in_transaction:
+			conn.rollback()
+		raise
+	finally:
+		conn.close()
+
+	done = time.perf_counter()
+	return {
+		"mode": mode,
+		"dry_run": dry_run,
+		INFO_TABLE: {"inserted": len(info_keys) - updated, "updated": updated},
+		LIST_TABLE: {"deleted": deleted, "inserted": len(list_rows)},
+		"validate_seconds": round(validated_at - started, 3),
+		"load_seconds": round(loaded_at - validated_at, 3),
+		"index_seconds": round(done - loaded_at, 3),
+	}
+
+
+# ---- export ----
+
+def _export_rows(conn, table: str) -> Iterator[List[tuple]]:
+	columns = list(COLUMNS[table])
+	order = "key, nbphase" if table == INFO_TABLE else "component_id, nbphase, thickness, width, poles, shape"
+	cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {order};")
+	while True:
+		batch = cursor.fetchmany(EXPORT_BATCH)
+		if not batch:
+			return
+		yield batch
+
+
+def iter_export(fmt: str = "json", table: Optional[str] = None, db: Optional[Database] = None) -> Iterator[str]:
+	"""
+	Sinh nội dung export theo từng khối (không giữ cả catalog trong bộ nhớ).
+	json: cả hai bảng (hoặc chỉ `table`); csv: một bảng, bắt buộc có `table`.
+	"""
+	if fmt not in ("json", "csv"):
+		raise ValueError(f"unknown export format: {fmt}")
+	if table is not None and table not in TABLES:
+		raise ValueError(f"unknown table: {table}")
+	if fmt == "csv" and table is None:
+		raise ValueError("csv export needs a table")
+	tables = [table] if table else list(TABLES)
+	conn = (db or Database())._connect()
+	try:
+		if fmt == "csv":
+			buffer = io.StringIO()
+			writer = csv.writer(buffer, lineterminator="\n")
+			writer.writerow(COLUMNS[table])
+			for batch in _export_rows(conn, table):
+				writer.writerows(batch)
+				yield buffer.getvalue()
+				buffer.seek(0)
+				buffer.truncate()
+			yield buffer.getvalue()
+			return
+		yield "{"
+		for position, name in enumerate(tables):
+			columns = list(COLUMNS[name])
+			yield f'{"," if position else ""}"{name}":['
+			first = True
+			for batch in _export_rows(conn, name):
+				chunk = ",\n".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) for row in batch)
+				yield ("\n" if first else ",\n") + chunk
+				first = False
+			yield "]"
+		yield "}\n"
+	finally:
+		conn.close()
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	sub = parser.add_subparsers(dest="command", required=True)
+
+	p = sub.add_parser("import", help="validate and bulk-load catalog files")
+	p.add_argument("files", type=Path, nargs="+")
+	p.add_argument("--db", type=Path, default=None, help="database path (default: berlivn.db)")
+	p.add_argument("--replace", action="store_true", help="delete the whole catalog first")
+	p.add_argument("--dry-run", action="store_true", help="validate and load, then roll back")
+	p.add_argument("--publish", action="store_true", help="publish a new catalog version after importing")
+
+	p = sub.add_parser("export", help="write the catalog to a file")
+	p.add_argument("file", type=Path)
+	p.add_argument("--db", type=Path, default=None, help="database path (default: berlivn.db)")
+	p.add_argument("--table", choices=TABLES, default=None, help="only this table (required for .csv)")
+
+	args = parser.parse_args()
+	if args.command == "import":
+		try:
+			result = import_catalog(
+				[(path.name, path.read_bytes()) for path in args.files],
+				Database(args.db), "replace" if args.replace else "merge", args.dry_run,
+			)
+		except CatalogImportError as e:
+			for error in e.errors:
+				print(error, file=sys.stderr)
+			if e.total > len(e.errors):
+				print(f"... {e.total - len(e.errors)} more", file=sys.stderr)
+			raise SystemExit(f"error: {e.total} validation error(s), nothing imported")
+		if args.publish and not args.dry_run:
+			try:
+				db = Database(args.db)
+				snapshot_dir, version_file = snapshot_paths(db)
+				result["published"] = publish(db, published_by="catalog_io", snapshot_dir=snapshot_dir, version_file=version_file)
+			except CatalogPublishInProgress as e:
+				raise SystemExit(f"error: imported but not published: {e}")
+		print(json.dumps(result))
+	else:
+		fmt = "csv" if args.file.suffix.lower() == ".csv" else "json"
+		started = time.perf_counter()
+		tmp = Path(str(args.file) + ".tmp")
+		try:
+			with open(tmp, "w", encoding="utf-8", newline="") as f:
+				for chunk in iter_export(fmt, args.table, Database(args.db)):
+					f.write(chunk)
+		except ValueError as e:
+			tmp.unlink(missing_ok=True)
+			raise SystemExit(f"error: {e}")
+		tmp.replace(args.file)
+		print(f"Exported to {args.file} ({args.file.stat().st_size} bytes) in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+	main()
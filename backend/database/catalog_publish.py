@@ -0,0 +1,346 @@
+"""
+Publish the staged catalog as an immutable, versioned SQLite snapshot.
+
+    python -m database.catalog_publish publish [--db berlivn.db]
+    python -m database.catalog_publish status [--db berlivn.db]
+    python -m database.catalog_publish discard [--db berlivn.db]
+    python -m database.catalog_publish versions [--db berlivn.db]
+
+Với --db khác DB mặc định, snapshot và con trỏ CURRENT nằm trong catalog-snapshots/ cạnh
+file DB đó (snapshot_paths), không dùng CATALOG_SNAPSHOT_DIR/CATALOG_VERSION_FILE.
+
+components_info/components_list trong DB chính là vùng staging: /createComponent,
+/updateComponent, /deleteComponent và /admin/catalog/import chỉ ghi vào đó, tìm kiếm
+không thấy gì cho đến khi publish.
+
+publish() giữ chỗ số version bằng một dòng 'building' trong catalog_versions (hai
+lần publish cùng lúc -> CatalogPublishInProgress), chép hai bảng trong một
+transaction đọc (cùng một trạng thái của staging) sang file tạm, tạo index, ANALYZE,
+fsync rồi os.replace thành catalog-v000012.db. Các bảng tính sẵn cho phía đọc
+(chỉ mục full-text, catalog_facets) được dựng trong cùng file. Cuối cùng ghi số version vào
+CATALOG_VERSION_FILE (cũng bằng os.replace): worker tìm kiếm thấy con trỏ đổi và
+chuyển sang file mới. File đã publish không bao giờ bị sửa (điều kiện để mở với
+immutable=1); chỉ CATALOG_KEEP_SNAPSHOTS file mới nhất được giữ lại.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from catalog import (
+	CATALOG_PUBLISH_TIMEOUT, CATALOG_SNAPSHOT_DIR, CATALOG_VERSION_FILE, FACETS_SQL, FACETS_TABLE, FTS_TABLE,
+	ComponentInfoRecord, ComponentRecord, connect_snapshot, snapshot_path,
+)
+from database.database import DB_PATH, Database
+from database.migrations import run_migrations
+from log import get_logger
+
+logger = get_logger(__name__)
+
+INFO_TABLE = "components_info"
+LIST_TABLE = "components_list"
+# ngoài version đang publish, giữ thêm vài file cũ cho worker chưa kịp chuyển version
+CATALOG_KEEP_SNAPSHOTS = max(2, int(os.getenv("CATALOG_KEEP_SNAPSHOTS", "3")))
+# số dòng tối đa mỗi loại trong báo cáo staged_changes
+DIFF_LIMIT = 100
+
+
+class CatalogPublishInProgress(Exception):
+	"""Một lần publish khác đang chạy."""
+
+
+class CatalogNotPublished(Exception):
+	"""Chưa có version nào được publish."""
+
+
+def _fsync(path: str) -> None:
+	fd = os.open(path, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+def _write_pointer(version_file: str, version: int) -> None:
+	tmp = f"{version_file}.{os.getpid()}.tmp"
+	with open(tmp, "w", encoding="utf-8") as f:
+		f.write(str(version))
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp, version_file)
+	if hasattr(os, "O_DIRECTORY"):
+		_fsync(os.path.dirname(os.path.abspath(version_file)))
+
+
+def snapshot_paths(db: Database) -> Tuple[str, str]:
+	"""
+	(snapshot_dir, version_file) của db: CATALOG_SNAPSHOT_DIR/CATALOG_VERSION_FILE cho DB mặc định,
+	còn DB khác (--db) thì catalog-snapshots/CURRENT cạnh file DB đó, để không publish nhầm
+	snapshot của DB này vào con trỏ của DB mặc định.
+	"""
+	if Path(db.path).resolve() == Path(DB_PATH).resolve():
+		return CATALOG_SNAPSHOT_DIR, CATALOG_VERSION_FILE
+	snapshot_dir = str(Path(db.path).parent / "catalog-snapshots")
+	return snapshot_dir, os.path.join(snapshot_dir, "CURRENT")
+
+
+def read_pointer(version_file: str = CATALOG_VERSION_FILE) -> Optional[int]:
+	try:
+		with open(version_file, encoding="utf-8") as f:
+			value = f.read().strip()
+	except FileNotFoundError:
+		return None
+	return int(value) if value else None
+
+
+def _reserve_version(conn: sqlite3.Connection, published_by: Optional[str]) -> int:
+	"""Giữ chỗ số version kế tiếp trong một câu lệnh; dòng 'building' quá CATALOG_PUBLISH_TIMEOUT coi như đã chết."""
+	with conn:
+		conn.execute(
+			"UPDATE catalog_versions SET status = 'failed' WHERE status = 'building' AND created_at < datetime('now', ?);",
+			(f"-{int(CATALOG_PUBLISH_TIMEOUT)} seconds",),
+		)
+		cur = conn.execute(
+			"""
+			INSERT INTO catalog_versions (version, status, published_by)
+			SELECT next_version, 'building', ? FROM (SELECT COALESCE(MAX(version), 0) + 1 AS next_version FROM catalog_versions)
+			WHERE NOT EXISTS (SELECT 1 FROM catalog_versions WHERE status = 'building');
+			""",
+			(published_by,),
+		)
+		if cur.rowcount == 0:
+			raise CatalogPublishInProgress("another catalog publish is in progress")
+		return cur.lastrowid
+
+
+def _build_snapshot(path: str, staging_path: str, version: int, published_by: Optional[str]) -> Dict[str, int]:
+	"""Chép staging sang file mới `path`; trả về số dòng của mỗi bảng."""
+	conn = sqlite3.connect(Path(path).resolve().as_uri(), uri=True, isolation_level=None)
+	try:
+		# file tạm: lỗi giữa chừng thì xóa cả file, không cần journal
+		conn.execute("PRAGMA journal_mode = OFF;")
+		conn.execute("PRAGMA synchronous = OFF;")
+		conn.execute("ATTACH DATABASE ? AS staging;", (f"{Path(staging_path).resolve().as_uri()}?mode=ro",))
+		# một transaction: hai bảng được đọc từ cùng một trạng thái của staging
+		conn.execute("BEGIN;")
+		schema = conn.execute(
+			"SELECT type, sql FROM staging.sqlite_master WHERE tbl_name IN (?, ?) AND sql IS NOT NULL ORDER BY type = 'index', name;",
+			(INFO_TABLE, LIST_TABLE),
+		).fetchall()
+		for kind, sql in schema:
+			if kind == "table":
+				conn.execute(sql)
+		info_rows = conn.execute(
+			f"INSERT INTO {INFO_TABLE} ({ComponentInfoRecord.columns()}) "
+			f"SELECT {ComponentInfoRecord.columns()} FROM staging.{INFO_TABLE} ORDER BY key, nbphase;"
+		).rowcount
+		list_rows = conn.execute(
+			f"INSERT INTO {LIST_TABLE} ({ComponentRecord.columns()}) "
+			f"SELECT {ComponentRecord.columns()} FROM staging.{LIST_TABLE} ORDER BY id;"
+		).rowcount
+		for kind, sql in schema:
+			if kind == "index":
+				conn.execute(sql)
+		# chỉ mục full-text dựng lại một lần từ dữ liệu đã chép (rowid trong snapshot khác staging)
+		fts = conn.execute("SELECT sql FROM staging.sqlite_master WHERE type = 'table' AND name = ?;", (FTS_TABLE,)).fetchone()
+		if fts:
+			conn.execute(fts[0])
+			conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild');")
+		# giá trị của form tìm kiếm và số sản phẩm của từng tổ hợp (catalog.CatalogSnapshot.facets)
+		conn.execute(
+			f"CREATE TABLE {FACETS_TABLE} (nbphase INTEGER, thickness REAL, width REAL, poles INTEGER, shape TEXT, products INTEGER NOT NULL, "
+			"PRIMARY KEY (nbphase, thickness, width, poles, shape)) WITHOUT ROWID;"
+		)
+		conn.execute(f"INSERT INTO {FACETS_TABLE} {FACETS_SQL};")
+		conn.execute(
+			"CREATE TABLE snapshot_meta (version INTEGER NOT NULL, published_by TEXT, published_at TEXT NOT NULL, components INTEGER, list_rows INTEGER);"
+		)
+		conn.execute(
+			"INSERT INTO snapshot_meta VALUES (?, ?, datetime('now'), ?, ?);",
+			(version, published_by, info_rows, list_rows),
+		)
+		conn.execute("COMMIT;")
+		conn.execute("DETACH DATABASE staging;")
+		conn.execute("ANALYZE;")
+	finally:
+		conn.close()
+	_fsync(path)
+	return {INFO_TABLE: info_rows, LIST_TABLE: list_rows}
+
+
+def _prune(snapshot_dir: str, keep: int) -> List[str]:
+	files = sorted(Path(snapshot_dir).glob("catalog-v*.db"))
+	removed = []
+	for old in files[:-keep]:
+		try:
+			old.unlink()
+			removed.append(old.name)
+		except OSError as e:
+			logger.warning("Could not remove old catalog snapshot %s: %s", old, e)
+	return removed
+
+
+def publish(
+	db: Optional[Database] = None,
+	published_by: Optional[str] = None,
+	snapshot_dir: str = CATALOG_SNAPSHOT_DIR,
+	version_file: str = CATALOG_VERSION_FILE,
+) -> Dict[str, Any]:
+	"""
+	Publish staging thành version mới. Ném CatalogPublishInProgress nếu đang có lần
+	publish khác. Chỉ đổi con trỏ version; worker hiện tại gọi catalog.refresh() để chuyển ngay.
+	"""
+	started = time.perf_counter()
+	db = db or Database()
+	run_migrations(db)
+	os.makedirs(snapshot_dir, exist_ok=True)
+	conn = db._connect()
+	try:
+		version = _reserve_version(conn, published_by)
+		path = snapshot_path(version, snapshot_dir)
+		tmp = f"{path}.{os.getpid()}.tmp"
+		try:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+			counts = _build_snapshot(tmp, str(db.path), version, published_by)
+			os.replace(tmp, path)
+			with conn:
+				conn.execute(
+					"UPDATE catalog_versions SET status = 'published', file = ?, components = ?, list_rows = ?, published_at = datetime('now') WHERE version = ?;",
+					(os.path.basename(path), counts[INFO_TABLE], counts[LIST_TABLE], version),
+				)
+			_write_pointer(version_file, version)
+		except BaseException:
+			if os.path.exists(tmp):
+				os.remove(tmp)
+			with conn:
+				conn.execute("UPDATE catalog_versions SET status = 'failed' WHERE version = ?;", (version,))
+			raise
+	finally:
+		conn.close()
+	pruned = _prune(snapshot_dir, CATALOG_KEEP_SNAPSHOTS)
+	result = {
+		"version": version,
+		"file": os.path.basename(path),
+		INFO_TABLE: counts[INFO_TABLE],
+		LIST_TABLE: counts[LIST_TABLE],
+		"pruned": pruned,
+		"seconds": round(time.perf_counter() - started, 3),
+	}
+	logger.info("Catalog published", extra=result)
+	return result
+
+
+def _open_published(db: Database, snapshot_dir: str, version_file: str, staging_mode: str):
+	"""Kết nối tới snapshot đang publish (main) với staging được attach (staging)."""
+	version = read_pointer(version_file)
+	if version is None:
+		raise CatalogNotPublished("no catalog version has been published yet")
+	conn = connect_snapshot(snapshot_path(version, snapshot_dir))
+	conn.execute("ATTACH DATABASE ? AS staging;", (f"{Path(db.path).resolve().as_uri()}?mode={staging_mode}",))
+	return version, conn
+
+
+def staged_changes(
+	db: Optional[Database] = None,
+	snapshot_dir: str = CATALOG_SNAPSHOT_DIR,
+	version_file: str = CATALOG_VERSION_FILE,
+	limit: int = DIFF_LIMIT,
+) -> Dict[str, Any]:
+	"""Khác biệt giữa staging và version đang publish (chưa publish thì chưa ai thấy)."""
+	version, conn = _open_published(db or Database(), snapshot_dir, version_file, "ro")
+	info_columns = ComponentInfoRecord.columns()
+	list_columns = "nbphase, thickness, width, poles, shape, component_id"
+	queries = {
+		"added": f"SELECT key, nbphase FROM staging.{INFO_TABLE} EXCEPT SELECT key, nbphase FROM main.{INFO_TABLE}",
+		"removed": f"SELECT key, nbphase FROM main.{INFO_TABLE} EXCEPT SELECT key, nbphase FROM staging.{INFO_TABLE}",
+		"changed": f"""
+			SELECT key, nbphase FROM (
+				SELECT {info_columns} FROM staging.{INFO_TABLE} EXCEPT SELECT {info_columns} FROM main.{INFO_TABLE}
+			) WHERE (key, nbphase) IN (SELECT key, nbphase FROM main.{INFO_TABLE})
+		""",
+	}
+	try:
+		info = {}
+		for name, sql in queries.items():
+			info[f"{name}_total"] = conn.execute(f"SELECT COUNT(*) FROM ({sql});").fetchone()[0]
+			info[name] = [
+				{"key": key, "nbphase": nbphase}
+				for key, nbphase in conn.execute(f"SELECT * FROM ({sql}) ORDER BY key, nbphase LIMIT ?;", (limit,))
+			]
+		component_list = {
+			"added": conn.execute(
+				f"SELECT COUNT(*) FROM (SELECT {list_columns} FROM staging.{LIST_TABLE} EXCEPT SELECT {list_columns} FROM main.{LIST_TABLE});"
+			).fetchone()[0],
+			"removed": conn.execute(
+				f"SELECT COUNT(*) FROM (SELECT {list_columns} FROM main.{LIST_TABLE} EXCEPT SELECT {list_columns} FROM staging.{LIST_TABLE});"
+			).fetchone()[0],
+		}
+	finally:
+		conn.close()
+	pending = any(info[f"{name}_total"] for name in queries) or any(component_list.values())
+	return {"published_version": version, "pending": pending, INFO_TABLE: info, LIST_TABLE: component_list}
+
+
+def discard(
+	db: Optional[Database] = None,
+	snapshot_dir: str = CATALOG_SNAPSHOT_DIR,
+	version_file: str = CATALOG_VERSION_FILE,
+) -> Dict[str, Any]:
+	"""Bỏ mọi thay đổi chưa publish: staging được chép lại từ version đang publish, trong một transaction."""
+	version, conn = _open_published(db or Database(), snapshot_dir, version_file, "rw")
+	try:
+		conn.execute("BEGIN IMMEDIATE;")
+		for table in (LIST_TABLE, INFO_TABLE):
+			conn.execute(f"DELETE FROM staging.{table};")
+		counts = {}
+		for table, columns in ((INFO_TABLE, ComponentInfoRecord.columns()), (LIST_TABLE, ComponentRecord.columns())):
+			counts[table] = conn.execute(
+				f"INSERT INTO staging.{table} ({columns}) SELECT {columns} FROM main.{table};"
+			).rowcount
+		conn.commit()
+	except Exception:
+		if conn.in_transaction:
+			conn.rollback()
+		raise
+	finally:
+		conn.close()
+	logger.info("Catalog staging reset to published version %s", version)
+	return {"version": version, **counts}
+
+
+def list_versions(db: Optional[Database] = None, limit: int = 20, version_file: str = CATALOG_VERSION_FILE) -> Dict[str, Any]:
+	rows = (db or Database()).fetch_all(
+		"SELECT version, status, file, components, list_rows, published_by, created_at, published_at FROM catalog_versions ORDER BY version DESC LIMIT ?;",
+		(limit,),
+	)
+	return {"current": read_pointer(version_file), "versions": rows}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("command", choices=("publish", "status", "discard", "versions"))
+	parser.add_argument("--db", type=Path, default=None, help="database path (default: berlivn.db)")
+	args = parser.parse_args()
+	db = Database(args.db)
+	run_migrations(db)
+	snapshot_dir, version_file = snapshot_paths(db)
+	try:
+		if args.command == "publish":
+			result = publish(db, published_by="cli", snapshot_dir=snapshot_dir, version_file=version_file)
+		elif args.command == "status":
+			result = staged_changes(db, snapshot_dir, version_file)
+		elif args.command == "discard":
+			result = discard(db, snapshot_dir, version_file)
+		else:
+			result = list_versions(db, version_file=version_file)
+	except (CatalogPublishInProgress, CatalogNotPublished) as e:
+		raise SystemExit(f"error: {e}")
+	print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+	main()
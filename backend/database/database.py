@@ -1,8 +1,10 @@
+import os
 from pathlib import Path
 import sqlite3
 from typing import Any, Dict, List, Optional, Iterable
+from metrics import DB_LATENCY
 
-DB_PATH = Path(__file__).parents[1] / "berlivn.db"
+DB_PATH = Path(os.getenv("BERLIVN_DB", Path(__file__).parents[1] / "berlivn.db"))
 
 class Database:
 	"""Lightweight SQLite helper."""
@@ -20,51 +22,80 @@ class Database:
 		"""Execute a statement. If commit=True then changes are committed.
 		Returns the sqlite3.Cursor.
 		"""
-		conn = self._connect()
-		cur = conn.cursor()
-		try:
-			cur.execute(sql, tuple(params))
-			if commit:
+		with DB_LATENCY.time(op="execute"):
+			conn = self._connect()
+			cur = conn.cursor()
+			try:
+				cur.execute(sql, tuple(params))
+				if commit:
+					conn.commit()
+				return cur
+			finally:
+				conn.close()
+
+	def execute_returning(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+		"""Run a write with a RETURNING clause and commit it; returns the rows it produced.
+		The rows are read before the commit (SQLite keeps the statement open until then).
+		"""
+		with DB_LATENCY.time(op="execute_returning"):
+			conn = self._connect()
+			try:
+				rows = conn.execute(sql, tuple(params)).fetchall()
 				conn.commit()
-			return cur
-		finally:
-			conn.close()
+				return [dict(r) for r in rows]
+			finally:
+				conn.close()
 
 	def executemany(self, sql: str, seq_of_params: Iterable[Iterable[Any]], commit: bool = False) -> None:
-		conn = self._connect()
-		try:
-			cur = conn.cursor()
-			cur.executemany(sql, seq_of_params)
-			if commit:
-				conn.commit()
-		finally:
-			conn.close()
+		with DB_LATENCY.time(op="executemany"):
+			conn = self._connect()
+			try:
+				cur = conn.cursor()
+				cur.executemany(sql, seq_of_params)
+				if commit:
+					conn.commit()
+			finally:
+				conn.close()
 
 	def fetch_one(self, sql: str, params: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
-		conn = self._connect()
-		try:
-			cur = conn.cursor()
-			cur.execute(sql, tuple(params))
-			row = cur.fetchone()
-			return dict(row) if row else None
-		finally:
-			conn.close()
+		with DB_LATENCY.time(op="fetch_one"):
+			conn = self._connect()
+			try:
+				cur = conn.cursor()
+				cur.execute(sql, tuple(params))
+				row = cur.fetchone()
+				return dict(row) if row else None
+			finally:
+				conn.close()
 
 	def fetch_all(self, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
-		conn = self._connect()
-		try:
-			cur = conn.cursor()
-			cur.execute(sql, tuple(params))
-			rows = cur.fetchall()
-			return [dict(r) for r in rows]
-		finally:
-			conn.close()
+		with DB_LATENCY.time(op="fetch_all"):
+			conn = self._connect()
+			try:
+				cur = conn.cursor()
+				cur.execute(sql, tuple(params))
+				rows = cur.fetchall()
+				return [dict(r) for r in rows]
+			finally:
+				conn.close()
+
+	def fetch_rows(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+		"""Like fetch_all but returns the sqlite3.Row objects (row["col"] access, no dict per row).
+		For callers that build their own output objects from the rows.
+		"""
+		with DB_LATENCY.time(op="fetch_rows"):
+			conn = self._connect()
+			try:
+				return conn.execute(sql, tuple(params)).fetchall()
+			finally:
+				conn.close()
 
 	def executescript(self, script: str) -> None:
 		"""Run multi-statement SQL (for migrations)"""
-		conn = self._connect()
-		try:
-			conn.executescript(script)
-			conn.commit()
-		finally:
-			conn.close()
\ No newline at end of file
+		with DB_LATENCY.time(op="executescript"):
+			conn = self._connect()
+			try:
+				conn.executescript(script)
+				conn.commit()
+			finally:
+				conn.close()
\ No newline at end of file
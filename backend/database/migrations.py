@@ -0,0 +1,287 @@
+"""
+Versioned schema migrations.
+
+Mỗi migration chạy đúng một lần và được ghi vào bảng schema_version.
+Migrations run once at application startup (main.startup) or from the CLI:
+
+    python -m database.migrations            # apply pending migrations
+    python -m database.migrations --status   # show applied / pending versions
+
+Migration 1-4 use IF NOT EXISTS so databases created before schema_version
+existed are adopted without changes.
+"""
+import argparse
+import sqlite3
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from database.database import Database
+
+_SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+  version INTEGER PRIMARY KEY,
+  name TEXT NOT NULL,
+  applied_at TEXT DEFAULT (datetime('now'))
+);
+"""
+
+_USERS_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+  id TEXT PRIMARY KEY,
+  company_name TEXT NOT NULL,
+  registration_number TEXT UNIQUE, -- Made UNIQUE for login
+  activities TEXT NOT NULL,
+  activities_other TEXT,
+  employee_count TEXT NOT NULL,
+  company_phone TEXT NOT NULL,
+  email TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  first_name TEXT NOT NULL,
+  last_name TEXT NOT NULL,
+  job_position TEXT NOT NULL,
+  professional_address TEXT NOT NULL,
+  postal_code TEXT NOT NULL,
+  city TEXT NOT NULL,
+  country TEXT NOT NULL DEFAULT 'Vietnam',
+  direct_phone TEXT NOT NULL,
+  mobile_phone TEXT NOT NULL,
+  role TEXT NOT NULL DEFAULT 'user',
+  is_active INTEGER DEFAULT 0,
+  daily_search_limit INTEGER DEFAULT 3,
+  daily_search_remaining INTEGER DEFAULT 3,
+  last_search_date TEXT,
+  last_login_at TEXT,
+  created_at TEXT DEFAULT (datetime('now')),
+  updated_at TEXT DEFAULT (datetime('now')),
+  CHECK (role IN ('user', 'admin'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_registration_number ON users(registration_number); -- Added index for login
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_users_company ON users(company_name);
+"""
+
+_USER_SEARCH_LOGS_SQL = """
+CREATE TABLE IF NOT EXISTS user_search_logs (
+  id TEXT PRIMARY KEY,
+  user_id TEXT NOT NULL,
+  log_date TEXT NOT NULL,
+  search_count INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT DEFAULT (datetime('now')),
+  updated_at TEXT DEFAULT (datetime('now')),
+  UNIQUE(user_id, log_date),
+  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_search_logs_user_date ON user_search_logs(user_id, log_date);
+"""
+
+_CALC_EXCEL_SQL = """
+CREATE TABLE IF NOT EXISTS calc_excel (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  W INTEGER NOT NULL,
+  T INTEGER NOT NULL,
+  B INTEGER NOT NULL,
+  Angle INTEGER NOT NULL,
+  a INTEGER NOT NULL,
+  Icc INTEGER NOT NULL,
+  Force INTEGER NOT NULL,
+  NbrePhase INTEGER NOT NULL,
+  L TEXT,
+  UNIQUE(W, T, B, Angle, a, Icc, Force, NbrePhase)
+);
+
+CREATE INDEX IF NOT EXISTS idx_calc_excel_lookup ON calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase);
+"""
+
+_COMPONENTS_SQL = """
+CREATE TABLE IF NOT EXISTS components_info (
+  key TEXT NOT NULL,
+  nbphase INTEGER NOT NULL,
+  Amini INTEGER,
+  Amaxi INTEGER,
+  angle INTEGER,
+  resmini REAL,
+  typesupport TEXT,
+  Bmini INTEGER,
+  largeurmodule INTEGER,
+  img1Article TEXT,
+  img2Article TEXT,
+  numart TEXT,
+  info TEXT,
+  a_list TEXT,
+  PRIMARY KEY (key, nbphase)
+);
+
+CREATE TABLE IF NOT EXISTS components_list (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  nbphase INTEGER NOT NULL,
+  thickness REAL NOT NULL,
+  width REAL NOT NULL,
+  poles INTEGER NOT NULL,
+  shape TEXT NOT NULL,
+  component_id TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_components_list_search ON components_list(nbphase, thickness, width, poles, shape);
+CREATE INDEX IF NOT EXISTS idx_components_list_component ON components_list(component_id, nbphase);
+"""
+
+# Freshness cho cache calc_excel (stale-while-revalidate). DB cũ có thể có bản ghi
+# trùng khóa vì bảng được tạo trước khi có UNIQUE: giữ bản ghi đầu tiên, sau đó tạo
+# unique index (thay cho idx_calc_excel_lookup) để insert_calc_excel dùng được UPSERT.
+_CALC_EXCEL_FRESHNESS_SQL = """
+DELETE FROM calc_excel WHERE rowid NOT IN (
+  SELECT MIN(rowid) FROM calc_excel GROUP BY W, T, B, Angle, a, Icc, Force, NbrePhase
+);
+DROP INDEX IF EXISTS idx_calc_excel_lookup;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_calc_excel_key ON calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase);
+
+ALTER TABLE calc_excel ADD COLUMN fetched_at TEXT;
+ALTER TABLE calc_excel ADD COLUMN model_version TEXT DEFAULT '1';
+ALTER TABLE calc_excel ADD COLUMN stale INTEGER NOT NULL DEFAULT 0;
+UPDATE calc_excel SET fetched_at = datetime('now') WHERE fetched_at IS NULL;
+"""
+
+# Job bất đồng bộ (services/job_service.py). Unique index một phần đảm bảo mỗi
+# bộ tham số chỉ có một job queued/running; submit trùng dùng lại job đó.
+_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  params_hash TEXT NOT NULL,
+  params TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'queued',
+  progress_done INTEGER NOT NULL DEFAULT 0,
+  progress_total INTEGER,
+  result TEXT,
+  error TEXT,
+  created_at TEXT DEFAULT (datetime('now')),
+  started_at TEXT,
+  finished_at TEXT,
+  expires_at TEXT,
+  CHECK (status IN ('queued', 'running', 'done', 'failed'))
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_inflight ON jobs(kind, params_hash) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_jobs_expires ON jobs(expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+# TTL cho backend cache SQLite (cache_backends.SQLiteCacheBackend); NULL = không hết hạn
+_CALC_EXCEL_EXPIRY_SQL = """
+ALTER TABLE calc_excel ADD COLUMN expires_at TEXT;
+"""
+
+# Lịch sử publish catalog (database/catalog_publish.py): mỗi version là một file snapshot bất biến.
+# Dòng 'building' giữ chỗ số version trong lúc dựng file, nên hai lần publish không trùng số.
+_CATALOG_VERSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS catalog_versions (
+  version INTEGER PRIMARY KEY,
+  status TEXT NOT NULL DEFAULT 'building',
+  file TEXT,
+  components INTEGER,
+  list_rows INTEGER,
+  published_by TEXT,
+  created_at TEXT DEFAULT (datetime('now')),
+  published_at TEXT,
+  CHECK (status IN ('building', 'published', 'failed'))
+);
+"""
+
+# Chỉ mục full-text (FTS5) cho components_info: key, numart, info. External content
+# (không lưu bản sao của các cột), đồng bộ bằng trigger; snapshot catalog dựng lại
+# chỉ mục bằng 'rebuild' (database/catalog_publish.py). prefix='2 3': truy vấn tiền tố
+# ngắn ("RE*", "100*") đọc thẳng chỉ mục tiền tố thay vì quét mọi token.
+_COMPONENTS_FTS_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS components_info_fts USING fts5(
+  key, numart, info,
+  content='components_info', content_rowid='rowid',
+  tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS components_info_fts_insert AFTER INSERT ON components_info BEGIN
+  INSERT INTO components_info_fts (rowid, key, numart, info) VALUES (new.rowid, new.key, new.numart, new.info);
+END;
+
+CREATE TRIGGER IF NOT EXISTS components_info_fts_delete AFTER DELETE ON components_info BEGIN
+  INSERT INTO components_info_fts (components_info_fts, rowid, key, numart, info) VALUES ('delete', old.rowid, old.key, old.numart, old.info);
+END;
+
+CREATE TRIGGER IF NOT EXISTS components_info_fts_update AFTER UPDATE OF key, numart, info ON components_info BEGIN
+  INSERT INTO components_info_fts (components_info_fts, rowid, key, numart, info) VALUES ('delete', old.rowid, old.key, old.numart, old.info);
+  INSERT INTO components_info_fts (rowid, key, numart, info) VALUES (new.rowid, new.key, new.numart, new.info);
+END;
+
+INSERT INTO components_info_fts (components_info_fts) VALUES ('rebuild');
+"""
+
+# (version, name, sql) — chỉ thêm migration mới vào cuối, không sửa migration đã phát hành
+MIGRATIONS: List[Tuple[int, str, str]] = [
+	(1, "users", _USERS_SQL),
+	(2, "user_search_logs", _USER_SEARCH_LOGS_SQL),
+	(3, "calc_excel", _CALC_EXCEL_SQL),
+	(4, "components_info_and_list", _COMPONENTS_SQL),
+	(5, "calc_excel_freshness", _CALC_EXCEL_FRESHNESS_SQL),
+	(6, "jobs", _JOBS_SQL),
+	(7, "calc_excel_expiry", _CALC_EXCEL_EXPIRY_SQL),
+	(8, "catalog_versions", _CATALOG_VERSIONS_SQL),
+	(9, "components_info_fts", _COMPONENTS_FTS_SQL),
+]
+
+
+def _applied_versions(conn: sqlite3.Connection) -> List[int]:
+	conn.executescript(_SCHEMA_VERSION_SQL)
+	return [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version;")]
+
+
+def run_migrations(db: Optional[Database] = None) -> List[int]:
+	"""Apply pending migrations in order. Returns the versions applied by this call."""
+	db = db or Database()
+	conn = db._connect()
+	applied: List[int] = []
+	try:
+		done = set(_applied_versions(conn))
+		for version, name, sql in MIGRATIONS:
+			if version in done:
+				continue
+			# executescript tự COMMIT trước khi chạy, nên bọc BEGIN/COMMIT trong chính script
+			conn.executescript(
+				f"BEGIN;\n{sql}\nINSERT INTO schema_version (version, name) VALUES ({int(version)}, '{name}');\nCOMMIT;"
+			)
+			applied.append(version)
+	except Exception:
+		if conn.in_transaction:
+			conn.rollback()
+		raise
+	finally:
+		conn.close()
+	return applied
+
+
+def migration_status(db: Optional[Database] = None) -> List[Tuple[int, str, bool]]:
+	db = db or Database()
+	conn = db._connect()
+	try:
+		done = set(_applied_versions(conn))
+	finally:
+		conn.close()
+	return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Apply BerliVN schema migrations")
+	parser.add_argument("--db", type=Path, default=None, help="database path (default: berlivn.db)")
+	parser.add_argument("--status", action="store_true", help="only print migration status")
+	args = parser.parse_args()
+	db = Database(args.db)
+	if args.status:
+		for version, name, done in migration_status(db):
+			print(f"{version:>4} {'applied' if done else 'pending':<8} {name}")
+		return
+	applied = run_migrations(db)
+	print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,264 @@
+"""
+Portable calc_excel snapshots for warm-starting a new server.
+
+    python -m database.snapshot export calc_excel.bvs [--db berlivn.db]
+    python -m database.snapshot import calc_excel.bvs [--db berlivn.db] [--replace | --merge]
+    python -m database.snapshot info calc_excel.bvs
+
+File layout: MAGIC, độ dài header (uint32 little-endian), header JSON, rồi các
+blob nén zlib của từng cột. Cột số nguyên được lưu thành mảng int32; cột text
+(hoặc cột số có giá trị không vừa int32) được mã hóa từ điển: danh sách giá trị
+khác nhau + mảng chỉ số int32. Header chứa schema version của DB nguồn, số dòng
+và sha256 của phần thân để phát hiện file hỏng.
+
+Import chạy trong một transaction: bỏ các index phụ của calc_excel, nạp dữ liệu
+đã sắp theo khóa bằng executemany, rồi tạo lại index ở cuối.
+"""
+import argparse
+import hashlib
+import json
+import struct
+import sys
+import time
+import zlib
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.database import Database
+from database.migrations import MIGRATIONS, run_migrations
+
+MAGIC = b"BVCSNAP1"
+FORMAT_VERSION = 1
+TABLE = "calc_excel"
+KEY_COLUMNS = ("W", "T", "B", "Angle", "a", "Icc", "Force", "NbrePhase")
+# Cột được xuất; cột chưa có trong DB nguồn (DB cũ chưa chạy migration 5/7) được bỏ qua
+COLUMNS = KEY_COLUMNS + ("L", "fetched_at", "model_version", "stale", "expires_at")
+INT_NULL = -2 ** 31
+INT_MIN, INT_MAX = -2 ** 31 + 1, 2 ** 31 - 1
+ZLIB_LEVEL = 6
+
+
+class SnapshotError(Exception):
+	"""Raised for unreadable, corrupt or incompatible snapshot files."""
+	pass
+
+
+def _to_bytes(arr: array) -> bytes:
+	if sys.byteorder != "little":
+		arr = array(arr.typecode, arr)
+		arr.byteswap()
+	return arr.tobytes()
+
+
+def _from_bytes(data: bytes) -> array:
+	arr = array("i")
+	arr.frombytes(data)
+	if sys.byteorder != "little":
+		arr.byteswap()
+	return arr
+
+
+def _encode_column(values: List[Any]) -> Tuple[str, List[bytes]]:
+	if all(v is None or (type(v) is int and INT_MIN <= v <= INT_MAX) for v in values):
+		ints = array("i", [INT_NULL if v is None else v for v in values])
+		return "int32", [zlib.compress(_to_bytes(ints), ZLIB_LEVEL)]
+	dictionary: Dict[Any, int] = {}
+	indexes = array("i", [INT_NULL if v is None else dictionary.setdefault(v, len(dictionary)) for v in values])
+	words = json.dumps(list(dictionary), separators=(",", ":")).encode()
+	return "dict", [zlib.compress(words, ZLIB_LEVEL), zlib.compress(_to_bytes(indexes), ZLIB_LEVEL)]
+
+
+def _decode_column(codec: str, blobs: List[bytes]) -> List[Any]:
+	if codec == "int32":
+		return [None if v == INT_NULL else v for v in _from_bytes(zlib.decompress(blobs[0]))]
+	if codec == "dict":
+		words = json.loads(zlib.decompress(blobs[0]))
+		return [None if i == INT_NULL else words[i] for i in _from_bytes(zlib.decompress(blobs[1]))]
+	raise SnapshotError(f"unknown column codec: {codec}")
+
+
+def _schema_version(conn) -> int:
+	try:
+		row = conn.execute("SELECT MAX(version) FROM schema_version;").fetchone()
+	except Exception:
+		return 0
+	return row[0] or 0
+
+
+def _table_columns(conn) -> List[str]:
+	return [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE});")]
+
+
+def export_snapshot(path: Path, db: Optional[Database] = None) -> Dict[str, Any]:
+	db = db or Database()
+	conn = db._connect()
+	try:
+		present = set(_table_columns(conn))
+		if not present:
+			raise SnapshotError(f"table {TABLE} does not exist in {db.path}")
+		columns = [c for c in COLUMNS if c in present]
+		# sắp theo khóa: giá trị liền kề giống nhau -> nén tốt hơn, và import chèn tuần tự vào unique index
+		rows = conn.execute(
+			f"SELECT {', '.join(columns)} FROM {TABLE} ORDER BY {', '.join(KEY_COLUMNS)};"
+		).fetchall()
+		schema_version = _schema_version(conn)
+	finally:
+		conn.close()
+
+	values = list(zip(*rows)) if rows else [() for _ in columns]
+	body = bytearray()
+	column_meta = []
+	for name, col in zip(columns, values):
+		codec, blobs = _encode_column(list(col))
+		spans = []
+		for blob in blobs:
+			spans.append([len(body), len(blob)])
+			body += blob
+		column_meta.append({"name": name, "codec": codec, "blobs": spans})
+
+	header = {
+		"format_version": FORMAT_VERSION,
+		"table": TABLE,
+		"schema_version": schema_version,
+		"rows": len(rows),
+		"columns": column_meta,
+		"sha256": hashlib.sha256(body).hexdigest(),
+		"created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+	}
+	header_bytes = json.dumps(header, separators=(",", ":")).encode()
+	tmp = Path(str(path) + ".tmp")
+	with open(tmp, "wb") as f:
+		f.write(MAGIC)
+		f.write(struct.pack("<I", len(header_bytes)))
+		f.write(header_bytes)
+		f.write(body)
+	tmp.replace(path)
+	return header
+
+
+def read_snapshot(path: Path) -> Tuple[Dict[str, Any], bytes]:
+	with open(path, "rb") as f:
+		if f.read(len(MAGIC)) != MAGIC:
+			raise SnapshotError(f"{path} is not a calc_excel snapshot")
+		(header_len,) = struct.unpack("<I", f.read(4))
+		header = json.loads(f.read(header_len))
+		body = f.read()
+	if header.get("format_version") != FORMAT_VERSION:
+		raise SnapshotError(f"unsupported snapshot format version {header.get('format_version')}")
+	if hashlib.sha256(body).hexdigest() != header["sha256"]:
+		raise SnapshotError("checksum mismatch, snapshot file is corrupt")
+	return header, body
+
+
+def import_snapshot(path: Path, db: Optional[Database] = None, mode: str = "empty") -> Dict[str, Any]:
+	"""
+	mode: "empty" (mặc định, bảng đích phải rỗng), "replace" (xóa dữ liệu cũ) hoặc
+	"merge" (giữ bản ghi đã có, bỏ qua khóa trùng).
+	"""
+	header, body = read_snapshot(path)
+	db = db or Database()
+	latest = MIGRATIONS[-1][0]
+	if header["schema_version"] > latest:
+		raise SnapshotError(f"snapshot schema version {header['schema_version']} is newer than this code ({latest})")
+	run_migrations(db)
+
+	start = time.perf_counter()
+	names = [c["name"] for c in header["columns"]]
+	columns = [
+		_decode_column(c["codec"], [body[off:off + length] for off, length in c["blobs"]])
+		for c in header["columns"]
+	]
+	decoded_at = time.perf_counter()
+
+	conn = db._connect()
+	try:
+		unknown = set(names) - set(_table_columns(conn))
+		if unknown:
+			raise SnapshotError(f"snapshot columns not in {TABLE}: {sorted(unknown)}")
+		conn.execute("PRAGMA synchronous = OFF;")
+		conn.execute("PRAGMA cache_size = -65536;")
+		conn.execute("BEGIN;")
+		existing = conn.execute(f"SELECT COUNT(*) FROM {TABLE};").fetchone()[0]
+		if existing and mode == "empty":
+			raise SnapshotError(f"{TABLE} already has {existing} rows; use --replace or --merge")
+		if mode == "replace":
+			conn.execute(f"DELETE FROM {TABLE};")
+		# Index được tạo lại sau khi nạp. Ràng buộc UNIQUE trong định nghĩa bảng không bỏ
+		# được, nhưng dữ liệu đã sắp theo khóa nên chỉ là chèn nối đuôi. Ở chế độ merge
+		# phải giữ unique index để INSERT OR IGNORE bỏ được khóa trùng.
+		indexes = [
+			(name, sql) for name, sql in conn.execute(
+				"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL;",
+				(TABLE,),
+			)
+			if not (mode == "merge" and sql.upper().startswith("CREATE UNIQUE"))
+		]
+		for name, _ in indexes:
+			conn.execute(f'DROP INDEX "{name}";')
+		verb = "INSERT OR IGNORE" if mode == "merge" else "INSERT"
+		placeholders = ", ".join("?" for _ in names)
+		cur = conn.executemany(
+			f"{verb} INTO {TABLE} ({', '.join(names)}) VALUES ({placeholders});",
+			zip(*columns),
+		)
+		inserted = cur.rowcount
+		loaded_at = time.perf_counter()
+		for _, sql in indexes:
+			conn.execute(sql)
+		conn.commit()
+	except Exception:
+		if conn.in_transaction:
+			conn.rollback()
+		raise
+	finally:
+		conn.close()
+	done = time.perf_counter()
+	return {
+		"rows": header["rows"],
+		"inserted": inserted,
+		"decode_seconds": round(decoded_at - start, 3),
+		"load_seconds": round(loaded_at - decoded_at, 3),
+		"index_seconds": round(done - loaded_at, 3),
+		"total_seconds": round(done - start, 3),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Export/import calc_excel snapshots")
+	sub = parser.add_subparsers(dest="command", required=True)
+
+	p = sub.add_parser("export", help="write calc_excel to a snapshot file")
+	p.add_argument("file", type=Path)
+	p.add_argument("--db", type=Path, default=None, help="database path (default: berlivn.db)")
+
+	p = sub.add_parser("import", help="bulk-load a snapshot file into calc_excel")
+	p.add_argument("file", type=Path)
+	p.add_argument("--db", type=Path, default=None, help="database path (default: berlivn.db)")
+	group = p.add_mutually_exclusive_group()
+	group.add_argument("--replace", action="store_true", help="delete existing calc_excel rows first")
+	group.add_argument("--merge", action="store_true", help="keep existing rows, skip duplicate keys")
+
+	p = sub.add_parser("info", help="print the snapshot header")
+	p.add_argument("file", type=Path)
+
+	args = parser.parse_args()
+	try:
+		if args.command == "export":
+			started = time.perf_counter()
+			header = export_snapshot(args.file, Database(args.db))
+			size = args.file.stat().st_size
+			print(f"Exported {header['rows']} rows ({size} bytes, schema v{header['schema_version']}) "
+				  f"to {args.file} in {time.perf_counter() - started:.2f}s")
+		elif args.command == "import":
+			mode = "replace" if args.replace else "merge" if args.merge else "empty"
+			print(json.dumps(import_snapshot(args.file, Database(args.db), mode)))
+		else:
+			header, _ = read_snapshot(args.file)
+			print(json.dumps(header, indent=2))
+	except SnapshotError as e:
+		raise SystemExit(f"error: {e}")
+
+
+if __name__ == "__main__":
+	main()
@@ -1,13 +1,164 @@
-from datetime import datetime
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+# Cấu hình qua biến môi trường
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Mức log theo module, ví dụ: "calc_data=DEBUG,services.query_busbar_service=DEBUG"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # "midnight" hoặc số giây
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+APP_LOGGER = "berlivn"
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Một dòng JSON cho mỗi record; các field truyền qua extra={...} được giữ nguyên."""
+    _RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SizedTimedRotatingFileHandler(RotatingFileHandler):
+    """
+    Xoay file khi vượt quá max_bytes hoặc khi tới mốc thời gian, tùy điều kiện nào đến trước.
+    when: "midnight" hoặc số giây giữa hai lần xoay. Bản cũ được đánh số app.log.1 ... app.log.N.
+    """
+    def __init__(self, filename: str, max_bytes: int = 0, when: str = "midnight", backup_count: int = 7):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.when = when
+        self.rollover_at = self._next_rollover(time.time())
+
+    def _next_rollover(self, now: float) -> float:
+        if self.when == "midnight":
+            tomorrow = datetime.fromtimestamp(now).date() + timedelta(days=1)
+            return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+        return now + int(self.when)
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if time.time() >= self.rollover_at:
+            return 1
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.rollover_at = self._next_rollover(time.time())
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler không bao giờ chặn: khi hàng đợi đầy thì bỏ record và đếm số lượng bị bỏ."""
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
 
-def write_log(message, log_file="app.log"):
-    try:
-        # Lấy thời gian hiện tại
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Ghi log vào file
-        with open(log_file, "a", encoding="utf-8") as file:
-            file.write(f"[{current_time}] {message}\n")
-    except Exception as e:
-        print(f"Lỗi khi ghi log: {e}")
 
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(log_file: str = LOG_FILE, level: str = LOG_LEVEL, module_levels: str = LOG_LEVELS) -> None:
+    """
+    Cài đặt pipeline log: logger -> hàng đợi (không chặn) -> thread nền ghi file có xoay vòng.
+    Gọi nhiều lần cũng chỉ cài đặt một lần.
+    """
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+        file_handler = SizedTimedRotatingFileHandler(
+            log_file, max_bytes=LOG_MAX_BYTES, when=LOG_ROTATE_WHEN, backup_count=LOG_BACKUP_COUNT
+        )
+        if LOG_FORMAT == "json":
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s %(name)s: %(message)s"))
+
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        _queue_handler = DroppingQueueHandler(log_queue)
+        root.addHandler(_queue_handler)
+        root.setLevel(level.upper())
+        for name, module_level in _parse_levels(module_levels).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def _reset_after_fork() -> None:
+    """
+    Process con của fork thừa kế _listener/_queue_handler nhưng không có thread ghi log của cha:
+    bỏ trạng thái đó (không dừng/join thread của cha) để setup_logging trong con cài đặt lại,
+    thay vì trả về sớm và để record rơi vào hàng đợi không ai đọc.
+    """
+    global _listener, _queue_handler, _lock
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+    # _lock có thể đang bị một thread khác của cha giữ lúc fork
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def shutdown_logging() -> None:
+    """Dừng thread ghi log sau khi đã ghi hết các record còn trong hàng đợi."""
+    global _listener, _queue_handler
+    with _lock:
+        listener, _listener = _listener, None
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+            _queue_handler = None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def write_log(message, log_file="app.log"):
+    """Giữ tương thích với code cũ: ghi một dòng INFO qua pipeline log."""
+    logging.getLogger(APP_LOGGER).info(message)
@@ -3,8 +3,20 @@ from routes.auth import router as auth_router
 from routes.query_busbar import router as query_busbar_router
 from routes.user import router as user_router
 from routes.log_query import router as log_query_router
+from routes.metrics import router as metrics_router
+from routes.calc_cache import router as calc_cache_router
+from routes.jobs import router as jobs_router
+from routes.catalog_admin import router as catalog_admin_router
 from fastapi.middleware.cors import CORSMiddleware
-from models.user import init_user_table  # sửa tại đây
+from middleware.middleware import AuthMiddleware, SECRET_KEY
+from metrics import MetricsMiddleware
+from database.migrations import run_migrations
+from services.password_service import hasher
+from services.job_service import job_manager
+from catalog import catalog
+from log import setup_logging, shutdown_logging, get_logger
+
+logger = get_logger(__name__)
 
 origins = [
     "http://localhost:5173",
@@ -13,24 +25,46 @@ origins = [
 ]
 
 def create_app():
+    setup_logging()
     app = FastAPI()
 
     @app.on_event("startup")
     def startup():
-        try:
-            init_user_table()
-        except Exception:
-            pass
+        # không có JWT_SECRET thì không ký và không nhận token nào: dừng thay vì chạy với auth hỏng
+        if not SECRET_KEY:
+            raise RuntimeError("JWT_SECRET is not set")
+        # Lỗi migration phải làm dừng startup, không được nuốt lỗi
+        applied = run_migrations()
+        if applied:
+            logger.info("Applied schema migrations: %s", applied)
+        # lần chạy đầu: publish staging hiện tại làm version 1 (serve.py đã làm trước khi fork)
+        catalog.ensure_published()
+        hasher.start()
+        job_manager.start()
+
+    @app.on_event("shutdown")
+    def shutdown():
+        job_manager.shutdown()
+        hasher.shutdown()
+        shutdown_logging()
 
     app.include_router(auth_router)
     app.include_router(query_busbar_router)
     app.include_router(user_router)
     app.include_router(log_query_router)
+    app.include_router(metrics_router)
+    app.include_router(calc_cache_router)
+    app.include_router(jobs_router)
+    app.include_router(catalog_admin_router)
     return app
 
 
 app = create_app()
 
+# optional=True: request không có token vẫn đi tiếp, route cần đăng nhập dùng Depends(get_current_user)
+app.add_middleware(AuthMiddleware, optional=True)
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     # allow_origins=origins,
@@ -1,6 +1,10 @@
 import os
+import time
+import hashlib
+import threading
 import functools
-from typing import Callable, Optional, Dict, Any
+from collections import OrderedDict
+from typing import Callable, Optional, Dict, Any, Iterable, Tuple
 
 # Thêm các import tùy chọn (không bắt buộc nếu dự án không dùng Flask/Starlette)
 try:
@@ -11,15 +15,21 @@ except Exception:
 
 try:
     from starlette.types import ASGIApp, Receive, Scope, Send
+    from starlette.requests import Request
+    from starlette.exceptions import HTTPException
 except Exception:
     ASGIApp = Receive = Scope = Send = None  # type: ignore
 
 import jwt
 from jwt import InvalidTokenError
 
-# Cấu hình: lấy SECRET_KEY từ biến môi trường, fallback sang giá trị dev
-SECRET_KEY = os.getenv("JWT_SECRET", "change-me-in-production")
+# Cấu hình: SECRET_KEY lấy từ biến môi trường JWT_SECRET, không có giá trị mặc định.
+# Thiếu JWT_SECRET thì không ký và không chấp nhận token nào (main từ chối khởi động).
+SECRET_KEY = os.getenv("JWT_SECRET", "")
 ALGORITHM = "HS256"
+ACCESS_TOKEN_TTL = int(os.getenv("JWT_ACCESS_TTL", "900"))  # giây
+REFRESH_TOKEN_TTL = int(os.getenv("JWT_REFRESH_TTL", str(7 * 24 * 3600)))
+TOKEN_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
 
 
 class AuthError(Exception):
@@ -27,6 +37,17 @@ class AuthError(Exception):
     pass
 
 
+class AuthNotConfigured(AuthError):
+    """Raised when JWT_SECRET is not set: no token is issued or accepted."""
+    pass
+
+
+def _secret_key() -> str:
+    if not SECRET_KEY:
+        raise AuthNotConfigured("JWT_SECRET is not set")
+    return SECRET_KEY
+
+
 def get_token_from_header(headers: Optional[Dict[str, str]] = None) -> str:
     """
     Lấy token từ header Authorization: "Bearer <token>"
@@ -39,6 +60,10 @@ def get_token_from_header(headers: Optional[Dict[str, str]] = None) -> str:
     else:
         auth = ""
 
+    return _parse_bearer(auth)
+
+
+def _parse_bearer(auth: str) -> str:
     if not auth:
         raise AuthError("Authorization header is missing")
 
@@ -49,16 +74,89 @@ def get_token_from_header(headers: Optional[Dict[str, str]] = None) -> str:
     return parts[1]
 
 
-def decode_jwt(token: str) -> Dict[str, Any]:
+def decode_jwt(token: str, token_type: Optional[str] = None) -> Dict[str, Any]:
     """
     Giải mã JWT và trả về payload.
-    Ném AuthError nếu token không hợp lệ.
+    Nếu token_type được truyền, claim "type" phải khớp ("access" / "refresh").
+    Ném AuthError nếu token không hợp lệ (AuthNotConfigured nếu thiếu JWT_SECRET).
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        payload = jwt.decode(token, _secret_key(), algorithms=[ALGORITHM])
     except InvalidTokenError as e:
         raise AuthError(f"Invalid token: {str(e)}")
+    if token_type is not None and payload.get("type") != token_type:
+        raise AuthError(f"Invalid token: expected {token_type} token")
+    return payload
+
+
+def create_token(claims: Dict[str, Any], token_type: str, ttl: int) -> str:
+    """Ký JWT với claims cho trước, thêm type/iat/exp. Ném AuthNotConfigured nếu thiếu JWT_SECRET."""
+    now = int(time.time())
+    payload = dict(claims, type=token_type, iat=now, exp=now + ttl)
+    return jwt.encode(payload, _secret_key(), algorithm=ALGORITHM)
+
+
+def create_access_token(claims: Dict[str, Any]) -> str:
+    return create_token(claims, "access", ACCESS_TOKEN_TTL)
+
+
+def create_refresh_token(claims: Dict[str, Any]) -> str:
+    return create_token(claims, "refresh", REFRESH_TOKEN_TTL)
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of tokens whose signature has already been checked.
+    Keyed by the SHA-256 digest of the token; entries are dropped once `exp` passes.
+    """
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            exp, payload = entry
+            if exp <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        exp = payload.get("exp")
+        if exp is None or self.maxsize <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (float(exp), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = VerifiedTokenCache()
+
+
+def verify_access_token(token: str) -> Dict[str, Any]:
+    """decode_jwt cho access token, dùng cache để bỏ qua bước kiểm tra chữ ký lặp lại."""
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = decode_jwt(token, "access")
+        token_cache.put(token, payload)
+    return payload
 
 
 def _attach_user_to_context(user_payload: Dict[str, Any]):
@@ -109,28 +207,50 @@ def auth_required(func: Optional[Callable] = None, *, optional: bool = False):
 
 # Optional: ASGI middleware để dùng với FastAPI/Starlette
 if ASGIApp is not None:
+    def _authorization_header(raw_headers: Iterable[Tuple[bytes, bytes]]) -> str:
+        """Chỉ tìm header Authorization, không dựng lại toàn bộ dict header."""
+        for k, v in raw_headers:
+            if len(k) == 13 and k.lower() == b"authorization":
+                return v.decode("latin-1")
+        return ""
+
     class AuthMiddleware:
         """
-        ASGI middleware: kiểm tra Authorization header, decode JWT và gán vào scope['user'].
-        Nếu token không hợp lệ -> trả 401.
+        ASGI middleware: kiểm tra Authorization header, xác thực access token và gán payload vào scope['user'].
+        Token đã xác thực được giữ trong token_cache cho tới khi hết hạn.
+        Nếu token không hợp lệ -> trả 401 (trừ khi optional=True hoặc path nằm trong exempt_paths).
         """
-        def __init__(self, app: ASGIApp, *, optional: bool = False):
+        def __init__(self, app: ASGIApp, *, optional: bool = False, exempt_paths: Iterable[str] = ()):
             self.app = app
             self.optional = optional
+            self.exempt_paths = frozenset(exempt_paths)
 
         async def __call__(self, scope: Scope, receive: Receive, send: Send):
             # chỉ xử lý HTTP
             if scope.get("type") == "http":
-                headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
                 try:
-                    token = get_token_from_header(headers)
-                    payload = decode_jwt(token)
-                    scope.setdefault("user", {})  # type: ignore
-                    scope["user"].update(payload)  # type: ignore
+                    token = _parse_bearer(_authorization_header(scope.get("headers", ())))
+                    scope["user"] = verify_access_token(token)  # type: ignore
                 except AuthError:
-                    if not self.optional:
+                    if not self.optional and scope.get("path") not in self.exempt_paths:
                         from starlette.responses import JSONResponse  # local import để tránh dep nếu không dùng
                         resp = JSONResponse({"detail": "Unauthorized"}, status_code=401)
                         await resp(scope, receive, send)
                         return
-            await self.app(scope, receive, send)
\ No newline at end of file
+            await self.app(scope, receive, send)
+
+    def get_current_user(request: Request) -> Dict[str, Any]:
+        """
+        FastAPI dependency: trả về payload mà AuthMiddleware đã gán vào scope['user'] (không truy vấn DB).
+        """
+        user = request.scope.get("user")
+        if not user:
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        return user
+
+    def require_admin(request: Request) -> Dict[str, Any]:
+        """FastAPI dependency: như get_current_user nhưng yêu cầu role admin."""
+        user = get_current_user(request)
+        if user.get("role") != "admin":
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return user
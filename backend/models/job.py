@@ -0,0 +1,113 @@
+import json
+import sqlite3
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from database.database import Database
+from log import get_logger
+
+db = Database()
+logger = get_logger(__name__)
+
+# Bảng jobs được tạo bởi database.migrations
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("done", "failed")
+
+def _row_to_job(row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+	if not row:
+		return None
+	row["params"] = json.loads(row["params"]) if row.get("params") else None
+	row["result"] = json.loads(row["result"]) if row.get("result") else None
+	return row
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+	return _row_to_job(db.fetch_one("SELECT * FROM jobs WHERE id = ?;", (job_id,)))
+
+def get_inflight_job(kind: str, params_hash: str) -> Optional[Dict[str, Any]]:
+	return _row_to_job(db.fetch_one(
+		"SELECT * FROM jobs WHERE kind = ? AND params_hash = ? AND status IN ('queued', 'running');",
+		(kind, params_hash)
+	))
+
+def create_job(kind: str, params_hash: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+	"""
+	Tạo job queued. Nếu đã có job queued/running với cùng tham số thì trả về job đó.
+	Returns (job, created).
+	"""
+	for _ in range(2):
+		job_id = str(uuid.uuid4())
+		try:
+			db.execute(
+				"INSERT INTO jobs (id, kind, params_hash, params) VALUES (?, ?, ?, ?);",
+				(job_id, kind, params_hash, json.dumps(params)),
+				commit=True
+			)
+			return get_job(job_id), True
+		except sqlite3.IntegrityError:
+			existing = get_inflight_job(kind, params_hash)
+			if existing:
+				return existing, False
+			# job trùng vừa kết thúc giữa INSERT và SELECT: thử lại một lần
+	raise RuntimeError("could not create job")
+
+def count_active_jobs() -> int:
+	row = db.fetch_one("SELECT COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'running');")
+	return row["n"] if row else 0
+
+def mark_running(job_id: str) -> bool:
+	"""Nhận job queued để chạy. False nếu job đã được worker khác nhận (hoặc không còn)."""
+	cur = db.execute(
+		"UPDATE jobs SET status = 'running', started_at = datetime('now') WHERE id = ? AND status = 'queued';",
+		(job_id,),
+		commit=True
+	)
+	return cur.rowcount == 1
+
+def update_progress(job_id: str, done: int, total: Optional[int]) -> None:
+	db.execute(
+		"UPDATE jobs SET progress_done = ?, progress_total = ? WHERE id = ?;",
+		(done, total, job_id),
+		commit=True
+	)
+
+def finish_job(job_id: str, result: Any, ttl_seconds: int) -> None:
+	db.execute(
+		"""
+		UPDATE jobs SET status = 'done', result = ?, finished_at = datetime('now'),
+			expires_at = datetime('now', ?), progress_done = COALESCE(progress_total, progress_done)
+		WHERE id = ?;
+		""",
+		(json.dumps(result), f"+{int(ttl_seconds)} seconds", job_id),
+		commit=True
+	)
+
+def fail_job(job_id: str, error: str, ttl_seconds: int) -> None:
+	db.execute(
+		"""
+		UPDATE jobs SET status = 'failed', error = ?, finished_at = datetime('now'), expires_at = datetime('now', ?)
+		WHERE id = ?;
+		""",
+		(error, f"+{int(ttl_seconds)} seconds", job_id),
+		commit=True
+	)
+
+def purge_expired_jobs() -> int:
+	cur = db.execute("DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < datetime('now');", commit=True)
+	return cur.rowcount
+
+def fail_interrupted_jobs(ttl_seconds: int) -> int:
+	"""Gọi một lần khi khởi động: job đang running của lần chạy trước bị đánh dấu failed."""
+	cur = db.execute(
+		"""
+		UPDATE jobs SET status = 'failed', error = 'interrupted by restart', finished_at = datetime('now'),
+			expires_at = datetime('now', ?)
+		WHERE status = 'running';
+		""",
+		(f"+{int(ttl_seconds)} seconds",),
+		commit=True
+	)
+	return cur.rowcount
+
+def get_queued_jobs() -> List[Dict[str, Any]]:
+	rows = db.fetch_all("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at;")
+	return [_row_to_job(r) for r in rows]
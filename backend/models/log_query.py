@@ -2,39 +2,23 @@ from typing import Optional, List, Dict, Any
 import uuid
 from datetime import datetime, timedelta
 from database.database import Database
+from log import get_logger
 
 db = Database()
+logger = get_logger(__name__)
 
-_LOG_QUERY_TABLE_SQL = """
-CREATE TABLE IF NOT EXISTS user_search_logs (
-  id TEXT PRIMARY KEY,
-  user_id TEXT NOT NULL,
-  log_date TEXT NOT NULL,
-  search_count INTEGER NOT NULL DEFAULT 0,
-  created_at TEXT DEFAULT (datetime('now')),
-  updated_at TEXT DEFAULT (datetime('now')),
-  UNIQUE(user_id, log_date),
-  FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
-CREATE INDEX IF NOT EXISTS idx_user_search_logs_user_date ON user_search_logs(user_id, log_date);
-"""
-
-def init_log_query_table() -> None:
-	db.executescript(_LOG_QUERY_TABLE_SQL)
-
-init_log_query_table()
+# Bảng user_search_logs được tạo bởi database.migrations
 
 def increment_daily_search_log(user_id: str, log_date: Optional[str] = None) -> None:
 	day = log_date or datetime.now().strftime("%Y-%m-%d")
-	print(f"Logging search for user {user_id} on date {day}")
+	logger.debug("Logging search for user %s on date %s", user_id, day)
 	try:
 		row = db.fetch_one(
 			"SELECT id, search_count FROM user_search_logs WHERE user_id = ? AND log_date = ?;",
 			(user_id, day)
 		)
 	except Exception as exc:
-		print(f"[user_search_logs] fetch error: {exc}")
+		logger.error("user_search_logs fetch error: %s", exc)
 		return
 	try:
 		if row:
@@ -50,7 +34,7 @@ def increment_daily_search_log(user_id: str, log_date: Optional[str] = None) ->
 				commit=True
 			)
 	except Exception as exc:
-		print(f"[user_search_logs] upsert error: {exc}")
+		logger.error("user_search_logs upsert error: %s", exc)
 
 def get_daily_search_stats(days: int = 7, start_date: str = None, end_date: str = None) -> List[Dict[str, Any]]:
 	# Determine date range
@@ -72,7 +56,7 @@ def get_daily_search_stats(days: int = 7, start_date: str = None, end_date: str
 		actual_start = (datetime.now().date() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
 		actual_end = datetime.now().strftime("%Y-%m-%d")
 	
-	rows = db.fetch_all(
+	rows = db.fetch_rows(
 		"""
 		SELECT log_date, SUM(search_count) AS total_searches
 		FROM user_search_logs
@@ -115,7 +99,7 @@ def get_total_search_stats() -> Dict[str, Any]:
 
 def get_user_search_activity(limit: int = 20) -> List[Dict[str, Any]]:
 	limit = max(1, min(limit, 100))
-	rows = db.fetch_all(
+	rows = db.fetch_rows(
 		f"""
 		SELECT
 			u.id AS user_id,
@@ -146,7 +130,7 @@ def get_user_search_activity(limit: int = 20) -> List[Dict[str, Any]]:
 	]
 
 def list_search_logs(limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
-	rows = db.fetch_all(
+	rows = db.fetch_rows(
 		"""
 		SELECT
 			l.id,
@@ -181,7 +165,7 @@ def list_search_logs(limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
 def get_search_logs_for_user(user_id: str, days: int = 30) -> List[Dict[str, Any]]:
 	days = max(1, min(days, 365))
 	start_date = (datetime.now().date() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
-	rows = db.fetch_all(
+	rows = db.fetch_rows(
 		"""
 		SELECT log_date, search_count
 		FROM user_search_logs
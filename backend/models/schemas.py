@@ -8,6 +8,21 @@ class QueryBusbarRequest(BaseModel):
     poles: str
     shape: str
     icc: int
+    # tính L cho mọi khoảng cách pha trong a_list (mặc định chỉ khoảng cách đầu tiên)
+    allSpacings: bool = False
+
+class IccSweepRequest(BaseModel):
+    perPhase: str
+    thickness: str
+    width: str
+    poles: str
+    shape: str
+    # danh sách Icc, hoặc khoảng icc_start..icc_stop (gồm hai đầu) với bước icc_step
+    icc: Optional[List[int]] = None
+    icc_start: Optional[int] = None
+    icc_stop: Optional[int] = None
+    icc_step: Optional[int] = None
+    allSpacings: bool = False
 
 class CalcExcelRequest(BaseModel):
     W: float
@@ -44,3 +59,13 @@ class ImagePath(BaseModel):
 
 class FilePath(BaseModel):
     file_path: str
+
+class ForceLimitRequest(BaseModel):
+    W: float
+    T: float
+    B: int
+    Angle: float
+    a: float
+    Icc: float
+    Force: float
+    poles: int
@@ -1,53 +1,118 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+import os
+import time
 import uuid
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from passlib.hash import bcrypt
 from database.database import Database
 from models import log_query
+from services.password_service import hash_password
+from metrics import QUOTA_REJECTIONS
 
 db = Database()
 
-# Schema: Updated to new structure with company info and profile details
-_USERS_TABLE_SQL = """
-CREATE TABLE IF NOT EXISTS users (
-  id TEXT PRIMARY KEY,
-  company_name TEXT NOT NULL,
-  registration_number TEXT UNIQUE, -- Made UNIQUE for login
-  activities TEXT NOT NULL,
-  activities_other TEXT,
-  employee_count TEXT NOT NULL,
-  company_phone TEXT NOT NULL,
-  email TEXT UNIQUE NOT NULL,
-  password_hash TEXT NOT NULL,
-  first_name TEXT NOT NULL,
-  last_name TEXT NOT NULL,
-  job_position TEXT NOT NULL,
-  professional_address TEXT NOT NULL,
-  postal_code TEXT NOT NULL,
-  city TEXT NOT NULL,
-  country TEXT NOT NULL DEFAULT 'Vietnam',
-  direct_phone TEXT NOT NULL,
-  mobile_phone TEXT NOT NULL,
-  role TEXT NOT NULL DEFAULT 'user',
-  is_active INTEGER DEFAULT 0,
-  daily_search_limit INTEGER DEFAULT 3,
-  daily_search_remaining INTEGER DEFAULT 3,
-  last_search_date TEXT,
-  last_login_at TEXT,
-  created_at TEXT DEFAULT (datetime('now')),
-  updated_at TEXT DEFAULT (datetime('now')),
-  CHECK (role IN ('user', 'admin'))
-);
-
-CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
-CREATE UNIQUE INDEX IF NOT EXISTS idx_users_registration_number ON users(registration_number); -- Added index for login
-CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
-CREATE INDEX IF NOT EXISTS idx_users_company ON users(company_name);
-"""
-
-def init_user_table() -> None:
-	"""Tạo bảng users nếu chưa tồn tại."""
-	db.executescript(_USERS_TABLE_SQL)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))  # giây; 0 = tắt cache
+USER_BULK_MAX_IDS = int(os.getenv("USER_BULK_MAX_IDS", "10000"))
+
+# các trường bulk_update_users được phép đặt / lọc theo
+BULK_FIELDS = ("is_active", "role", "daily_search_limit")
+BULK_FILTERS = ("company_name", "role", "is_active")
+USER_ROLES = ("user", "admin")  # khớp CHECK của bảng users
+
+BULK_UPDATED = "updated"
+BULK_UNCHANGED = "unchanged"
+BULK_NOT_FOUND = "not_found"
+
+
+class UserProfileCache:
+	"""
+	LRU có TTL cho kết quả get_user_by_id (profile kèm company lồng nhau).
+	Mọi hàm ghi bảng users trong module này đều gọi invalidate/replace cho user liên quan,
+	nên trong một process cache luôn đúng; TTL chỉ giới hạn độ trễ khi một worker khác
+	(serve.py) hoặc công cụ ngoài ghi vào bảng users.
+	"""
+	def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+		self._generation = 0
+		self._lock = threading.Lock()
+
+	@property
+	def enabled(self) -> bool:
+		return self.maxsize > 0 and self.ttl > 0
+
+	def generation(self) -> int:
+		"""Đọc trước khi SELECT; put() bỏ qua kết quả nếu có lần ghi nào xen vào giữa."""
+		return self._generation
+
+	def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+		with self._lock:
+			entry = self._entries.get(user_id)
+			if entry is None:
+				return None
+			expires, profile = entry
+			if expires <= time.monotonic():
+				del self._entries[user_id]
+				return None
+			self._entries.move_to_end(user_id)
+			return profile
+
+	def put(self, user_id: str, profile: Dict[str, Any], generation: int) -> None:
+		if not self.enabled:
+			return
+		with self._lock:
+			if generation != self._generation:
+				return
+			self._store(user_id, profile)
+
+	def replace(self, user_id: str, profile: Dict[str, Any]) -> None:
+		"""Sau một lần ghi trả về hàng mới (RETURNING): thay bản cũ bằng hàng đó."""
+		with self._lock:
+			self._generation += 1
+			if self.enabled:
+				self._store(user_id, profile)
+
+	def invalidate(self, user_id: str) -> None:
+		with self._lock:
+			self._generation += 1
+			self._entries.pop(user_id, None)
+
+	def invalidate_many(self, user_ids: Sequence[str]) -> None:
+		with self._lock:
+			self._generation += 1
+			for user_id in user_ids:
+				self._entries.pop(user_id, None)
+
+	def clear(self) -> None:
+		with self._lock:
+			self._generation += 1
+			self._entries.clear()
+
+	def _store(self, user_id: str, profile: Dict[str, Any]) -> None:
+		self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+		self._entries.move_to_end(user_id)
+		while len(self._entries) > self.maxsize:
+			self._entries.popitem(last=False)
+
+
+profile_cache = UserProfileCache()
+
+
+def _profile(row) -> Dict[str, Any]:
+	user = dict(row)
+	# Create nested company object
+	user["company"] = {
+		"name": user.get("company_name"),
+		"registration_number": user.get("registration_number"),
+		"activities": user.get("activities"),
+		"employee_count": user.get("employee_count"),
+		"phone": user.get("company_phone"),
+	}
+	return user
+
 
 def create_user(
 	email: str, 
@@ -79,7 +144,8 @@ def create_user(
 			company_phone, first_name, last_name, job_position, professional_address, 
 			postal_code, city, direct_phone, mobile_phone, 
 			activities_other, country, role, is_active, daily_search_limit, daily_search_remaining
-		) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+		) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+		RETURNING *;
 	"""
 	params = (
 		user_id, email, password_hash, company_name, registration_number, activities, employee_count,
@@ -87,7 +153,9 @@ def create_user(
 		postal_code, city, direct_phone, mobile_phone,
 		activities_other, country, role, is_active, daily_search_limit, daily_search_limit
 	)
-	db.execute(sql, params, commit=True)
+	rows = db.execute_returning(sql, params)
+	# register_user đọc lại user ngay sau khi tạo: lấy từ cache thay vì SELECT lần nữa
+	profile_cache.replace(user_id, _profile(rows[0]))
 	return user_id
 
 def _refresh_daily_quota_if_expired(user_id: str, row: Dict[str, Any]) -> Dict[str, Any]:
@@ -100,6 +168,7 @@ def _refresh_daily_quota_if_expired(user_id: str, row: Dict[str, Any]) -> Dict[s
 			(limit, today, user_id),
 			commit=True
 		)
+		profile_cache.invalidate(user_id)
 		row_dict["daily_search_remaining"] = limit
 		row_dict["last_search_date"] = today
 	return row_dict
@@ -115,6 +184,7 @@ def check_and_increment_search(user_id: str) -> Dict[str, Any]:
 	limit = row["daily_search_limit"] if row["daily_search_limit"] is not None else 20
 	remaining = row["daily_search_remaining"] if row["daily_search_remaining"] is not None else limit
 	if remaining <= 0:
+		QUOTA_REJECTIONS.inc()
 		return {"allowed": False, "remaining": 0, "limit": limit}
 	new_remaining = max(remaining - 1, 0)
 	today = datetime.now().strftime("%Y-%m-%d")
@@ -123,24 +193,21 @@ def check_and_increment_search(user_id: str) -> Dict[str, Any]:
 		(new_remaining, today, user_id),
 		commit=True
 	)
+	profile_cache.invalidate(user_id)
 	log_query.increment_daily_search_log(user_id)
 	return {"allowed": True, "remaining": new_remaining, "limit": limit}
 
 def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
-	row = db.fetch_one("SELECT * FROM users WHERE id = ?;", (user_id,))
-	if not row:
-		return None
-	
-	user = dict(row)
-	# Create nested company object
-	user["company"] = {
-		"name": user.get("company_name"),
-		"registration_number": user.get("registration_number"),
-		"activities": user.get("activities"),
-		"employee_count": user.get("employee_count"),
-		"phone": user.get("company_phone"),
-	}
-	return user
+	"""Profile của user (đọc qua profile_cache); trả về bản sao nên caller có thể sửa tự do."""
+	profile = profile_cache.get(user_id)
+	if profile is None:
+		generation = profile_cache.generation()
+		row = db.fetch_one("SELECT * FROM users WHERE id = ?;", (user_id,))
+		if not row:
+			return None
+		profile = _profile(row)
+		profile_cache.put(user_id, profile, generation)
+	return {**profile, "company": dict(profile["company"])}
 
 def get_user_by_registration_number(registration_number: str) -> Optional[Dict[str, Any]]:
 	return db.fetch_one("SELECT * FROM users WHERE registration_number = ?;", (registration_number,))
@@ -167,34 +234,24 @@ def update_user(user_id: str, **fields) -> bool:
 	cols += ", updated_at = datetime('now')"
 	
 	params = tuple(fields.values()) + (user_id,)
-	sql = f"UPDATE users SET {cols} WHERE id = ?;"
-	db.execute(sql, params, commit=True)
-	row = db.fetch_one("SELECT id FROM users WHERE id = ?;", (user_id,))
-	return row is not None
+	sql = f"UPDATE users SET {cols} WHERE id = ? RETURNING *;"
+	rows = db.execute_returning(sql, params)
+	if not rows:
+		return False
+	# route đọc lại user ngay sau khi cập nhật: hàng RETURNING đã là bản mới nhất
+	profile_cache.replace(user_id, _profile(rows[0]))
+	return True
 
 def delete_user(user_id: str) -> bool:
-	db.execute("DELETE FROM users WHERE id = ?;", (user_id,), commit=True)
-	row = db.fetch_one("SELECT id FROM users WHERE id = ?;", (user_id,))
-	return row is None
+	"""True nếu có user bị xóa."""
+	deleted = db.execute("DELETE FROM users WHERE id = ?;", (user_id,), commit=True).rowcount
+	profile_cache.invalidate(user_id)
+	return deleted > 0
 
 def list_users(limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
-	rows = db.fetch_all("SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?;", (limit, offset))
-	
+	rows = db.fetch_rows("SELECT * FROM users ORDER BY created_at DESC LIMIT ? OFFSET ?;", (limit, offset))
 	# Transform to include nested company object
-	users = []
-	for row in rows:
-		user = dict(row)
-		# Create nested company object
-		user["company"] = {
-			"name": user.get("company_name"),
-			"registration_number": user.get("registration_number"),
-			"activities": user.get("activities"),
-			"employee_count": user.get("employee_count"),
-			"phone": user.get("company_phone"),
-		}
-		users.append(user)
-	
-	return users
+	return [_profile(row) for row in rows]
 
 def get_daily_search_limit(user_id: str) -> Optional[Dict[str, int]]:
 	row = db.fetch_one(
@@ -219,6 +276,7 @@ def decrement_daily_search_limit(user_id: str) -> Optional[Dict[str, int]]:
 	limit = row["daily_search_limit"] if row["daily_search_limit"] is not None else 20
 	remaining = row["daily_search_remaining"] if row["daily_search_remaining"] is not None else limit
 	if remaining <= 0:
+		QUOTA_REJECTIONS.inc()
 		return None
 	new_remaining = max(remaining - 1, 0)
 	today = datetime.now().strftime("%Y-%m-%d")
@@ -227,16 +285,120 @@ def decrement_daily_search_limit(user_id: str) -> Optional[Dict[str, int]]:
 		(new_remaining, today, user_id),
 		commit=True
 	)
+	profile_cache.invalidate(user_id)
 	log_query.increment_daily_search_log(user_id)
 	return {"daily_search_limit": limit, "daily_search_remaining": new_remaining}
 
 def reset_password(user_id: str, new_password: str) -> bool:
 	"""Reset password for a user (admin function)."""
-	pw_hash = bcrypt.hash(new_password)
-	db.execute(
+	pw_hash = hash_password(new_password)
+	updated = db.execute(
 		"UPDATE users SET password_hash = ?, updated_at = datetime('now') WHERE id = ?;",
 		(pw_hash, user_id),
 		commit=True
+	).rowcount
+	profile_cache.invalidate(user_id)
+	return updated > 0
+
+def update_password_hash(user_id: str, pw_hash: str) -> None:
+	"""Store a new hash for an existing password (transparent rehash on login)."""
+	db.execute(
+		"UPDATE users SET password_hash = ? WHERE id = ?;",
+		(pw_hash, user_id),
+		commit=True
 	)
-	row = db.fetch_one("SELECT id FROM users WHERE id = ?;", (user_id,))
-	return row is not None
\ No newline at end of file
+	profile_cache.invalidate(user_id)
+
+def bulk_update_users(
+	changes: Dict[str, Any],
+	ids: Optional[Sequence[str]] = None,
+	filters: Optional[Dict[str, Any]] = None,
+	reset_search_quota: bool = False,
+) -> Dict[str, Any]:
+	"""
+	Áp cùng một bộ thay đổi (is_active, role, daily_search_limit; reset_search_quota đặt lại
+	daily_search_remaining = daily_search_limit) cho danh sách ids HOẶC cho mọi user khớp filters
+	(company_name, role, is_active), bằng một câu UPDATE trong một transaction.
+	Hàng đã có sẵn các giá trị mới không bị ghi (updated_at giữ nguyên).
+	Trả về số lượng và kết quả theo từng id: updated / unchanged / not_found.
+	Ném ValueError nếu yêu cầu không hợp lệ.
+	"""
+	unknown = set(changes) - set(BULK_FIELDS)
+	if unknown:
+		raise ValueError(f"Unsupported fields: {sorted(unknown)}")
+	if not changes and not reset_search_quota:
+		raise ValueError("Nothing to change")
+	if "role" in changes and changes["role"] not in USER_ROLES:
+		raise ValueError(f"role must be one of {list(USER_ROLES)}")
+	if (ids is None) == (filters is None):
+		raise ValueError("Exactly one of ids or filter is required")
+	if filters is not None:
+		unknown = set(filters) - set(BULK_FILTERS)
+		if unknown:
+			raise ValueError(f"Unsupported filters: {sorted(unknown)}")
+		if not filters:
+			raise ValueError("Filter needs at least one criterion")
+	else:
+		ids = list(dict.fromkeys(ids))
+		if not ids:
+			raise ValueError("ids is empty")
+		if len(ids) > USER_BULK_MAX_IDS:
+			raise ValueError(f"At most {USER_BULK_MAX_IDS} ids per request")
+
+	sets, set_params, diffs, diff_params = [], [], [], []
+	for col, value in changes.items():
+		sets.append(f"{col} = ?")
+		set_params.append(value)
+		diffs.append(f"{col} IS NOT ?")
+		diff_params.append(value)
+	today = datetime.now().strftime("%Y-%m-%d")
+	# như update_user: đổi giới hạn thì lượt còn lại được đặt lại theo giới hạn mới
+	if "daily_search_limit" in changes:
+		sets += ["daily_search_remaining = ?", "last_search_date = ?"]
+		set_params += [changes["daily_search_limit"], today]
+		diffs.append("daily_search_remaining IS NOT ?")
+		diff_params.append(changes["daily_search_limit"])
+	elif reset_search_quota:
+		sets += ["daily_search_remaining = COALESCE(daily_search_limit, 20)", "last_search_date = ?"]
+		set_params.append(today)
+		diffs.append("daily_search_remaining IS NOT COALESCE(daily_search_limit, 20)")
+	sets.append("updated_at = datetime('now')")
+
+	conn = db._connect()
+	try:
+		conn.execute("BEGIN IMMEDIATE;")
+		if ids is not None:
+			conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_user_ids (id TEXT PRIMARY KEY);")
+			conn.executemany("INSERT INTO temp.bulk_user_ids (id) VALUES (?);", ((i,) for i in ids))
+			target, target_params = "id IN (SELECT id FROM temp.bulk_user_ids)", []
+		else:
+			target = " AND ".join(f"{col} = ?" for col in filters)
+			target_params = list(filters.values())
+		matched = [row[0] for row in conn.execute(f"SELECT id FROM users WHERE {target};", target_params)]
+		updated = {
+			row[0] for row in conn.execute(
+				f"UPDATE users SET {', '.join(sets)} WHERE {target} AND ({' OR '.join(diffs)}) RETURNING id;",
+				set_params + target_params + diff_params,
+			)
+		}
+		conn.commit()
+	except Exception:
+		if conn.in_transaction:
+			conn.rollback()
+		raise
+	finally:
+		conn.close()
+	profile_cache.invalidate_many(list(updated))
+
+	found = set(matched)
+	results = [
+		{"id": user_id, "status": BULK_UPDATED if user_id in updated else BULK_UNCHANGED if user_id in found else BULK_NOT_FOUND}
+		for user_id in (ids if ids is not None else matched)
+	]
+	return {
+		"matched": len(matched),
+		"updated": len(updated),
+		"unchanged": len(matched) - len(updated),
+		"not_found": len(results) - len(matched),
+		"results": results,
+	}
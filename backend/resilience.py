@@ -0,0 +1,281 @@
+"""
+Resilience primitives for upstream calls: circuit breaker, jittered retries,
+hedged requests and a rate-limited priority scheduler. Dùng cho client
+ASPExcel trong calc_data.py.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open."""
+    pass
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a caller waited longer than its timeout for a scheduler slot."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    closed -> open sau `failure_threshold` lỗi liên tiếp.
+    open -> half_open sau `recovery_timeout` giây; ở half_open chỉ cho
+    `half_open_max_calls` request thăm dò chạy cùng lúc. Thăm dò thành công
+    -> closed, thất bại -> open lại.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1,
+                 on_state_change: Optional[Callable[[str], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            self._state = state
+            if self.on_state_change:
+                self.on_state_change(state)
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._set_state(self.HALF_OPEN)
+            self._probes = 0
+
+    def allow(self) -> bool:
+        """True nếu được phép gọi upstream. Ở half_open, mỗi lần True chiếm một slot thăm dò."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def cancel(self) -> None:
+        """Trả lại slot thăm dò khi lời gọi được allow() nhưng bị hủy trước khi tới upstream."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probes = 0
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self._set_state(self.OPEN)
+
+
+class LatencyTracker:
+    """Cửa sổ trượt các độ trễ thành công gần nhất, dùng để tính ngưỡng hedge (p95)."""
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < 20:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def retry_call(fn: Callable[[], T], retries: int, base_delay: float, max_delay: float,
+               retry_on: Tuple[Type[BaseException], ...], on_retry: Optional[Callable[[int, BaseException], None]] = None) -> T:
+    """
+    Gọi fn, thử lại tối đa `retries` lần khi gặp lỗi thuộc retry_on, với backoff
+    lũy thừa có full jitter. Các lỗi khác được ném ra ngay.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except retry_on as exc:
+            if attempt >= retries:
+                raise
+            attempt += 1
+            if on_retry:
+                on_retry(attempt, exc)
+            time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1)))))
+
+
+def hedged_call(fn: Callable[[], T], delay: Optional[float], executor: ThreadPoolExecutor,
+                on_hedge: Optional[Callable[[], None]] = None) -> T:
+    """
+    Chạy fn; nếu sau `delay` giây chưa xong thì chạy thêm một bản sao và lấy kết quả
+    thành công đến trước. delay=None -> không hedge. Bản chạy chậm hơn không bị hủy
+    (không thể hủy một HTTP request đang chạy) nhưng kết quả của nó bị bỏ qua.
+    """
+    if delay is None:
+        return fn()
+    first: Future = executor.submit(fn)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    if on_hedge:
+        on_hedge()
+    pending = {first, executor.submit(fn)}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            exc = fut.exception()
+            if exc is None:
+                return fut.result()
+            error = exc
+    raise error  # type: ignore[misc]
+
+
+class PriorityScheduler:
+    """
+    Điều phối mọi lời gọi upstream: giới hạn tốc độ toàn cục (token bucket
+    `rate` request/giây, `burst` token) và số request chạy đồng thời
+    (`max_concurrency`). Các caller chờ theo thứ tự (priority, thứ tự đến):
+    priority nhỏ hơn luôn được phục vụ trước, nên request tương tác vượt lên
+    trước các job nền đang xếp hàng. rate <= 0 -> không giới hạn tốc độ.
+    """
+    def __init__(self, rate: float, burst: float, max_concurrency: int,
+                 on_acquire: Optional[Callable[[int, float], None]] = None):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_concurrency = max(1, max_concurrency)
+        self.on_acquire = on_acquire
+        self._cond = threading.Condition()
+        self._waiting: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._acquired: Dict[int, int] = {}
+        self._timeouts: Dict[int, int] = {}
+        self._wait_total: Dict[int, float] = {}
+
+    def configure(self, rate: float, burst: float, max_concurrency: int) -> None:
+        """Đổi giới hạn khi đang chạy (ví dụ chia cho các worker sau fork); token hiện có bị cắt về burst mới."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = rate
+            self.burst = max(1.0, burst)
+            self.max_concurrency = max(1, max_concurrency)
+            self._tokens = min(self._tokens, self.burst)
+            # giới hạn nới ra thì caller đang chờ có thể được đi ngay
+            self._cond.notify_all()
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int, timeout: Optional[float] = None) -> float:
+        """Chờ tới lượt; trả về số giây đã chờ. Ném SchedulerTimeout nếu quá timeout."""
+        ticket = (priority, next(self._seq))
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait_for: Optional[float] = None
+                    if self._waiting[0] == ticket and self._active < self.max_concurrency:
+                        if self.rate <= 0 or self._tokens >= 1:
+                            break
+                        wait_for = (1 - self._tokens) / self.rate
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self._timeouts[priority] = self._timeouts.get(priority, 0) + 1
+                            raise SchedulerTimeout(f"no upstream slot within {timeout:g}s")
+                        wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                    self._cond.wait(wait_for)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            self._active += 1
+            if self.rate > 0:
+                self._tokens -= 1
+            waited = time.monotonic() - start
+            self._acquired[priority] = self._acquired.get(priority, 0) + 1
+            self._wait_total[priority] = self._wait_total.get(priority, 0.0) + waited
+            # người đứng đầu hàng đợi mới cần kiểm tra lại điều kiện
+            self._cond.notify_all()
+        if self.on_acquire:
+            self.on_acquire(priority, waited)
+        return waited
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: int, timeout: Optional[float] = None) -> Iterator[float]:
+        waited = self.acquire(priority, timeout)
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            self._refill(time.monotonic())
+            depth: Dict[int, int] = {}
+            for priority, _ in self._waiting:
+                depth[priority] = depth.get(priority, 0) + 1
+            priorities = sorted(set(depth) | set(self._acquired) | set(self._timeouts))
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "rate": self.rate,
+                "tokens": round(self._tokens, 3),
+                "priorities": {
+                    p: {
+                        "queued": depth.get(p, 0),
+                        "acquired": self._acquired.get(p, 0),
+                        "timeouts": self._timeouts.get(p, 0),
+                        "avg_wait_seconds": self._wait_total.get(p, 0.0) / self._acquired[p] if self._acquired.get(p) else 0.0,
+                    }
+                    for p in priorities
+                },
+            }
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, status, Depends
 from pydantic import BaseModel, EmailStr
-from typing import Optional
-from services.auth_service import register_user, authenticate_user
+from typing import Optional, Dict, Any
+from services.auth_service import register_user, authenticate_user, issue_tokens, refresh_tokens
+from middleware.middleware import AuthError, get_current_user
+from services.password_service import PasswordHasherBusy
 
 router = APIRouter(prefix="/auth")
 
@@ -29,6 +31,15 @@ class LoginRequest(BaseModel):
 	registration_number: str
 	password: str
 
+class RefreshRequest(BaseModel):
+	refresh_token: str
+
+class TokenResponse(BaseModel):
+	access_token: str
+	refresh_token: str
+	token_type: str = "bearer"
+	expires_in: int
+
 class UserResponse(BaseModel):
 	id: str
 	email: EmailStr
@@ -37,20 +48,50 @@ class UserResponse(BaseModel):
 	created_at: Optional[str] = None
 	is_active: Optional[int] = 1
 
+class LoginResponse(UserResponse):
+	access_token: str
+	refresh_token: str
+	token_type: str = "bearer"
+	expires_in: int
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def register(req: RegisterRequest):
-	print("Register request received")
 	try:
 		# Pass the entire dictionary to register_user
 		user = register_user(req.dict())
 		return user
 	except ValueError as e:
 		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+	except PasswordHasherBusy:
+		raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, please retry")
 
-@router.post("/login", response_model=UserResponse)
+@router.post("/login", response_model=LoginResponse)
 def login(req: LoginRequest):
-	print(req)
-	user = authenticate_user(req.registration_number, req.password)
+	try:
+		user = authenticate_user(req.registration_number, req.password)
+	except PasswordHasherBusy:
+		raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, please retry")
 	if not user:
 		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid credentials")
-	return user
+	return {**user, **issue_tokens(user)}
+
+@router.post("/refresh", response_model=TokenResponse)
+def refresh(req: RefreshRequest):
+	try:
+		tokens = refresh_tokens(req.refresh_token)
+	except AuthError:
+		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid refresh token")
+	if not tokens:
+		raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid refresh token")
+	return tokens
+
+@router.get("/me")
+def me(current_user: Dict[str, Any] = Depends(get_current_user)):
+	# Lấy trực tiếp từ access token đã xác thực (scope["user"]), không truy vấn DB
+	return {
+		"id": current_user["sub"],
+		"email": current_user.get("email"),
+		"role": current_user.get("role"),
+		"registration_number": current_user.get("registration_number"),
+		"is_active": current_user.get("is_active"),
+	}
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from typing import Optional
+from middleware.middleware import require_admin
+from calc_data import ASPEXCEL_MODEL_VERSION, CALC_MAX_AGE_DAYS, _PRIORITY_NAMES, stale_refresher, upstream_scheduler
+from cache_backends import calc_cache
+from cache_stats import key_stats
+from log import get_logger
+
+logger = get_logger(__name__)
+
+router = APIRouter(prefix="/admin/calc-cache", tags=["calc-cache"], dependencies=[Depends(require_admin)])
+
+class StaleSlice(BaseModel):
+    W: Optional[int] = None
+    T: Optional[int] = None
+    B: Optional[int] = None
+    Angle: Optional[int] = None
+    a: Optional[int] = None
+    Icc: Optional[int] = None
+    Force: Optional[int] = None
+    NbrePhase: Optional[int] = None
+
+@router.post("/stale")
+def mark_stale(body: StaleSlice):
+    """Đánh dấu stale một lát cắt của cache (vd. {"NbrePhase": 3} hoặc {"Icc": 50}); các bản ghi được làm mới khi được tra cứu."""
+    filters = {k: v for k, v in body.dict().items() if v is not None}
+    if not filters:
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    marked = calc_cache.mark_stale(filters)
+    logger.info("calc_excel marked stale", extra={"filters": filters, "rows": marked})
+    return {"marked": marked, "filters": filters}
+
+@router.get("/status")
+def cache_status():
+    return {
+        "backend": calc_cache.name,
+        "model_version": ASPEXCEL_MODEL_VERSION,
+        "max_age_days": CALC_MAX_AGE_DAYS,
+        "refresh_pending": stale_refresher.pending(),
+    }
+
+@router.get("/scheduler")
+def scheduler_status():
+    """Hàng đợi của scheduler upstream: số request đang chạy, token còn lại, độ sâu và thời gian chờ theo lớp ưu tiên."""
+    stats = upstream_scheduler.stats()
+    stats["priorities"] = {_PRIORITY_NAMES.get(p, str(p)): v for p, v in stats["priorities"].items()}
+    return stats
+
+@router.get("/report")
+def cache_report(top: int = Query(20, ge=1, le=1000)):
+    """
+    Hiệu quả cache của worker này: tỉ lệ hit, miss theo lý do, kết quả gọi upstream sau miss,
+    số khóa bị chuẩn hóa theo quy tắc, và các khóa nóng / khóa bị gộp nhiều nhất (lấy mẫu).
+    """
+    report = key_stats.report(top)
+    report["backend"] = calc_cache.name
+    return report
+
+@router.post("/report/reset")
+def reset_report():
+    """Xóa các sketch khóa nóng của worker này; bộ đếm Prometheus không bị ảnh hưởng."""
+    key_stats.reset()
+    return {"reset": True}
@@ -0,0 +1,94 @@
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from middleware.middleware import require_admin
+from catalog import catalog
+from services.query_busbar_service import search_components_service
+from database.catalog_io import CatalogImportError, TABLES, import_catalog, iter_export
+from database.catalog_publish import (
+    CatalogNotPublished, CatalogPublishInProgress, discard, list_versions, publish, staged_changes,
+)
+from log import get_logger
+
+logger = get_logger(__name__)
+
+router = APIRouter(prefix="/admin/catalog", tags=["catalog"], dependencies=[Depends(require_admin)])
+
+@router.post("/import")
+def import_files(
+    files: List[UploadFile] = File(...),
+    mode: str = Query("merge", pattern="^(merge|replace)$"),
+    dry_run: bool = False,
+    publish_after: bool = Query(False, alias="publish"),
+    user: dict = Depends(require_admin),
+):
+    """
+    Nạp catalog từ file .json/.csv/.xlsx vào staging trong một transaction; lỗi kiểm tra -> 422,
+    không ghi gì. publish=true: publish ngay sau khi nạp.
+    """
+    try:
+        result = import_catalog([(f.filename or "", f.file.read()) for f in files], mode=mode, dry_run=dry_run)
+    except CatalogImportError as e:
+        raise HTTPException(status_code=422, detail={"errors": e.errors, "total_errors": e.total})
+    logger.info("Catalog import", extra={"files": [f.filename for f in files], **result})
+    if publish_after and not dry_run:
+        result["published"] = _publish(user)
+    return result
+
+def _publish(user: dict):
+    try:
+        result = publish(published_by=user.get("email") or str(user.get("sub", "")))
+    except CatalogPublishInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    catalog.refresh()
+    return result
+
+@router.get("/staging")
+def get_staged_changes(limit: int = Query(100, ge=1, le=1000)):
+    """Thay đổi trong staging chưa được publish (so với version tìm kiếm đang dùng)."""
+    try:
+        return staged_changes(limit=limit)
+    except CatalogNotPublished as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/search")
+def search_staging(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Như /searchComponents nhưng trên staging (gồm cả thay đổi chưa publish)."""
+    return search_components_service(q, limit, offset, staging=True)
+
+@router.post("/publish")
+def publish_catalog(user: dict = Depends(require_admin)):
+    """Publish staging thành snapshot mới; mọi worker chuyển sang version mới. 409 nếu đang có lần publish khác."""
+    return _publish(user)
+
+@router.post("/discard")
+def discard_staged_changes():
+    """Bỏ mọi thay đổi chưa publish: staging được chép lại từ version đang publish."""
+    try:
+        return discard()
+    except CatalogNotPublished as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/versions")
+def get_versions(limit: int = Query(20, ge=1, le=200)):
+    return {**list_versions(limit=limit), "serving": catalog.version}
+
+@router.get("/export")
+def export_catalog(
+    format: str = Query("json", pattern="^(json|csv)$"),
+    table: Optional[str] = Query(None, pattern=f"^({'|'.join(TABLES)})$"),
+):
+    """Export streaming (json: cả hai bảng hoặc một bảng; csv: bắt buộc có table)."""
+    if format == "csv" and table is None:
+        raise HTTPException(status_code=400, detail="table is required for csv export")
+    name = table or "catalog"
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/json"
+    return StreamingResponse(
+        iter_export(format, table),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
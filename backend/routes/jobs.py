@@ -0,0 +1,93 @@
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from log import get_logger
+from models.schemas import QueryBusbarRequest, ForceLimitRequest, IccSweepRequest
+from models import job as job_model
+from services.job_service import job_manager, JobQueueFull
+from services.query_busbar_service import icc_sweep_values
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+logger = get_logger(__name__)
+
+# Khoảng thời gian giữa hai lần đọc trạng thái job khi stream sự kiện
+EVENTS_POLL_SECONDS = 0.5
+
+def _public(job):
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "progress": {"done": job["progress_done"], "total": job["progress_total"]},
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "expires_at": job["expires_at"],
+    }
+
+def _submit(kind, params):
+    try:
+        job, created = job_manager.submit(kind, params)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    body = _public(job)
+    body["deduplicated"] = not created
+    return JSONResponse(status_code=202, content=body, headers={"Location": f"/jobs/{job['id']}"})
+
+@router.post("/queryBusbar", status_code=202)
+def submit_query_busbar(data: QueryBusbarRequest):
+    return _submit("query_busbar", data.dict())
+
+@router.post("/forceLimit", status_code=202)
+def submit_force_limit(data: ForceLimitRequest):
+    return _submit("force_limit", data.dict())
+
+@router.post("/iccSweep", status_code=202)
+def submit_icc_sweep(data: IccSweepRequest):
+    params = data.dict()
+    try:
+        icc_sweep_values(params)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return _submit("icc_sweep", params)
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = job_model.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return _public(job)
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events: một sự kiện 'progress' mỗi khi tiến độ đổi, kết thúc bằng 'done' hoặc 'failed'."""
+    job = await run_in_threadpool(job_model.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+
+    async def stream():
+        last = None
+        current = job
+        while True:
+            if current is None:
+                yield "event: failed\ndata: {\"error\": \"job expired\"}\n\n"
+                return
+            body = _public(current)
+            if current["status"] in job_model.FINAL_STATUSES:
+                yield f"event: {current['status']}\ndata: {json.dumps(body)}\n\n"
+                return
+            state = (current["status"], current["progress_done"], current["progress_total"])
+            if state != last:
+                last = state
+                yield f"event: progress\ndata: {json.dumps(body)}\n\n"
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+            if await request.is_disconnected():
+                return
+            current = await run_in_threadpool(job_model.get_job, job_id)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
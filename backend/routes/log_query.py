@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from datetime import datetime
 from typing import Optional
 from models import log_query as log_model
+from middleware.middleware import require_admin
+from log import get_logger
 
-router = APIRouter(prefix="/admin", tags=["analytics"])
+logger = get_logger(__name__)
+
+router = APIRouter(prefix="/admin", tags=["analytics"], dependencies=[Depends(require_admin)])
 
 @router.get("/analytics")
 def get_analytics(
@@ -37,9 +41,7 @@ def get_analytics(
 	except HTTPException:
 		raise
 	except Exception as exc:
-		print(f"[analytics] error: {exc}")
-		import traceback
-		traceback.print_exc()
+		logger.exception("analytics error: %s", exc)
 		raise HTTPException(status_code=500, detail=f"Internal server error: {str(exc)}")
 
 @router.get("/search-logs")
@@ -51,7 +53,7 @@ def list_search_logs(limit: int = Query(100, ge=1, le=500), offset: int = Query(
 	except HTTPException:
 		raise
 	except Exception as exc:
-		print(f"[analytics] list logs error: {exc}")
+		logger.exception("list logs error: %s", exc)
 		raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/search-logs/{user_id}")
@@ -63,5 +65,5 @@ def get_user_search_logs(user_id: str, days: int = Query(30, ge=1, le=365)):
 	except HTTPException:
 		raise
 	except Exception as exc:
-		print(f"[analytics] user logs error: {exc}")
+		logger.exception("user logs error: %s", exc)
 		raise HTTPException(status_code=500, detail="Internal server error")
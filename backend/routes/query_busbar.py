@@ -1,32 +1,72 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Query
-from fastapi.responses import FileResponse
+import logging
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from typing import Optional
 
+from catalog import catalog, TextIndexMissing
+from calc_data import FetchLimitExceeded
+from log import get_logger
+from middleware.middleware import require_admin
+
 from models.schemas import (
-    QueryBusbarRequest, CalcExcelRequest, ComponentInfo,
+    QueryBusbarRequest, IccSweepRequest, CalcExcelRequest, ComponentInfo,
     DeleteComponentRequest, GetComponentsListRequest,
     ImagePath, FilePath
 )
 from services.query_busbar_service import (
-    query_busbar_service, calc_excel_service, send_asp_excel_service,
+    query_busbar_service, icc_sweep_service, icc_sweep_values, is_degraded, calc_excel_service, send_asp_excel_service,
     get_components_service, update_component_service, delete_component_service,
-    create_component_service, get_components_list_service,
-    save_uploaded_file, delete_path
+    create_component_service, get_components_list_service, search_components_service, search_facets_service,
+    save_uploaded_file, delete_path, ICC_SWEEP_MAX_FETCH
 )
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 @router.post("/queryBusbar")
-async def query_busbar(data: QueryBusbarRequest):
+def query_busbar(data: QueryBusbarRequest):
     try:
-        products = query_busbar_service(data.dict())
-        print(products)
-        return {"products": products}
+        snapshot = catalog.current()
+        products = query_busbar_service(data.dict(), snapshot=snapshot)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("queryBusbar products: %s", products)
+        # products chỉ gồm kiểu JSON cơ bản: bỏ qua jsonable_encoder (chậm với danh sách lớn)
+        return JSONResponse(
+            {"products": products, "degraded": is_degraded(products)},
+            # version catalog đã dùng cho kết quả này: dùng làm khóa cho cache phía sau
+            headers={"X-Catalog-Version": snapshot.version},
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/iccSweep")
+def icc_sweep(data: IccSweepRequest):
+    """
+    L của mọi sản phẩm cho một cấu hình với nhiều giá trị Icc (ma trận series x icc, sẵn để vẽ biểu đồ).
+    Sweep có hơn ICC_SWEEP_MAX_FETCH khóa chưa có trong cache bị từ chối (409): chạy qua /jobs/iccSweep.
+    """
+    params = data.dict()
+    try:
+        icc_sweep_values(params)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        snapshot = catalog.current()
+        result = icc_sweep_service(params, snapshot=snapshot, max_fetch=ICC_SWEEP_MAX_FETCH)
+        return JSONResponse(result, headers={"X-Catalog-Version": snapshot.version})
+    except FetchLimitExceeded as e:
+        raise HTTPException(status_code=409, detail={
+            "message": "Too many uncached values for a synchronous sweep, submit it to /jobs/iccSweep",
+            "uncached": e.misses,
+            "limit": e.limit,
+            "job": "/jobs/iccSweep",
+        })
+    except Exception:
+        logger.exception("iccSweep failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @router.post("/calcExcel")
-async def calc_excel(data: CalcExcelRequest):
+def calc_excel(data: CalcExcelRequest):
     try:
         L = calc_excel_service(data.dict())
         return {"L": L if L else None}
@@ -34,7 +74,7 @@ async def calc_excel(data: CalcExcelRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/sendAspExcel")
-async def send_asp_excel(W: float, T: float, B: int, Angle: float, a: float, Icc: float, Force: float, poles: int):
+def send_asp_excel(W: float, T: float, B: int, Angle: float, a: float, Icc: float, Force: float, poles: int):
     try:
         resp = send_asp_excel_service(W, T, B, Angle, a, Icc, Force, poles)
         return {"response": resp if resp else "No response from ASPExcel"}
@@ -44,26 +84,25 @@ async def send_asp_excel(W: float, T: float, B: int, Angle: float, a: float, Icc
 @router.get("/getComponents")
 async def get_components(component_id: Optional[str] = None, nbphase: Optional[int] = None):
     try:
-        print(component_id, nbphase)
         components, component_list = get_components_service(component_id, nbphase)
-        print(components, component_list)
+        logger.debug("getComponents %s/%s: %s %s", component_id, nbphase, components, component_list)
         if components and component_list:
             return {"components": components, "components_list": component_list}
         raise HTTPException(status_code=404, detail="Component not found")
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/updateComponent")
+@router.post("/updateComponent", dependencies=[Depends(require_admin)])
 async def update_component(component: ComponentInfo):
     try:
-        ok = update_component_service(component.dict())
-        if ok:
-            return {"message": "Component updated successfully"}
+        result = update_component_service(component.dict())
+        if result:
+            return {"message": "Component updated successfully", "changes": result["changes"]}
         raise HTTPException(status_code=404, detail="Component not found")
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.delete("/deleteComponent")
+@router.delete("/deleteComponent", dependencies=[Depends(require_admin)])
 async def delete_component(payload: DeleteComponentRequest):
     try:
         ok = delete_component_service(payload.component_id, payload.nbphase)
@@ -73,12 +112,12 @@ async def delete_component(payload: DeleteComponentRequest):
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@router.post("/createComponent")
+@router.post("/createComponent", dependencies=[Depends(require_admin)])
 async def create_component(component: ComponentInfo):
     try:
-        ok = create_component_service(component.dict())
-        if ok:
-            return {"message": "Component created successfully"}
+        result = create_component_service(component.dict())
+        if result:
+            return {"message": "Component created successfully", "changes": result["changes"]}
         raise HTTPException(status_code=400, detail="Failed to create component")
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -93,6 +132,52 @@ async def get_components_list(component_id: str, nbphase: int):
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/searchComponents")
+def search_components(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Tìm theo tiền tố (key, numart, từ trong info) trên catalog đang publish, kết quả tốt nhất trước."""
+    try:
+        return search_components_service(q, limit, offset)
+    except TextIndexMissing:
+        raise HTTPException(status_code=503, detail="Published catalog has no text index; publish a new version")
+    except Exception:
+        logger.exception("searchComponents failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+@router.get("/searchFacets")
+def search_facets(
+    request: Request,
+    perPhase: Optional[str] = None,
+    thickness: Optional[str] = None,
+    width: Optional[str] = None,
+    poles: Optional[str] = None,
+    shape: Optional[str] = None,
+):
+    """
+    Giá trị còn chọn được cho từng trường của form /queryBusbar và số sản phẩm, theo các trường
+    đã chọn. ETag = version catalog: client gửi If-None-Match và nhận 304 cho đến lần publish sau.
+    """
+    snapshot = catalog.current()
+    headers = {"ETag": f'"catalog-v{snapshot.version}"', "Cache-Control": "no-cache"}
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    selection = {"perPhase": perPhase, "thickness": thickness, "width": width, "poles": poles, "shape": shape}
+    try:
+        result = search_facets_service(selection, snapshot)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid selection: {e}")
+    return JSONResponse(result, headers=headers)
+
 @router.get("/getImage")
 async def get_image(path: str):
     file_path = path.lstrip("/")
@@ -105,14 +190,14 @@ async def get_image(path: str):
         raise HTTPException(status_code=404, detail="Image not found")
     return FileResponse(absolute_path, headers={"Cache-Control": "no-store, no-cache, must-revalidate", "Pragma": "no-cache", "Expires": "0"})
 
-@router.post("/uploadImages")
+@router.post("/uploadImages", dependencies=[Depends(require_admin)])
 async def upload_images(img1: UploadFile = File(None), img2: UploadFile = File(None), img3: UploadFile = File(None)):
     for img in (img1, img2, img3):
         if img:
             save_uploaded_file(img, "products")
     return {"message": "Images uploaded successfully"}
 
-@router.delete("/deleteImage")
+@router.delete("/deleteImage", dependencies=[Depends(require_admin)])
 async def delete_image(payload: ImagePath):
     ok = delete_path(payload.image_path)
     if ok:
@@ -127,7 +212,7 @@ async def get_file(path: str):
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(file_path, headers={"Cache-Control": "no-store, no-cache, must-revalidate", "Pragma": "no-cache", "Expires": "0"})
 
-@router.post("/uploadFiles")
+@router.post("/uploadFiles", dependencies=[Depends(require_admin)])
 async def upload_files(doc: UploadFile = File(None), two_d: UploadFile = File(None), three_d: UploadFile = File(None)):
     allowed_extensions = {'.pdf', '.doc', '.docx', '.stp', '.step'}
     for file, key in [(doc, 'doc'), (two_d, '2d'), (three_d, '3d')]:
@@ -142,7 +227,7 @@ async def upload_files(doc: UploadFile = File(None), two_d: UploadFile = File(No
             save_uploaded_file(file, "documents")
     return {"message": "Files uploaded successfully"}
 
-@router.delete("/deleteFile")
+@router.delete("/deleteFile", dependencies=[Depends(require_admin)])
 async def delete_file(payload: FilePath):
     ok = delete_path(payload.file_path)
     if ok:
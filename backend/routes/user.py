@@ -1,12 +1,22 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List, Dict, Any
 
 # import module to call service functions; we call attributes dynamically so missing functions surface as 501
 from models import user as user_model
 from services.auth_service import register_user, authenticate_user
+from services.password_service import PasswordHasherBusy
+from middleware.middleware import get_current_user, require_admin
+from log import get_logger
 
 router = APIRouter(prefix="/users", tags=["users"])
+logger = get_logger(__name__)
+
+def require_self_or_admin(user_id: str, user: dict = Depends(get_current_user)) -> dict:
+	"""FastAPI dependency: user đang đăng nhập chỉ được xem bản ghi của chính mình, admin thì mọi bản ghi."""
+	if user.get("role") != "admin" and user.get("sub") != user_id:
+		raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+	return user
 
 class CreateUserRequest(BaseModel):
 	email: EmailStr
@@ -83,7 +93,35 @@ class UserResponse(BaseModel):
 	direct_phone: str
 	mobile_phone: str
 
-@router.get("", response_model=List[UserResponse])
+class BulkUserFilter(BaseModel):
+	company_name: Optional[str] = None
+	role: Optional[str] = None
+	inactive: Optional[bool] = None  # True: chỉ user chưa kích hoạt, False: chỉ user đã kích hoạt
+
+class BulkUserChanges(BaseModel):
+	is_active: Optional[int] = None
+	role: Optional[str] = None
+	daily_search_limit: Optional[int] = None
+
+class BulkUserRequest(BaseModel):
+	# danh sách id HOẶC bộ lọc, không dùng cả hai
+	ids: Optional[List[str]] = None
+	filter: Optional[BulkUserFilter] = None
+	set: BulkUserChanges = BulkUserChanges()
+	reset_search_quota: bool = False
+
+class BulkUserResult(BaseModel):
+	id: str
+	status: str  # updated / unchanged / not_found
+
+class BulkUserResponse(BaseModel):
+	matched: int
+	updated: int
+	unchanged: int
+	not_found: int
+	results: List[BulkUserResult]
+
+@router.get("", response_model=List[UserResponse], dependencies=[Depends(require_admin)])
 def list_users():
 	try:
 		if not hasattr(user_model, "list_users"):
@@ -95,13 +133,13 @@ def list_users():
 	except Exception:
 		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
-@router.get("/{user_id}", response_model=UserResponse)
+@router.get("/{user_id}", response_model=UserResponse, dependencies=[Depends(require_self_or_admin)])
 def get_user(user_id: str):
 	try:
 		if not hasattr(user_model, "get_user_by_id"):
 			raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="get_user_by_id not implemented in services.user_model")
 		user = user_model.get_user_by_id(user_id)
-		print(user)
+		logger.debug("get_user %s: %s", user_id, user)
 		if not user:
 			raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 		return user
@@ -110,7 +148,7 @@ def get_user(user_id: str):
 	except Exception:
 		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
-@router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_admin)])
 def create_user(req: CreateUserRequest):
 	try:
 		# register_user now accepts a dict of all fields
@@ -118,12 +156,40 @@ def create_user(req: CreateUserRequest):
 		return user
 	except ValueError as e:
 		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+	except PasswordHasherBusy:
+		raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, please retry")
 	except HTTPException:
 		raise
 	except Exception:
 		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
-@router.put("/{user_id}", response_model=UserResponse)
+@router.post("/bulk", response_model=BulkUserResponse)
+def bulk_update_users(req: BulkUserRequest, user: dict = Depends(require_admin)):
+	"""
+	Kích hoạt / đổi role / đổi daily_search_limit / đặt lại lượt tìm kiếm cho nhiều user trong một
+	transaction. Chọn user bằng ids hoặc filter (company_name, role, inactive).
+	"""
+	filters = None
+	if req.filter is not None:
+		filters = req.filter.dict(exclude_none=True)
+		if "inactive" in filters:
+			filters["is_active"] = 0 if filters.pop("inactive") else 1
+	try:
+		result = user_model.bulk_update_users(
+			req.set.dict(exclude_none=True), ids=req.ids, filters=filters, reset_search_quota=req.reset_search_quota,
+		)
+	except ValueError as e:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+	except Exception:
+		logger.exception("Bulk user update failed")
+		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
+	logger.info("Bulk user update", extra={
+		"by": user.get("email"), "changes": req.set.dict(exclude_none=True), "reset_search_quota": req.reset_search_quota,
+		"filter": filters, "ids": len(req.ids or ()), "updated": result["updated"],
+	})
+	return result
+
+@router.put("/{user_id}", response_model=UserResponse, dependencies=[Depends(require_admin)])
 def update_user(user_id: str, req: UpdateUserRequest):
 	try:
 		if not hasattr(user_model, "update_user"):
@@ -141,7 +207,7 @@ def update_user(user_id: str, req: UpdateUserRequest):
 	except Exception:
 		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
-@router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(require_admin)])
 def delete_user(user_id: str):
 	try:
 		if not hasattr(user_model, "delete_user"):
@@ -202,7 +268,7 @@ def decrement_daily_search_limit(user_id: str):
 class ResetPasswordRequest(BaseModel):
 	password: str
 
-@router.post("/{user_id}/reset_password")
+@router.post("/{user_id}/reset_password", dependencies=[Depends(require_admin)])
 def reset_user_password(user_id: str, req: ResetPasswordRequest):
 	try:
 		if not hasattr(user_model, "reset_password"):
@@ -216,6 +282,8 @@ def reset_user_password(user_id: str, req: ResetPasswordRequest):
 			raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 		
 		return {"message": "Password reset successfully"}
+	except PasswordHasherBusy:
+		raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server busy, please retry")
 	except HTTPException:
 		raise
 	except Exception:
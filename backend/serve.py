@@ -0,0 +1,182 @@
+"""
+Production launcher: pre-fork N uvicorn workers sharing one listening socket.
+
+Chạy từ thư mục backend:
+    JWT_SECRET=<secret> python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+Process cha chạy migration, nạp catalog (và cache L nếu CALC_CACHE_BACKEND=memory)
+rồi mới fork, nên các worker dùng chung phần bộ nhớ đó theo copy-on-write
+(gc.freeze() để GC không chạm vào các object đã nạp). Mỗi worker tự mở kết nối
+SQLite/Redis sau khi fork, ghi log ra file riêng (app.w<N>.log) và chuyển sang snapshot
+catalog mới khi có version được publish (catalog.py). Worker chết bất thường được fork lại.
+
+Giới hạn của scheduler ASPExcel (ASPEXCEL_RATE, ASPEXCEL_BURST, ASPEXCEL_CONCURRENCY)
+là tổng cho cả server và được chia đều cho các worker. Metrics (/metrics) là của
+từng worker. Trên nền tảng không có fork (Windows) chỉ chạy một process.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+CALC_CACHE_WARM_ROWS = int(os.getenv("CALC_CACHE_WARM_ROWS", "200000"))
+# Worker chết sớm hơn khoảng này sau khi khởi động được coi là lỗi khởi động (chờ trước khi fork lại)
+RESPAWN_BACKOFF_SECONDS = 1.0
+
+
+def _worker_log_file(log_file: str, index: int) -> str:
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.w{index}{ext or '.log'}"
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload() -> None:
+    """Chạy trong process cha trước khi fork."""
+    from database.migrations import run_migrations
+    from catalog import catalog
+    from cache_backends import calc_cache
+    from models import job as job_model
+    from services.job_service import job_manager
+    from log import get_logger
+
+    logger = get_logger("serve")
+    applied = run_migrations()
+    if applied:
+        logger.info("Applied schema migrations: %s", applied)
+    # CATALOG_CACHE=0: chỉ xác định version đang publish, không nạp vào bộ nhớ
+    catalog.load()
+    if hasattr(calc_cache, "warm"):
+        logger.info("Calc cache warmed with %d entries", calc_cache.warm(CALC_CACHE_WARM_ROWS))
+    interrupted = job_model.fail_interrupted_jobs(job_manager.ttl)
+    if interrupted:
+        logger.info("Marked %d interrupted jobs as failed", interrupted)
+
+
+def run_worker(index: int, workers: int, sock: socket.socket, args) -> None:
+    """Chạy trong process con sau khi fork; không bao giờ trả về."""
+    import uvicorn
+    from log import setup_logging, LOG_FILE
+    from calc_data import upstream_scheduler
+    from services.job_service import job_manager
+    from main import app
+
+    setup_logging(log_file=_worker_log_file(LOG_FILE, index))
+    job_manager.recover_interrupted = False
+    upstream_scheduler.configure(
+        rate=upstream_scheduler.rate / workers,
+        burst=upstream_scheduler.burst / workers,
+        max_concurrency=upstream_scheduler.max_concurrency // workers,
+    )
+
+    config = uvicorn.Config(app, log_config=None, access_log=False, timeout_keep_alive=args.keep_alive)
+    server = uvicorn.Server(config)
+    code = 0
+    try:
+        server.run(sockets=[sock])
+    except BaseException:
+        code = 1
+        raise
+    finally:
+        os._exit(code)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="keep-alive timeout in seconds")
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+
+    from middleware.middleware import SECRET_KEY
+    if not SECRET_KEY:
+        # kiểm tra ở cha: nếu để từng worker tự dừng lúc startup thì chúng bị respawn liên tục
+        parser.error("JWT_SECRET is not set")
+
+    # mỗi worker có process pool bcrypt riêng: chia số core thay vì mỗi worker dùng hết
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    if not hasattr(os, "fork") or workers == 1:
+        import uvicorn
+        uvicorn.run("main:app", host=args.host, port=args.port, timeout_keep_alive=args.keep_alive)
+        return
+
+    # import trước khi fork để code và dữ liệu đã nạp được chia sẻ copy-on-write
+    import main as _main  # noqa: F401
+    from log import get_logger, shutdown_logging, setup_logging
+
+    logger = get_logger("serve")
+    preload()
+    sock = _bind(args.host, args.port, args.backlog)
+    # thread ghi log không tồn tại qua fork: dừng ở cha, mỗi worker tự khởi động lại
+    shutdown_logging()
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+    started_at: Dict[int, float] = {}
+    stopping = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            run_worker(index, workers, sock, args)
+        children[pid] = index
+        started_at[index] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(workers):
+        spawn(index)
+    setup_logging()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    logger.info("Serving on %s:%d with %d workers (pids %s)", args.host, args.port, workers, sorted(children))
+    print(f"Serving on http://{args.host}:{args.port} with {workers} workers", flush=True)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning("Worker %d (pid %d) exited with status %d, restarting", index, pid, status)
+        if time.monotonic() - started_at[index] < RESPAWN_BACKOFF_SECONDS:
+            time.sleep(RESPAWN_BACKOFF_SECONDS)
+        spawn(index)
+    sock.close()
+    shutdown_logging()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 from typing import Optional, Dict, Any
-from passlib.hash import bcrypt
-from models.user import init_user_table, get_user_by_email, create_user, get_user_by_id, db, get_user_by_registration_number
+from models.user import get_user_by_email, create_user, get_user_by_id, db, get_user_by_registration_number, update_password_hash
+from services.password_service import hash_password, verify_password, needs_rehash
+from log import get_logger
+from middleware.middleware import create_access_token, create_refresh_token, decode_jwt, ACCESS_TOKEN_TTL
+
+logger = get_logger(__name__)
 
 def register_user(user_data: Dict[str, Any]) -> Dict[str, Any]:
 	"""
 	Tạo user mới. user_data chứa email, password, registration_number và các trường profile bắt buộc.
 	Ném ValueError nếu email hoặc registration_number tồn tại.
 	"""
-	print(user_data)
-	init_user_table()
 
 	# Validate registration_number uniqueness
 	registration_number = user_data.get("registration_number")
@@ -29,7 +31,7 @@ def register_user(user_data: Dict[str, Any]) -> Dict[str, Any]:
 	if not password:
 		raise ValueError("Password is required")
 
-	pw_hash = bcrypt.hash(password)
+	pw_hash = hash_password(password)
 	
 	# Chuẩn bị dữ liệu cho create_user
 	create_kwargs = user_data.copy()
@@ -42,18 +44,55 @@ def register_user(user_data: Dict[str, Any]) -> Dict[str, Any]:
 
 def authenticate_user(registration_number: str, password: str) -> Optional[Dict[str, Any]]:
 	"""Xác thực user bằng Mã số thuế, trả về user dict (không kèm password_hash) nếu hợp lệ, ngược lại None."""
-	init_user_table()
 	# Sử dụng get_user_by_registration_number thay vì email
 	row = get_user_by_registration_number(registration_number)
 	
 	if not row:
 		return None
 		
-	if not bcrypt.verify(password, row.get("password_hash", "")):
+	pw_hash = row.get("password_hash", "")
+	if not verify_password(password, pw_hash):
 		return None
+
+	# Hash tạo với work factor cũ -> băm lại ngay khi có mật khẩu gốc
+	if needs_rehash(pw_hash):
+		try:
+			update_password_hash(row["id"], hash_password(password))
+		except Exception as exc:
+			logger.warning("rehash failed for user %s: %s", row["id"], exc)
 	
 	# Cho phép đăng nhập kể cả khi tài khoản không active
 	# Frontend sẽ hiển thị popup yêu cầu liên hệ khi user thực hiện tra cứu
 
 	row.pop("password_hash", None)
 	return row
+
+def _token_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+	return {
+		"sub": user["id"],
+		"email": user.get("email"),
+		"role": user.get("role"),
+		"registration_number": user.get("registration_number"),
+		"is_active": user.get("is_active"),
+	}
+
+def issue_tokens(user: Dict[str, Any]) -> Dict[str, Any]:
+	"""Tạo access token (ngắn hạn) và refresh token cho user."""
+	claims = _token_claims(user)
+	return {
+		"access_token": create_access_token(claims),
+		"refresh_token": create_refresh_token({"sub": user["id"]}),
+		"token_type": "bearer",
+		"expires_in": ACCESS_TOKEN_TTL,
+	}
+
+def refresh_tokens(refresh_token: str) -> Optional[Dict[str, Any]]:
+	"""
+	Đổi refresh token lấy cặp token mới. Đọc lại user từ DB để role/is_active luôn mới.
+	Ném AuthError nếu refresh token không hợp lệ, trả None nếu user không còn tồn tại.
+	"""
+	payload = decode_jwt(refresh_token, "refresh")
+	user = get_user_by_id(payload["sub"])
+	if not user:
+		return None
+	return issue_tokens(user)
@@ -0,0 +1,149 @@
+"""
+Asynchronous jobs for long-running busbar computations.
+
+Job được lưu trong bảng jobs (SQLite) và chạy trên một thread pool giới hạn
+JOB_WORKERS. Submit trùng tham số với một job đang queued/running sẽ dùng lại
+job đó; kết quả của job đã xong được giữ JOB_RESULT_TTL giây.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from calc_data import PRIORITY_BACKGROUND, send_aspExcel_max
+from models import job as job_model
+from services.query_busbar_service import query_busbar_service, icc_sweep_service, is_degraded
+from metrics import registry
+from log import get_logger
+
+logger = get_logger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ACTIVE = int(os.getenv("JOB_MAX_ACTIVE", "100"))
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# Ghi tiến độ vào DB tối đa một lần mỗi JOB_PROGRESS_INTERVAL giây
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+
+JOBS_SUBMITTED = registry.counter("jobs_submitted_total", "Job submissions by kind and outcome (created/deduplicated/rejected).", ("kind", "outcome"))
+JOBS_FINISHED = registry.counter("jobs_finished_total", "Finished jobs by kind and status.", ("kind", "status"))
+
+
+class JobQueueFull(RuntimeError):
+	"""Raised when JOB_MAX_ACTIVE jobs are already queued or running."""
+	pass
+
+
+def _run_query_busbar(params: Dict[str, Any], progress: Callable[[int, int], None]) -> Dict[str, Any]:
+	products = query_busbar_service(params, progress=progress, priority=PRIORITY_BACKGROUND)
+	return {"products": products, "degraded": is_degraded(products)}
+
+
+def _run_icc_sweep(params: Dict[str, Any], progress: Callable[[int, int], None]) -> Dict[str, Any]:
+	return icc_sweep_service(params, progress=progress, priority=PRIORITY_BACKGROUND)
+
+
+def _run_force_limit(params: Dict[str, Any], progress: Callable[[int, int], None]) -> Dict[str, Any]:
+	force = send_aspExcel_max(
+		params["a"], params["W"], params["T"], params["B"], params["Angle"], params["Icc"], params["Force"], params["poles"],
+		priority=PRIORITY_BACKGROUND, on_step=progress,
+	)
+	return {"max_force": force}
+
+
+# kind -> handler(params, progress) trả về kết quả JSON-serializable
+HANDLERS: Dict[str, Callable[[Dict[str, Any], Callable[[int, int], None]], Any]] = {
+	"query_busbar": _run_query_busbar,
+	"force_limit": _run_force_limit,
+	"icc_sweep": _run_icc_sweep,
+}
+
+
+def params_hash(kind: str, params: Dict[str, Any]) -> str:
+	canonical = json.dumps({"kind": kind, "params": params}, sort_keys=True, separators=(",", ":"))
+	return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _ProgressWriter:
+	"""Gộp các lần báo tiến độ để không ghi DB sau mỗi sản phẩm."""
+	def __init__(self, job_id: str):
+		self.job_id = job_id
+		self._last = 0.0
+
+	def __call__(self, done: int, total: int) -> None:
+		now = time.monotonic()
+		if done < total and now - self._last < JOB_PROGRESS_INTERVAL:
+			return
+		self._last = now
+		job_model.update_progress(self.job_id, done, total)
+
+
+class JobManager:
+	def __init__(self, workers: int = JOB_WORKERS, max_active: int = JOB_MAX_ACTIVE, ttl: int = JOB_RESULT_TTL):
+		self.workers = max(1, workers)
+		self.max_active = max_active
+		self.ttl = ttl
+		# serve.py tắt cờ này ở worker: job running bị ngắt chỉ được đánh dấu failed một lần, trong process cha
+		self.recover_interrupted = True
+		self._executor: Optional[ThreadPoolExecutor] = None
+		self._lock = threading.Lock()
+
+	def start(self) -> None:
+		with self._lock:
+			if self._executor is not None:
+				return
+			self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+		purged = job_model.purge_expired_jobs()
+		interrupted = job_model.fail_interrupted_jobs(self.ttl) if self.recover_interrupted else 0
+		# nhiều worker có thể cùng xếp hàng một job queued; mark_running bảo đảm chỉ một worker chạy nó
+		queued = job_model.get_queued_jobs()
+		for job in queued:
+			self._executor.submit(self._run, job["id"], job["kind"], job["params"])
+		if purged or interrupted or queued:
+			logger.info("Jobs at startup: %d requeued, %d interrupted, %d expired purged", len(queued), interrupted, purged)
+
+	def shutdown(self) -> None:
+		with self._lock:
+			executor, self._executor = self._executor, None
+		if executor is not None:
+			# job queued chưa chạy vẫn ở trạng thái queued và được chạy lại ở lần khởi động sau
+			executor.shutdown(wait=False, cancel_futures=True)
+
+	def submit(self, kind: str, params: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+		"""Returns (job, created). created=False nghĩa là dùng lại job đang chạy với cùng tham số."""
+		if kind not in HANDLERS:
+			raise ValueError(f"Unknown job kind: {kind}")
+		if self._executor is None:
+			self.start()
+		job_model.purge_expired_jobs()
+		digest = params_hash(kind, params)
+		existing = job_model.get_inflight_job(kind, digest)
+		if existing:
+			JOBS_SUBMITTED.inc(kind=kind, outcome="deduplicated")
+			return existing, False
+		if job_model.count_active_jobs() >= self.max_active:
+			JOBS_SUBMITTED.inc(kind=kind, outcome="rejected")
+			raise JobQueueFull(f"{self.max_active} jobs already queued or running")
+		job, created = job_model.create_job(kind, digest, params)
+		JOBS_SUBMITTED.inc(kind=kind, outcome="created" if created else "deduplicated")
+		if created:
+			self._executor.submit(self._run, job["id"], kind, params)
+		return job, created
+
+	def _run(self, job_id: str, kind: str, params: Dict[str, Any]) -> None:
+		if not job_model.mark_running(job_id):
+			return
+		try:
+			result = HANDLERS[kind](params, _ProgressWriter(job_id))
+		except Exception as exc:
+			logger.exception("Job %s (%s) failed", job_id, kind)
+			job_model.fail_job(job_id, str(exc) or type(exc).__name__, self.ttl)
+			JOBS_FINISHED.inc(kind=kind, status="failed")
+			return
+		job_model.finish_job(job_id, result, self.ttl)
+		JOBS_FINISHED.inc(kind=kind, status="done")
+
+
+job_manager = JobManager()
@@ -0,0 +1,134 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, Future
+from typing import Any, Callable, Optional
+from passlib.hash import bcrypt
+
+# Cấu hình: work factor và kích thước pool lấy từ biến môi trường
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", str(max(HASH_WORKERS, 1) * 8)))
+HASH_QUEUE_TIMEOUT = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT", "5"))
+
+
+class PasswordHasherBusy(RuntimeError):
+	"""Raised when the hashing queue stays full for longer than the queue timeout."""
+	pass
+
+
+def _hash_worker(password: str, rounds: int) -> str:
+	return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _verify_worker(password: str, pw_hash: str) -> bool:
+	try:
+		return bcrypt.verify(password, pw_hash)
+	except ValueError:
+		# hash rỗng hoặc sai định dạng -> coi như sai mật khẩu
+		return False
+
+
+class PasswordHasher:
+	"""
+	Runs bcrypt on a dedicated process pool so hashing does not hold the GIL
+	of the request workers. At most `queue_size` jobs may be pending; callers
+	wait up to `queue_timeout` seconds for a slot, then get PasswordHasherBusy.
+	workers=0 runs everything inline (useful for scripts and benchmarks).
+	"""
+	def __init__(
+		self,
+		rounds: int = BCRYPT_ROUNDS,
+		workers: int = HASH_WORKERS,
+		queue_size: int = HASH_QUEUE_SIZE,
+		queue_timeout: float = HASH_QUEUE_TIMEOUT,
+	):
+		self.rounds = rounds
+		self.workers = workers
+		self.queue_timeout = queue_timeout
+		self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+		self._lock = threading.Lock()
+		self._executor: Optional[ProcessPoolExecutor] = None
+
+	def start(self) -> Optional[ProcessPoolExecutor]:
+		"""Create the pool eagerly (otherwise it is created on first use) and return it."""
+		if self.workers <= 0:
+			return None
+		with self._lock:
+			if self._executor is None:
+				# spawn: không fork một process đang có nhiều thread (uvicorn threadpool)
+				self._executor = ProcessPoolExecutor(
+					max_workers=self.workers,
+					mp_context=multiprocessing.get_context("spawn"),
+				)
+			return self._executor
+
+	def _discard(self, executor: ProcessPoolExecutor) -> None:
+		"""Bỏ pool bị hỏng (process con chết) để lần gọi sau tạo pool mới."""
+		with self._lock:
+			if self._executor is executor:
+				self._executor = None
+		executor.shutdown(wait=False, cancel_futures=True)
+
+	def shutdown(self) -> None:
+		with self._lock:
+			executor, self._executor = self._executor, None
+		if executor is not None:
+			executor.shutdown(wait=True, cancel_futures=True)
+
+	def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+		if self.workers <= 0:
+			return fn(*args)
+		if not self._slots.acquire(timeout=self.queue_timeout):
+			raise PasswordHasherBusy("Password hashing queue is full")
+		# giữ tham chiếu cục bộ: shutdown() có thể đặt self._executor = None giữa hai dòng
+		executor = self.start()
+		try:
+			future: Future = executor.submit(fn, *args)
+		except BrokenExecutor as e:
+			self._slots.release()
+			self._discard(executor)
+			raise PasswordHasherBusy("Password hashing pool is broken") from e
+		except RuntimeError as e:
+			# submit sau shutdown(): server đang dừng
+			self._slots.release()
+			raise PasswordHasherBusy("Password hashing pool is shut down") from e
+		except Exception:
+			self._slots.release()
+			raise
+		future.add_done_callback(lambda _: self._slots.release())
+		try:
+			return future.result()
+		except BrokenExecutor as e:
+			self._discard(executor)
+			raise PasswordHasherBusy("Password hashing pool is broken") from e
+
+	def hash(self, password: str) -> str:
+		return self._run(_hash_worker, password, self.rounds)
+
+	def verify(self, password: str, pw_hash: Optional[str]) -> bool:
+		if not pw_hash:
+			return False
+		return self._run(_verify_worker, password, pw_hash)
+
+	def needs_rehash(self, pw_hash: str) -> bool:
+		"""True nếu hash được tạo với work factor khác với cấu hình hiện tại."""
+		try:
+			return bcrypt.using(rounds=self.rounds).needs_update(pw_hash)
+		except ValueError:
+			return False
+
+
+hasher = PasswordHasher()
+
+
+def hash_password(password: str) -> str:
+	return hasher.hash(password)
+
+
+def verify_password(password: str, pw_hash: Optional[str]) -> bool:
+	return hasher.verify(password, pw_hash)
+
+
+def needs_rehash(pw_hash: str) -> bool:
+	return hasher.needs_rehash(pw_hash)
@@ -1,66 +1,201 @@
 import os
 import shutil
-import sqlite3
 from typing import Any, Dict, List, Optional
 
 # import business functions from existing modules
-from calc_data import get_aspExcel, send_aspExcel  # adjust names if different
+from calc_data import get_aspExcel, send_aspExcel, resolve_aspExcel_many, calc_key, L_FAILED, L_FETCHED, L_UNAVAILABLE, PRIORITY_INTERACTIVE  # adjust names if different
 from sqlite import *  # reuse existing sqlite helper functions
 
-from database.database import DB_PATH
+from catalog import catalog, CATALOG_CACHE, CatalogSnapshot, ComponentRecord, ComponentInfoRecord, search_text
+from log import get_logger
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+logger = get_logger(__name__)
 
-def query_busbar_service(data: Dict[str, Any]):
-    print("Query data received:", data)
-    per_phase = int(data["perPhase"].split(" ")[0])
-    thickness = float(data["thickness"])
-    width = float(data["width"])
-    poles_mapping = {"Bi": 2, "Three": 3, "Four": 4}
-    if data["poles"] in poles_mapping:
-        poles = poles_mapping[data["poles"]]
-    else:
-        poles = int(data["poles"])
-    shape = data["shape"]
-
-    conn = get_db_connection()
-    if not conn:
-        print("Failed to connect to database.")
-        return []
-    query = """
-        SELECT * FROM components_list
+def _query_products_db(snapshot: CatalogSnapshot, per_phase, thickness, width, poles, shape):
+    """Đọc thẳng file snapshot (CATALOG_CACHE=0): cùng dạng kết quả với catalog.search."""
+    conn = snapshot.connect()
+    query = f"""
+        SELECT {ComponentRecord.columns()} FROM components_list
         WHERE nbphase = ?
           AND thickness = ?
           AND width = ?
           AND poles = ?
           AND shape = ?
     """
-    print("Executing query with:", per_phase, thickness, width, poles, shape)
-    cursor = conn.execute(query, (per_phase, thickness, width, poles, shape))
-    if not cursor:
-        print("No results from query.")
+    info_query = f"""
+        SELECT {ComponentInfoRecord.columns()} FROM components_info
+        WHERE nbphase = ? AND key = ?
+    """
+    logger.debug("Executing query with: %s %s %s %s %s", per_phase, thickness, width, poles, shape)
+    try:
+        matches = []
+        for row in conn.execute(query, (per_phase, thickness, width, poles, shape)).fetchall():
+            component = ComponentRecord.from_row(row)
+            infos = conn.execute(info_query, (component.nbphase, component.component_id)).fetchall()
+            matches.append((component, tuple(ComponentInfoRecord.from_row(info) for info in infos)))
+    finally:
         conn.close()
-        return []
-    print("Query executed successfully.")
-    products = [dict(row) for row in cursor.fetchall()]
-    print(f"Found {len(products)} products matching criteria.")
-    for product in products:
-        info_query = """
-            SELECT * FROM components_info
-            WHERE nbphase = ? AND key = ?
-        """
-        additional_info = conn.execute(info_query, (product["nbphase"], product["component_id"])).fetchall()
-        product["additionalInfo"] = [dict(info) for info in additional_info]
-        for info in product["additionalInfo"]:
-            L = get_aspExcel(int(width), int(thickness), product["nbphase"], info["angle"], int(info["a_list"].split(",")[0].strip()), data["icc"], info["resmini"] * 10, poles)
-            info["L"] = L if L else None
-
-    conn.close()
+    return matches
+
+POLES_MAPPING = {"Bi": 2, "Three": 3, "Four": 4}
+
+def parse_poles(value) -> int:
+    return POLES_MAPPING[value] if value in POLES_MAPPING else int(value)
+
+def parse_per_phase(value) -> int:
+    """"2 bars" -> 2."""
+    return int(str(value).split(" ")[0])
+
+def _find_products(data: Dict[str, Any], snapshot: Optional[CatalogSnapshot] = None):
+    """Tra catalog theo cấu hình của form; trả về (matches, width, thickness, poles)."""
+    per_phase = parse_per_phase(data["perPhase"])
+    thickness = float(data["thickness"])
+    width = float(data["width"])
+    poles = parse_poles(data["poles"])
+    shape = data["shape"]
+
+    snapshot = snapshot or catalog.current()
+    if CATALOG_CACHE:
+        matches = snapshot.search(per_phase, thickness, width, poles, shape)
+    else:
+        matches = _query_products_db(snapshot, per_phase, thickness, width, poles, shape)
+    logger.debug("Found %d products matching criteria.", len(matches))
+    return matches, width, thickness, poles
+
+def _as_int(L) -> Optional[int]:
+    try:
+        return int(L) if L else None
+    except (TypeError, ValueError):
+        return None
+
+def _spacings(info: ComponentInfoRecord, all_spacings: bool):
+    """Khoảng cách pha cần tính L: chỉ giá trị đầu tiên của a_list, hoặc tất cả."""
+    return info.spacings if all_spacings else info.spacings[:1]
+
+def query_busbar_service(data: Dict[str, Any], progress=None, priority=PRIORITY_INTERACTIVE, snapshot: Optional[CatalogSnapshot] = None):
+    """
+    L của mỗi info được tính với khoảng cách pha đầu tiên trong a_list; data["allSpacings"]: với
+    mọi khoảng cách (thêm spacings, L_by_spacing, L_status_by_spacing vào từng info).
+    Mọi khóa calc_excel của request được gộp lại, đọc cache một lần và gọi upstream song song,
+    nên số khoảng cách không làm tăng độ trễ theo cấp số cộng.
+    progress(done, total) được gọi sau mỗi lần gọi upstream; job nền truyền priority=PRIORITY_BACKGROUND.
+    snapshot: version catalog dùng cho lượt tìm kiếm (mặc định: version đang publish).
+    """
+    logger.debug("Query data received: %s", data)
+    matches, width, thickness, poles = _find_products(data, snapshot)
+    all_spacings = bool(data.get("allSpacings"))
+    icc = data["icc"]
+    plan = [
+        (component, [
+            (info, [
+                calc_key(width, thickness, component.nbphase, info.angle, a, icc, info.resmini * 10, poles)
+                for a in _spacings(info, all_spacings)
+            ])
+            for info in infos
+        ])
+        for component, infos in matches
+    ]
+    resolved = resolve_aspExcel_many(
+        (key for _, infos in plan for _, keys in infos for key in keys), priority, progress,
+    )
+    # dict của response chỉ được tạo ở đây, một lần cho mỗi dòng
+    products = []
+    for component, infos in plan:
+        product = component.to_dict()
+        product["additionalInfo"] = additional_info = []
+        for info, keys in infos:
+            results = [resolved[key] for key in keys]
+            # a_list rỗng / không hợp lệ: không có khoảng cách nào để tính
+            L, L_status = results[0] if results else (None, L_FAILED)
+            item = info.to_dict()
+            item["L"] = L if L else None
+            # "unavailable": upstream đang bị ngắt (circuit breaker mở), chỉ có giá trị đã cache
+            item["L_status"] = L_status
+            if all_spacings:
+                item["spacings"] = list(info.spacings)
+                item["L_by_spacing"] = [_as_int(L) for L, _ in results]
+                item["L_status_by_spacing"] = [status for _, status in results]
+            additional_info.append(item)
+        products.append(product)
+
     return products
 
+ICC_SWEEP_MAX_POINTS = int(os.getenv("ICC_SWEEP_MAX_POINTS", "100"))
+# số khóa chưa có trong cache mà /iccSweep (đồng bộ) được gọi upstream; nhiều hơn thì dùng /jobs/iccSweep
+ICC_SWEEP_MAX_FETCH = int(os.getenv("ICC_SWEEP_MAX_FETCH", "50"))
+
+def icc_sweep_values(data: Dict[str, Any]) -> List[int]:
+    """Danh sách Icc (icc) hoặc khoảng icc_start..icc_stop (gồm hai đầu) bước icc_step; ValueError nếu không hợp lệ."""
+    if data.get("icc"):
+        values = sorted({int(v) for v in data["icc"]})
+    elif data.get("icc_start") is not None and data.get("icc_stop") is not None:
+        start, stop, step = int(data["icc_start"]), int(data["icc_stop"]), int(data.get("icc_step") or 1)
+        if step <= 0 or stop < start:
+            raise ValueError("icc_stop must be >= icc_start and icc_step > 0")
+        if (stop - start) // step + 1 > ICC_SWEEP_MAX_POINTS:
+            raise ValueError(f"at most {ICC_SWEEP_MAX_POINTS} Icc values per sweep")
+        values = list(range(start, stop + 1, step))
+    else:
+        raise ValueError("icc or icc_start/icc_stop is required")
+    if len(values) > ICC_SWEEP_MAX_POINTS:
+        raise ValueError(f"at most {ICC_SWEEP_MAX_POINTS} Icc values per sweep")
+    if values[0] <= 0:
+        raise ValueError("Icc values must be positive")
+    return values
+
+def icc_sweep_service(data: Dict[str, Any], progress=None, priority=PRIORITY_INTERACTIVE, snapshot: Optional[CatalogSnapshot] = None, max_fetch: Optional[int] = None):
+    """
+    L của mọi sản phẩm khớp cấu hình với từng giá trị Icc: catalog chỉ được tra một lần, các khóa
+    calc_excel được đọc bằng một get_many và các khóa thiếu được gọi upstream song song.
+    Kết quả dạng ma trận: series[i]["L"][j] ứng với sản phẩm/info/khoảng cách i và icc[j]
+    (data["allSpacings"]: một series cho mỗi khoảng cách trong a_list, mặc định chỉ khoảng cách đầu tiên).
+    max_fetch: ném FetchLimitExceeded nếu có nhiều khóa chưa có trong cache hơn (không gọi upstream).
+    """
+    icc_values = icc_sweep_values(data)
+    snapshot = snapshot or catalog.current()
+    matches, width, thickness, poles = _find_products(data, snapshot)
+    all_spacings = bool(data.get("allSpacings"))
+    series = []
+    for component, infos in matches:
+        for info in infos:
+            for a in _spacings(info, all_spacings):
+                keys = [
+                    calc_key(width, thickness, component.nbphase, info.angle, a, icc, info.resmini * 10, poles)
+                    for icc in icc_values
+                ]
+                series.append(({
+                    "product_id": component.id,
+                    "key": info.key,
+                    "nbphase": info.nbphase,
+                    "angle": info.angle,
+                    "a": a,
+                    "resmini": info.resmini,
+                }, keys))
+    unique = list(dict.fromkeys(key for _, keys in series for key in keys))
+    resolved = resolve_aspExcel_many(unique, priority, progress, max_fetch)
+    rows = []
+    for meta, keys in series:
+        results = [resolved[key] for key in keys]
+        meta["L"] = [_as_int(L) for L, _ in results]
+        meta["L_status"] = [status for _, status in results]
+        rows.append(meta)
+    statuses = [status for _, status in resolved.values()]
+    return {
+        "version": snapshot.version,
+        "icc": icc_values,
+        "series": rows,
+        "degraded": L_UNAVAILABLE in statuses,
+        "lookups": {"cells": len(series) * len(icc_values), "unique": len(unique), "fetched": statuses.count(L_FETCHED)},
+    }
+
+def is_degraded(products) -> bool:
+    """True nếu có giá trị L không lấy được vì upstream đang bị ngắt."""
+    return any(
+        info.get("L_status") == L_UNAVAILABLE or L_UNAVAILABLE in info.get("L_status_by_spacing", ())
+        for product in products
+        for info in product.get("additionalInfo", [])
+    )
+
 def calc_excel_service(payload: Dict[str, Any]):
     L = get_aspExcel(
         payload["W"],
@@ -84,23 +219,23 @@ def get_components_service(component_id: Optional[str], nbphase: Optional[int]):
     return components, component_list
 
 def update_component_service(component: Dict[str, Any]):
-    result = update_component_info(
+    """
+    components_info + components_list (staging) trong một transaction; trả về {"changes": ...}
+    hoặc None nếu không tìm thấy. Tìm kiếm chỉ thấy thay đổi sau khi publish.
+    """
+    result = update_component(
         component["key"],
         component["nbphase"],
         component["angle"],
         component["resmini"],
         component["info"],
-        component["a_list"]
-    )
-    result_list = create_component_list(
-        component["nbphase"],
+        component["a_list"],
         component.get("thickness"),
         component.get("width"),
         component.get("poles"),
         component.get("shape"),
-        component["key"]
     )
-    return result and result_list
+    return result
 
 def delete_component_service(component_id: str, nbphase: int):
     result = delete_component_info(component_id, nbphase)
@@ -108,27 +243,56 @@ def delete_component_service(component_id: str, nbphase: int):
     return result and result_list
 
 def create_component_service(component: Dict[str, Any]):
-    result = create_component_info(
+    result = create_component(
         component["key"],
         component["nbphase"],
         component["angle"],
         component["resmini"],
         component["info"],
-        component["a_list"]
-    )
-    result_list = create_component_list(
-        component["nbphase"],
+        component["a_list"],
         component.get("thickness"),
         component.get("width"),
         component.get("poles"),
         component.get("shape"),
-        component["key"]
     )
-    return result and result_list
+    return result
 
 def get_components_list_service(component_id: str, nbphase: int):
     return get_component_list_by_id(component_id, nbphase)
 
+def search_facets_service(selection: Dict[str, Any], snapshot: Optional[CatalogSnapshot] = None):
+    """
+    Giá trị khả dụng của form tìm kiếm (perPhase, thickness, width, poles, shape) và số sản
+    phẩm cho một lựa chọn dở dang. Ném ValueError nếu giá trị không hợp lệ.
+    """
+    snapshot = snapshot or catalog.current()
+    def parsed(name, parse):
+        value = selection.get(name)
+        return None if value in (None, "") else parse(value)
+    facets = snapshot.facets(
+        parsed("perPhase", parse_per_phase),
+        parsed("thickness", float),
+        parsed("width", float),
+        parsed("poles", parse_poles),
+        parsed("shape", str),
+    )
+    return {"version": snapshot.version, **facets}
+
+def search_components_service(q: str, limit: int = 20, offset: int = 0, staging: bool = False):
+    """
+    Tìm component theo tiền tố của key/numart/từ trong info (FTS5), xếp hạng bm25.
+    Mặc định đọc version catalog đang publish; staging=True (admin) đọc bảng đang sửa.
+    """
+    if staging:
+        conn = connect_to_db()
+        try:
+            result = search_text(conn, q, limit, offset)
+        finally:
+            conn.close()
+        return {"query": q, "version": None, **result}
+    snapshot = catalog.current()
+    return {"query": q, "version": snapshot.version, **snapshot.search_text(q, limit, offset)}
+
 # File/image helpers
 def save_uploaded_file(upload_file, dest_folder: str):
     os.makedirs(dest_folder, exist_ok=True)
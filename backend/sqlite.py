@@ -1,12 +1,19 @@
+import math
+import os
 import sqlite3
+from log import get_logger
+from metrics import DB_LATENCY, timed
+
+logger = get_logger(__name__)
 
 # Hàm tạo kết nối đến SQLite database
-db_name = "berlivn.db"
+db_name = os.getenv("BERLIVN_DB", "berlivn.db")
 
 def connect_to_db():
     return sqlite3.connect(db_name)
 
 # Hàm thêm dữ liệu vào bảng
+@timed(DB_LATENCY, op="insert_component_info")
 def insert_component_info(key, nbphase, params):
     try:
         conn = connect_to_db()
@@ -26,14 +33,15 @@ def insert_component_info(key, nbphase, params):
         # Thực thi câu lệnh SQL
         cursor.execute(sql, [key, nbphase] + params)
         conn.commit()   
-        print(f"Thêm dữ liệu thành công cho key: {key}")
+        logger.debug("Thêm dữ liệu thành công cho key: %s", key)
     except sqlite3.IntegrityError:
-        print(f"Key '{key}' đã tồn tại trong bảng.")
+        logger.warning("Key '%s' đã tồn tại trong bảng.", key)
     except Exception as e:
-        print(f"Lỗi khi thêm dữ liệu: {e}")
+        logger.error("Lỗi khi thêm dữ liệu: %s", e)
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="insert_component_list")
 def insert_component_list(key, component_list):
     try:
         conn = connect_to_db()
@@ -59,15 +67,16 @@ def insert_component_list(key, component_list):
             cursor.execute(sql, params)
         
         conn.commit()
-        print(f"Đã thêm {len(component_list)} dòng dữ liệu cho key: {key}")
+        logger.debug("Đã thêm %d dòng dữ liệu cho key: %s", len(component_list), key)
     
     except sqlite3.IntegrityError as e:
-        print(f"Lỗi ràng buộc (IntegrityError): {e}")
+        logger.error("Lỗi ràng buộc (IntegrityError): %s", e)
     except Exception as e:
-        print(f"Lỗi khi thêm dữ liệu: {e}")
+        logger.error("Lỗi khi thêm dữ liệu: %s", e)
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="get_component_list")
 def get_component_list():
     try:
         conn = connect_to_db()
@@ -81,11 +90,12 @@ def get_component_list():
         results = cursor.fetchall()
         return results
     except Exception as e:
-        print(f"Lỗi khi truy vấn dữ liệu: {e}")
+        logger.error("Lỗi khi truy vấn dữ liệu: %s", e)
     finally:
         conn.close()
 
 # Hàm truy vấn dữ liệu theo key
+@timed(DB_LATENCY, op="query_data_component_info")
 def query_data_component_info(nbphase, refArticle):
     try:
         conn = connect_to_db()
@@ -98,16 +108,17 @@ def query_data_component_info(nbphase, refArticle):
         # Lấy kết quả
         result = cursor.fetchone()
         if result:
-            print(f"Dữ liệu cho key '{nbphase}': {result}")
+            logger.debug("Dữ liệu cho key '%s': %s", nbphase, result)
             return result
         else:
-            print(f"Không tìm thấy dữ liệu cho key: {refArticle}")
+            logger.debug("Không tìm thấy dữ liệu cho key: %s", refArticle)
             return None
     except Exception as e:
-        print(f"Lỗi khi truy vấn dữ liệu: {e}")
+        logger.error("Lỗi khi truy vấn dữ liệu: %s", e)
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="get_joined_components")
 def get_joined_components():
     try:
         conn = connect_to_db()
@@ -146,31 +157,36 @@ def get_joined_components():
         return results
 
     except Exception as e:
-        print(f"Lỗi khi JOIN dữ liệu: {e}")
+        logger.error("Lỗi khi JOIN dữ liệu: %s", e)
     finally:
         conn.close()
 
-def insert_calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase, L):
+@timed(DB_LATENCY, op="insert_calc_excel")
+def insert_calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase, L, model_version="1"):
     try:
         conn = connect_to_db()
         cursor = conn.cursor()
         
-        # Câu lệnh SQL để thêm dữ liệu
+        # UPSERT: bản ghi đã có (vd. đang stale) được ghi đè bằng giá trị mới và đánh dấu tươi lại
         sql = """
-        INSERT OR IGNORE INTO calc_excel (
-            W, T, B, Angle, a, Icc, Force, NbrePhase, L
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO calc_excel (
+            W, T, B, Angle, a, Icc, Force, NbrePhase, L, fetched_at, model_version, stale
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?, 0)
+        ON CONFLICT (W, T, B, Angle, a, Icc, Force, NbrePhase) DO UPDATE SET
+            L = excluded.L, fetched_at = excluded.fetched_at, model_version = excluded.model_version, stale = 0,
+            expires_at = NULL
         """
         
         # Thực thi câu lệnh SQL
-        cursor.execute(sql, (W, T, B, Angle, a, Icc, Force, NbrePhase, L))
+        cursor.execute(sql, (W, T, B, Angle, a, Icc, Force, NbrePhase, L, model_version))
         conn.commit()
-        print("Thêm dữ liệu thành công vào bảng calc_excel")
+        logger.debug("Thêm dữ liệu thành công vào bảng calc_excel")
     except Exception as e:
-        print(f"Lỗi khi thêm dữ liệu vào calc_excel: {e}")
+        logger.error("Lỗi khi thêm dữ liệu vào calc_excel: %s", e)
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="get_calc_excel")
 def get_calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase):
     try:
         conn = connect_to_db()
@@ -191,10 +207,111 @@ def get_calc_excel(W, T, B, Angle, a, Icc, Force, NbrePhase):
         else:
             return None
     except Exception as e:
-        print(f"Lỗi khi truy vấn dữ liệu: {e}")
+        logger.error("Lỗi khi truy vấn dữ liệu: %s", e)
     finally:
         conn.close()
 
+# Số khóa mỗi câu truy vấn batch (8 tham số/khóa, dưới giới hạn biến của SQLite)
+CALC_EXCEL_BATCH = 500
+
+@timed(DB_LATENCY, op="get_calc_excel_many")
+def get_calc_excel_many(keys, conn=None):
+    """
+    Tra nhiều khóa (W, T, B, Angle, a, Icc, Force, NbrePhase) trong một lượt.
+    Trả về dict khóa -> (L, fetched_at epoch, model_version, stale); bản ghi đã quá expires_at bị bỏ qua.
+    conn: kết nối dùng lại của caller (không bị đóng); None = mở kết nối mới.
+    """
+    found = {}
+    own = conn is None
+    conn = conn or connect_to_db()
+    try:
+        for i in range(0, len(keys), CALC_EXCEL_BATCH):
+            chunk = keys[i:i + CALC_EXCEL_BATCH]
+            values = ", ".join("(?, ?, ?, ?, ?, ?, ?, ?)" for _ in chunk)
+            sql = f"""
+            WITH k(W, T, B, Angle, a, Icc, Force, NbrePhase) AS (VALUES {values})
+            SELECT c.W, c.T, c.B, c.Angle, c.a, c.Icc, c.Force, c.NbrePhase,
+                   c.L, CAST(strftime('%s', c.fetched_at) AS INTEGER), c.model_version, c.stale
+            FROM k JOIN calc_excel c
+              ON c.W = k.W AND c.T = k.T AND c.B = k.B AND c.Angle = k.Angle AND c.a = k.a
+             AND c.Icc = k.Icc AND c.Force = k.Force AND c.NbrePhase = k.NbrePhase
+            WHERE c.expires_at IS NULL OR c.expires_at > datetime('now')
+            """
+            for row in conn.execute(sql, [v for key in chunk for v in key]):
+                found[tuple(row[:8])] = tuple(row[8:])
+        return found
+    finally:
+        if own:
+            conn.close()
+
+@timed(DB_LATENCY, op="get_recent_calc_excel")
+def get_recent_calc_excel(limit):
+    """limit bản ghi calc_excel mới nhất (theo fetched_at): list (khóa, (L, fetched_at epoch, model_version, stale))."""
+    conn = connect_to_db()
+    try:
+        rows = conn.execute(
+            """
+            SELECT W, T, B, Angle, a, Icc, Force, NbrePhase,
+                   L, CAST(strftime('%s', fetched_at) AS INTEGER), model_version, stale
+            FROM calc_excel
+            WHERE L IS NOT NULL AND (expires_at IS NULL OR expires_at > datetime('now'))
+            ORDER BY fetched_at DESC LIMIT ?
+            """,
+            (int(limit),),
+        ).fetchall()
+        return [(tuple(row[:8]), tuple(row[8:])) for row in rows]
+    finally:
+        conn.close()
+
+@timed(DB_LATENCY, op="set_calc_excel_many")
+def set_calc_excel_many(items, model_version="1", ttl=None, conn=None):
+    """UPSERT nhiều giá trị L trong một transaction. items: dict khóa -> L; ttl tính bằng giây (None = không hết hạn)."""
+    # expires_at có độ phân giải giây: làm tròn lên, không thì TTL < 1 giây hết hạn ngay lúc ghi
+    expires = f"+{math.ceil(ttl)} seconds" if ttl else None
+    own = conn is None
+    conn = conn or connect_to_db()
+    try:
+        conn.executemany(
+            """
+            INSERT INTO calc_excel (
+                W, T, B, Angle, a, Icc, Force, NbrePhase, L, fetched_at, model_version, stale, expires_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?, 0, CASE WHEN ? IS NULL THEN NULL ELSE datetime('now', ?) END)
+            ON CONFLICT (W, T, B, Angle, a, Icc, Force, NbrePhase) DO UPDATE SET
+                L = excluded.L, fetched_at = excluded.fetched_at, model_version = excluded.model_version,
+                stale = 0, expires_at = excluded.expires_at
+            """,
+            [tuple(key) + (L, model_version, expires, expires) for key, L in items.items()],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own:
+            conn.close()
+
+# Các cột được phép dùng làm bộ lọc khi đánh dấu stale
+CALC_EXCEL_KEY_COLUMNS = ("W", "T", "B", "Angle", "a", "Icc", "Force", "NbrePhase")
+
+@timed(DB_LATENCY, op="mark_calc_excel_stale")
+def mark_calc_excel_stale(filters):
+    """Đánh dấu stale mọi bản ghi khớp filters (dict cột -> giá trị). Trả về số bản ghi bị ảnh hưởng."""
+    unknown = set(filters) - set(CALC_EXCEL_KEY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Cột không hợp lệ: {sorted(unknown)}")
+    if not filters:
+        raise ValueError("Cần ít nhất một bộ lọc")
+    columns = sorted(filters)
+    where = " AND ".join(f"{col} = ?" for col in columns)
+    conn = connect_to_db()
+    try:
+        cursor = conn.execute(f"UPDATE calc_excel SET stale = 1 WHERE {where}", [filters[col] for col in columns])
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+@timed(DB_LATENCY, op="get_calc_excel_F_max")
 def get_calc_excel_F_max(W, T, B, Angle, a, Icc, NbrePhase):
     try:
         conn = connect_to_db()
@@ -216,11 +333,12 @@ def get_calc_excel_F_max(W, T, B, Angle, a, Icc, NbrePhase):
         else:
             return None  # Không tìm thấy bản ghi nào thỏa mãn
     except Exception as e:
-        print(f"Lỗi khi truy vấn dữ liệu: {e}")
+        logger.error("Lỗi khi truy vấn dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="get_calc_excel_L_max")
 def get_calc_excel_L_max(W, T, B, Angle, a, Icc, NbrePhase):
     try:
         conn = connect_to_db()
@@ -244,12 +362,13 @@ def get_calc_excel_L_max(W, T, B, Angle, a, Icc, NbrePhase):
         else:
             return None  # Không tìm thấy bản ghi nào thỏa mãn
     except Exception as e:
-        print(f"Lỗi khi truy vấn dữ liệu: {e}")
+        logger.error("Lỗi khi truy vấn dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
 # Updated get_component_info_by_id to include nbphase
+@timed(DB_LATENCY, op="get_component_info_by_id")
 def get_component_info_by_id(component_id: str, nbphase: int = None):
     try:
         conn = connect_to_db()
@@ -275,12 +394,13 @@ def get_component_info_by_id(component_id: str, nbphase: int = None):
             return dict(zip(columns, result))
         return None
     except Exception as e:
-        print(f"Lỗi khi lấy dữ liệu: {e}")
+        logger.error("Lỗi khi lấy dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
 # Updated function for updating component info (excluding key)
+@timed(DB_LATENCY, op="update_component_info")
 def update_component_info(key: str, nbphase: int, angle: int, resmini: float, info: str, a_list: str):
     try:
         conn = connect_to_db()
@@ -300,11 +420,12 @@ def update_component_info(key: str, nbphase: int, angle: int, resmini: float, in
             return {"message": "Component updated successfully"}
         return None
     except Exception as e:
-        print(f"Lỗi khi cập nhật dữ liệu: {e}")
+        logger.error("Lỗi khi cập nhật dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="delete_component_info")
 def delete_component_info(key: str, nbphase: int):
     try:
         conn = connect_to_db()
@@ -323,11 +444,12 @@ def delete_component_info(key: str, nbphase: int):
             return {"message": "Component deleted successfully"}
         return None
     except Exception as e:
-        print(f"Lỗi khi xóa dữ liệu: {e}")
+        logger.error("Lỗi khi xóa dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="delete_component_list")
 def delete_component_list(component_id: str, nbphase: int):
     try:
         conn = connect_to_db()
@@ -346,11 +468,12 @@ def delete_component_list(component_id: str, nbphase: int):
             return {"message": "Component list deleted successfully"}
         return None
     except Exception as e:
-        print(f"Lỗi khi xóa dữ liệu: {e}")
+        logger.error("Lỗi khi xóa dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="create_component_info")
 def create_component_info(key: str, nbphase: int, angle: int, resmini: int, info: str, a_list: str):
     try:
         conn = connect_to_db()
@@ -371,14 +494,15 @@ def create_component_info(key: str, nbphase: int, angle: int, resmini: int, info
         
         return {"message": "Component created successfully"}
     except sqlite3.IntegrityError:
-        print(f"Key '{key}' already exists in the table.")
+        logger.warning("Key '%s' already exists in the table.", key)
         return None
     except Exception as e:
-        print(f"Lỗi khi tạo dữ liệu: {e}")
+        logger.error("Lỗi khi tạo dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
+@timed(DB_LATENCY, op="get_component_list_by_id")
 def get_component_list_by_id(component_id: str, nbphase: int):
     try:
         conn = connect_to_db()
@@ -412,48 +536,125 @@ def get_component_list_by_id(component_id: str, nbphase: int):
             "shape": sorted(shapes)
         }
     except Exception as e:
-        print(f"Lỗi khi truy vấn dữ liệu: {e}")
+        logger.error("Lỗi khi truy vấn dữ liệu: %s", e)
         return None
     finally:
         conn.close()
 
+def _sync_component_list(conn, nbphase, thickness, width, poles, shape, component_id):
+    """
+    Đưa components_list của (component_id, nbphase) về đúng tổ hợp thickness × width × poles × shape:
+    chỉ xóa các dòng thừa/trùng và thêm các tổ hợp còn thiếu (executemany), dòng không đổi giữ nguyên id.
+    Không commit. Trả về {"added", "removed", "unchanged"}.
+    """
+    # chuẩn hóa theo kiểu cột (REAL, REAL, INTEGER, TEXT) để so sánh được với dữ liệu đã lưu
+    wanted = dict.fromkeys(
+        (float(t), float(w), int(p), str(s))
+        for t in thickness or ()
+        for w in width or ()
+        for p in poles or ()
+        for s in shape or ()
+    )
+    existing = conn.execute(
+        "SELECT id, thickness, width, poles, shape FROM components_list WHERE component_id = ? AND nbphase = ?",
+        (component_id, nbphase),
+    ).fetchall()
+    kept = set()
+    removed = []
+    for row_id, *combo in existing:
+        combo = tuple(combo)
+        if combo in wanted and combo not in kept:
+            kept.add(combo)
+        else:
+            removed.append((row_id,))
+    added = [(*combo, component_id, nbphase) for combo in wanted if combo not in kept]
+    if removed:
+        conn.executemany("DELETE FROM components_list WHERE id = ?", removed)
+    if added:
+        conn.executemany(
+            """
+            INSERT INTO components_list (thickness, width, poles, shape, component_id, nbphase)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            added,
+        )
+    return {"added": len(added), "removed": len(removed), "unchanged": len(kept)}
+
+@timed(DB_LATENCY, op="create_component_list")
 def create_component_list(nbphase: int, thickness: list, width: list, poles: list, shape: list, component_id: str):
+    """Đồng bộ components_list của component theo tổ hợp mới. Trả về thay đổi (xem _sync_component_list) hoặc None nếu lỗi."""
+    conn = connect_to_db()
     try:
-        conn = connect_to_db()
-        cursor = conn.cursor()
-        
-        # Bước 1: Xóa các bản ghi cũ với component_id và nbphase
-        sql_delete = """
-        DELETE FROM components_list
-        WHERE component_id = ? AND nbphase = ?
-        """
-        cursor.execute(sql_delete, (component_id, nbphase))
-        
-        # Bước 2: Tạo tổ hợp từ các danh sách thickness, width, poles, shape
-        combinations = [
-            (t, w, p, s)
-            for t in thickness
-            for w in width
-            for p in poles
-            for s in shape
-        ]
-        
-        # Bước 3: Thêm các tổ hợp mới vào database
-        sql_insert = """
-        INSERT INTO components_list (thickness, width, poles, shape, component_id, nbphase)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """
-        for combo in combinations:
-            cursor.execute(sql_insert, (*combo, component_id, nbphase))
-        
-        # Commit thay đổi
+        changes = _sync_component_list(conn, nbphase, thickness, width, poles, shape, component_id)
         conn.commit()
-        
-        # Trả về số lượng bản ghi đã thêm
-        return len(combinations)
-    
+        return changes
+    except Exception as e:
+        conn.rollback()
+        logger.error("Lỗi khi xử lý dữ liệu: %s", e)
+        return None
+    finally:
+        conn.close()
+
+@timed(DB_LATENCY, op="update_component")
+def update_component(key: str, nbphase: int, angle: int, resmini: float, info: str, a_list: str,
+                     thickness=None, width=None, poles=None, shape=None):
+    """
+    Cập nhật components_info và components_list của component trong cùng một transaction.
+    Nếu thiếu một trong các danh sách thickness/width/poles/shape thì components_list giữ nguyên.
+    Trả về {"changes": thay đổi của components_list hoặc None}; None nếu không tìm thấy component hoặc lỗi.
+    """
+    conn = connect_to_db()
+    try:
+        cursor = conn.execute(
+            """
+            UPDATE components_info
+            SET angle = ?, resmini = ?, info = ?, a_list = ?
+            WHERE key = ? AND nbphase = ?
+            """,
+            (angle, resmini, info, a_list, key, nbphase),
+        )
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return None
+        changes = None
+        if None not in (thickness, width, poles, shape):
+            changes = _sync_component_list(conn, nbphase, thickness, width, poles, shape, key)
+        conn.commit()
+        return {"changes": changes}
+    except Exception as e:
+        conn.rollback()
+        logger.error("Lỗi khi cập nhật dữ liệu: %s", e)
+        return None
+    finally:
+        conn.close()
+
+@timed(DB_LATENCY, op="create_component")
+def create_component(key: str, nbphase: int, angle: int, resmini: int, info: str, a_list: str,
+                     thickness=None, width=None, poles=None, shape=None):
+    """Như create_component_info + create_component_list nhưng trong một transaction. None nếu key đã tồn tại hoặc lỗi."""
+    Amini = 60  # Giá trị mặc định
+    if a_list:
+        first_value = a_list.split(",")[0].strip()
+        Amini = int(first_value) if first_value.isdigit() else 60
+    conn = connect_to_db()
+    try:
+        conn.execute(
+            """
+            INSERT INTO components_info (key, Amini, nbphase, angle, resmini, info, a_list)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (key, Amini, nbphase, angle, resmini, info, a_list),
+        )
+        changes = _sync_component_list(conn, nbphase, thickness, width, poles, shape, key)
+        conn.commit()
+        return {"changes": changes}
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        logger.warning("Key '%s' already exists in the table.", key)
+        return None
     except Exception as e:
-        print(f"Lỗi khi xử lý dữ liệu: {e}")
+        conn.rollback()
+        logger.error("Lỗi khi tạo dữ liệu: %s", e)
         return None
     finally:
         conn.close()
@@ -0,0 +1,22 @@
+"""
+Chạy từ thư mục backend: python -m pytest tests
+
+DB và log của test nằm trong một thư mục tạm; BERLIVN_DB/LOG_FILE phải được đặt
+trước khi import sqlite.py, database.database và log (chúng đọc biến môi trường lúc import).
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+_TMP = tempfile.mkdtemp(prefix="berlivn-tests-")
+os.environ["BERLIVN_DB"] = os.path.join(_TMP, "test.db")
+os.environ["LOG_FILE"] = os.path.join(_TMP, "app.log")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_TMP, ignore_errors=True)
@@ -0,0 +1,115 @@
+"""get_many/set_many, TTL và mark_stale chung cho ba backend của cache calc_excel."""
+import time
+
+import pytest
+
+import sqlite as sqlite_helpers
+from cache_backends import MemoryCacheBackend, RedisCacheBackend, RedisClient, SQLiteCacheBackend
+from database.migrations import run_migrations
+from redis_stub import start_in_thread
+
+MODEL = "test-v1"
+K1 = (40, 5, 3, 0, 100, 50, 300, 3)
+K2 = (40, 5, 3, 0, 100, 65, 300, 3)
+K3 = (50, 10, 4, 90, 120, 50, 300, 4)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request):
+    if request.param == "memory":
+        yield MemoryCacheBackend(max_size=100)
+    elif request.param == "sqlite":
+        run_migrations()
+        conn = sqlite_helpers.connect_to_db()
+        conn.execute("DELETE FROM calc_excel;")
+        conn.commit()
+        conn.close()
+        yield SQLiteCacheBackend()
+    else:
+        server = start_in_thread()
+        client = RedisClient(f"redis://127.0.0.1:{server.port}/0", timeout=2)
+        yield RedisCacheBackend(client, prefix="test:calc:")
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def expire(backend, ttl):
+    """Đợi các khóa có TTL `ttl` hết hạn. SQLite lưu expires_at theo giây: lùi cột đó về quá khứ thay vì ngủ."""
+    if isinstance(backend, SQLiteCacheBackend):
+        conn = sqlite_helpers.connect_to_db()
+        conn.execute("UPDATE calc_excel SET expires_at = datetime('now', '-1 seconds') WHERE expires_at IS NOT NULL;")
+        conn.commit()
+        conn.close()
+    else:
+        time.sleep(ttl * 2)
+
+
+def test_set_many_then_get_many(backend):
+    before = time.time()
+    backend.set_many({K1: "120", K2: "130"}, MODEL)
+    found = backend.get_many([K1, K2, K3])
+    assert set(found) == {K1, K2}
+    assert found[K1].L == "120" and found[K2].L == "130"
+    assert found[K1].model_version == MODEL
+    assert found[K1].stale is False
+    # SQLite lưu fetched_at theo giây
+    assert before - 1 <= found[K1].fetched_at <= time.time() + 1
+
+
+def test_get_many_empty_and_missing(backend):
+    assert backend.get_many([]) == {}
+    assert backend.get_many([K3]) == {}
+    assert backend.get(K3) is None
+
+
+def test_set_overwrites_value_and_model_version(backend):
+    backend.set(K1, "120", MODEL)
+    backend.set(K1, "125", "test-v2")
+    entry = backend.get(K1)
+    assert entry.L == "125"
+    assert entry.model_version == "test-v2"
+
+
+def test_ttl_expiry(backend):
+    ttl = 0.2
+    backend.set_many({K1: "120"}, MODEL, ttl=ttl)
+    backend.set_many({K2: "130"}, MODEL)
+    assert set(backend.get_many([K1, K2])) == {K1, K2}
+    expire(backend, ttl)
+    assert set(backend.get_many([K1, K2])) == {K2}
+
+
+def test_mark_stale_matches_filters(backend):
+    backend.set_many({K1: "120", K2: "130", K3: "140"}, MODEL)
+    assert backend.mark_stale({"W": 40, "Icc": 65}) == 1
+    found = backend.get_many([K1, K2, K3])
+    assert [found[k].stale for k in (K1, K2, K3)] == [False, True, False]
+    assert backend.mark_stale({"W": 40}) == 2
+    assert backend.get(K1).stale is True
+    assert backend.get(K3).stale is False
+    assert backend.mark_stale({"W": 999}) == 0
+
+
+def test_mark_stale_rejects_bad_filters(backend):
+    with pytest.raises(ValueError):
+        backend.mark_stale({})
+    with pytest.raises(ValueError):
+        backend.mark_stale({"L": 1})
+
+
+def test_set_clears_stale(backend):
+    backend.set(K1, "120", MODEL)
+    backend.mark_stale({"Icc": 50})
+    assert backend.get(K1).stale is True
+    backend.set(K1, "121", MODEL)
+    assert backend.get(K1).stale is False
+
+
+def test_mark_stale_keeps_ttl(backend):
+    ttl = 0.2
+    backend.set_many({K1: "120"}, MODEL, ttl=ttl)
+    assert backend.mark_stale({"Icc": 50}) == 1
+    assert backend.get(K1).stale is True
+    expire(backend, ttl)
+    assert backend.get(K1) is None